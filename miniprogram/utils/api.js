@@ -209,6 +209,18 @@ console.log('==================================')
 // 方式3: 使用环境变量（如果配置了）
 // const API_BASE_URL = process.env.API_BASE_URL || 'https://www.6ht6.com/api'
 
+// 最近一次写请求的时间，读请求通过 X-Since-Last-Write 头告诉服务端，
+// 服务端据此在刚写入后从主库读取（从库有复制延迟）
+let lastWriteAt = 0
+
+function markWrite() {
+  lastWriteAt = Date.now()
+}
+
+function readHeader() {
+  return lastWriteAt ? { 'X-Since-Last-Write': String(Date.now() - lastWriteAt) } : {}
+}
+
 /**
  * 获取用户 openid
  * 需要通过 wx.login 获取 code，然后调用服务端接口换取 openid
@@ -317,6 +329,7 @@ function createReminder(reminderData) {
     try {
       const openid = await getUserOpenid()
       
+      markWrite()
       wx.request({
         url: `${API_BASE_URL}/reminder`,
         method: 'POST',
@@ -364,9 +377,9 @@ function getReminders() {
       wx.request({
         url: url,
         method: 'GET',
-        header: {
+        header: Object.assign({
           'Content-Type': 'application/json'
-        },
+        }, readHeader()),
         success: (res) => {
           console.log('获取提醒列表响应:', {
             statusCode: res.statusCode,
@@ -428,6 +441,7 @@ function getReminders() {
  */
 function deleteReminder(reminderId) {
   return new Promise((resolve, reject) => {
+    markWrite()
     wx.request({
       url: `${API_BASE_URL}/reminder/${reminderId}`,
       method: 'DELETE',
@@ -451,6 +465,7 @@ function getReminder(reminderId) {
     wx.request({
       url: `${API_BASE_URL}/reminder/${reminderId}`,
       method: 'GET',
+      header: readHeader(),
       success: (res) => {
         if (res.data.errcode === 0) {
           resolve(res.data.data)
@@ -468,6 +483,7 @@ function getReminder(reminderId) {
  */
 function updateReminder(reminderId, reminderData) {
   return new Promise((resolve, reject) => {
+    markWrite()
     wx.request({
       url: `${API_BASE_URL}/reminder/${reminderId}`,
       method: 'PUT',
@@ -498,6 +514,7 @@ function updateReminder(reminderId, reminderData) {
  */
 function updateReminderComplete(reminderId, completed) {
   return new Promise((resolve, reject) => {
+    markWrite()
     wx.request({
       url: `${API_BASE_URL}/reminder/${reminderId}/complete`,
       method: 'PUT',
@@ -521,6 +538,7 @@ function updateReminderComplete(reminderId, completed) {
  */
 function shareReminder(reminderId, ownerOpenid) {
   return new Promise((resolve, reject) => {
+    markWrite()
     wx.request({
       url: `${API_BASE_URL}/reminder/${reminderId}/share`,
       method: 'POST',
@@ -544,6 +562,7 @@ function shareReminder(reminderId, ownerOpenid) {
  */
 function acceptReminder(reminderId, assignedOpenid) {
   return new Promise((resolve, reject) => {
+    markWrite()
     wx.request({
       url: `${API_BASE_URL}/reminder/${reminderId}/accept`,
       method: 'POST',
@@ -587,6 +606,7 @@ function acceptReminder(reminderId, assignedOpenid) {
  */
 function rejectReminder(reminderId, assignedOpenid) {
   return new Promise((resolve, reject) => {
+    markWrite()
     wx.request({
       url: `${API_BASE_URL}/reminder/${reminderId}/reject`,
       method: 'POST',
@@ -613,6 +633,7 @@ function getAssignedReminders(openid) {
     wx.request({
       url: `${API_BASE_URL}/reminders/assigned`,
       method: 'GET',
+      header: readHeader(),
       data: {
         openid: openid
       },
@@ -628,6 +649,138 @@ function getAssignedReminders(openid) {
   })
 }
 
+/**
+ * 按提醒时间范围获取提醒（日历视图），只返回窗口内的提醒
+ * @param {number} from 开始时间（毫秒时间戳，包含）
+ * @param {number} to 结束时间（毫秒时间戳，不包含）
+ * @param {Object} options { days: 是否返回每天的提醒数量, limit: 最多返回的提醒数量，0 表示只要每天的数量 }
+ * @returns {Promise<{reminders: Array, truncated: boolean, days: Array<{date: string, count: number}>}>}
+ */
+function getRemindersInRange(from, to, options = {}) {
+  return getUserOpenid().then((openid) => {
+    return new Promise((resolve, reject) => {
+      const data = {
+        openid: openid,
+        from: from,
+        to: to,
+        // 按手机本地日期统计每天的数量
+        tzOffset: -new Date().getTimezoneOffset()
+      }
+      if (options.days) {
+        data.days = 1
+      }
+      if (options.limit !== undefined) {
+        data.limit = options.limit
+      }
+      wx.request({
+        url: `${API_BASE_URL}/reminders/range`,
+        method: 'GET',
+        header: readHeader(),
+        data: data,
+        success: (res) => {
+          if (res.data.errcode === 0) {
+            resolve(res.data.data)
+          } else {
+            reject(new Error(res.data.errmsg || '获取失败'))
+          }
+        },
+        fail: reject
+      })
+    })
+  })
+}
+
+/**
+ * 获取提醒汇总（首页统计：总数、已完成、未完成、来自分享的数量、下一条提醒），不需要下载整个列表
+ * @returns {Promise<{total: number, completed: number, pending: number, shared: number, nextReminderId: string|null, nextReminderTime: number|null}>}
+ */
+function getReminderSummary() {
+  return getUserOpenid().then((openid) => {
+    return new Promise((resolve, reject) => {
+      wx.request({
+        url: `${API_BASE_URL}/reminders/summary`,
+        method: 'GET',
+        header: readHeader(),
+        data: {
+          openid: openid
+        },
+        success: (res) => {
+          if (res.data.errcode === 0) {
+            resolve(res.data.data)
+          } else {
+            reject(new Error(res.data.errmsg || '获取失败'))
+          }
+        },
+        fail: reject
+      })
+    })
+  })
+}
+
+/**
+ * 按关键词搜索提醒（事项主题、事项描述），结果按提醒时间倒序分页返回
+ * @param {string} query 关键词，多个关键词用空格分隔（需要同时出现）
+ * @param {Object} options { limit: 每页数量, cursor: 上一页返回的 nextCursor }
+ * @returns {Promise<{reminders: Array, nextCursor: string|null}>}
+ */
+function searchReminders(query, options = {}) {
+  return getUserOpenid().then((openid) => {
+    return new Promise((resolve, reject) => {
+      const data = {
+        openid: openid,
+        q: query
+      }
+      if (options.limit !== undefined) {
+        data.limit = options.limit
+      }
+      if (options.cursor) {
+        data.cursor = options.cursor
+      }
+      wx.request({
+        url: `${API_BASE_URL}/reminders/search`,
+        method: 'GET',
+        header: readHeader(),
+        data: data,
+        success: (res) => {
+          if (res.data.errcode === 0) {
+            resolve(res.data.data)
+          } else {
+            reject(new Error(res.data.errmsg || '搜索失败'))
+          }
+        },
+        fail: reject
+      })
+    })
+  })
+}
+
+/**
+ * 上报订阅消息授权结果，服务端据此记录可发送次数
+ * @param {Object} results wx.requestSubscribeMessage 的返回值，key 为模板ID，value 为 'accept' | 'reject' | 'ban'
+ */
+function reportSubscribeResult(results) {
+  return getUserOpenid().then((openid) => {
+    return new Promise((resolve, reject) => {
+      wx.request({
+        url: `${API_BASE_URL}/subscribe/grant`,
+        method: 'POST',
+        data: {
+          openid: openid,
+          results: results
+        },
+        success: (res) => {
+          if (res.data.errcode === 0) {
+            resolve(res.data.data)
+          } else {
+            reject(new Error(res.data.errmsg || '上报失败'))
+          }
+        },
+        fail: reject
+      })
+    })
+  })
+}
+
 module.exports = {
   // IP 配置相关函数
   getLocalIP,
@@ -649,6 +802,10 @@ module.exports = {
   shareReminder,
   acceptReminder,
   rejectReminder,
-  getAssignedReminders
+  getAssignedReminders,
+  getRemindersInRange,
+  getReminderSummary,
+  searchReminders,
+  reportSubscribeResult
 }
 
@@ -13,6 +13,16 @@ function requestSubscribeMessage(tmplIds) {
       success(res) {
         console.log('订阅消息请求成功', res)
         // res 是一个对象，key 为模板ID，value 为 'accept' | 'reject' | 'ban'
+        const results = {}
+        tmplIds.forEach((tmplId) => {
+          if (res[tmplId]) {
+            results[tmplId] = res[tmplId]
+          }
+        })
+        // 上报授权结果，服务端据此判断是否还能发送（上报失败不影响订阅流程）
+        require('./api.js').reportSubscribeResult(results).catch((err) => {
+          console.error('上报订阅结果失败', err)
+        })
         resolve(res)
       },
       fail(err) {
@@ -1,9 +1,11 @@
 """
 微信小程序订阅消息服务端 - Flask 实现
 """
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, g, has_request_context
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
+from decimal import Decimal
 import requests
 import json
 import os
@@ -12,17 +14,85 @@ from dotenv import load_dotenv
 from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.triggers.date import DateTrigger
 import logging
-from sqlalchemy import create_engine, Column, Integer, String, BigInteger, Boolean, DateTime, Text
+from sqlalchemy import create_engine, Column, Integer, String, BigInteger, Boolean, DateTime, Text, Index, UniqueConstraint
+from sqlalchemy.dialects import mysql, sqlite
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, scoped_session
-from sqlalchemy import text
+from sqlalchemy.orm import sessionmaker, scoped_session, Session
+from sqlalchemy.sql import Insert, Update, Delete
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy import text, or_, and_, bindparam, case, func, event, inspect, literal, select, type_coerce
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import StaticPool
 import pymysql
 import threading
+from collections import deque, OrderedDict
+import gzip
+import csv
+import heapq
+import io
+import time
+import zlib
+import uuid
+import random
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import orjson
+except ImportError:
+    # 未安装 orjson 时回退到标准库 json（输出相同，速度较慢）
+    orjson = None
+try:
+    import brotli
+except ImportError:
+    # 未安装 brotli 时只提供 gzip 压缩
+    brotli = None
 
 # 加载环境变量
 load_dotenv()
 
+
+def _json_default(value):
+    """JSON 无法直接表示的类型：时间输出 ISO 8601 字符串（与 isoformat() 一致）"""
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    raise TypeError(f'无法序列化为 JSON: {type(value).__name__}')
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """
+    接口响应的 JSON 序列化（jsonify 使用）：安装了 orjson 时用 orjson，否则用标准库 json
+    中文不转义、不排序字段、紧凑输出；datetime 直接输出 ISO 8601 字符串，to_dict 不需要逐行 isoformat()
+    """
+    ensure_ascii = False
+    sort_keys = False
+    compact = True
+
+    def dumps(self, obj, **kwargs):
+        if orjson is not None and not kwargs:
+            return orjson.dumps(obj, default=_json_default, option=orjson.OPT_NON_STR_KEYS).decode('utf-8')
+        kwargs.setdefault('default', _json_default)
+        kwargs.setdefault('ensure_ascii', False)
+        kwargs.setdefault('separators', (',', ':'))
+        return json.dumps(obj, **kwargs)
+
+    def dumps_bytes(self, obj):
+        """序列化为 UTF-8 字节（orjson 直接产出字节，省去一次编码）"""
+        if orjson is not None:
+            return orjson.dumps(obj, default=_json_default, option=orjson.OPT_NON_STR_KEYS)
+        return json.dumps(obj, default=_json_default, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(self.dumps_bytes(obj), mimetype=self.mimetype)
+
+
 app = Flask(__name__)
+app.json = FastJSONProvider(app)
 # 配置 CORS，允许所有来源（开发环境）
 CORS(app, resources={
     r"/api/*": {
@@ -51,6 +121,13 @@ APPSECRET = os.getenv('WX_APPSECRET', 'your-appsecret')
 TEMPLATE_ID = os.getenv('WX_TEMPLATE_ID', 'is4mEq0nlt5fJRn-Pflnr-wJxoCKOz9qty857QmH7Bw')
 # 消息推送 Token（用于验证消息来源）
 WX_TOKEN = os.getenv('WX_TOKEN', 'your_custom_token_123456')
+# 微信接口地址（压测时可指向本地模拟服务 wx_stub.py）
+WX_API_BASE = os.getenv('WX_API_BASE', 'https://api.weixin.qq.com').rstrip('/')
+
+# 提醒发送模式
+# inline: 由 Web 进程内的 APScheduler 调度和发送（默认，单进程部署）
+# external: Web 进程只写数据库，由独立的 dispatcher.py 进程负责调度和发送
+DISPATCH_MODE = os.getenv('DISPATCH_MODE', 'inline')
 
 
 class TokenManager:
@@ -182,6 +259,178 @@ class TokenManager:
 # 创建全局 TokenManager 实例
 token_manager = TokenManager(APPID, APPSECRET)
 
+
+class WxCircuitOpenError(Exception):
+    """微信接口熔断中，请求未发出"""
+
+
+class CircuitBreaker:
+    """
+    微信接口熔断器
+    - 按最近 window_size 次请求统计失败率，超过阈值后熔断（open），熔断期间直接拒绝请求
+    - 熔断 open_seconds 秒后进入半开（half_open），只放行少量探测请求：成功则恢复，失败则重新熔断
+    - 超时时间根据最近请求延迟的百分位数动态计算，样本不足时使用最大超时
+    """
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+    
+    def __init__(self, name, window_size=50, min_requests=10, failure_rate=0.5, open_seconds=30,
+                 half_open_probes=1, timeout_percentile=99, timeout_multiplier=3.0,
+                 min_timeout=1.0, max_timeout=10.0):
+        self.name = name
+        self.min_requests = min_requests
+        self.failure_rate = failure_rate
+        self.open_seconds = open_seconds
+        self.half_open_probes = half_open_probes
+        self.timeout_percentile = timeout_percentile
+        self.timeout_multiplier = timeout_multiplier
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self._results = deque(maxlen=window_size)  # 最近请求是否成功
+        self._latencies = deque(maxlen=window_size)  # 最近成功请求的延迟（秒）
+        self._state = self.CLOSED
+        self._opened_at = 0.0
+        self._probes = 0
+        self._lock = threading.Lock()
+    
+    def _refresh_state(self):
+        """熔断冷却时间已过时进入半开状态（调用方需持有锁）"""
+        if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.open_seconds:
+            self._state = self.HALF_OPEN
+            self._probes = 0
+            logger.info(f'微信接口熔断器进入半开状态: {self.name}')
+    
+    def _trip(self):
+        """熔断（调用方需持有锁）"""
+        self._state = self.OPEN
+        self._opened_at = time.monotonic()
+        self._probes = 0
+        logger.warning(f'⚠️ 微信接口熔断: {self.name}, {self.open_seconds}秒后尝试恢复')
+    
+    def is_open(self):
+        """是否处于熔断状态（不占用半开探测名额）"""
+        with self._lock:
+            self._refresh_state()
+            return self._state == self.OPEN
+    
+    def retry_after(self):
+        """距离下次允许探测的秒数"""
+        with self._lock:
+            if self._state != self.OPEN:
+                return 0
+            return max(0.0, self.open_seconds - (time.monotonic() - self._opened_at))
+    
+    def allow_request(self):
+        """是否允许发出请求（半开状态下占用一个探测名额）"""
+        with self._lock:
+            self._refresh_state()
+            if self._state == self.CLOSED:
+                return True
+            if self._state == self.HALF_OPEN and self._probes < self.half_open_probes:
+                self._probes += 1
+                return True
+            return False
+    
+    def record_success(self, latency):
+        with self._lock:
+            self._latencies.append(latency)
+            if self._state == self.HALF_OPEN:
+                # 探测成功，恢复正常并清空失败记录
+                self._state = self.CLOSED
+                self._results.clear()
+                logger.info(f'✅ 微信接口熔断器已恢复: {self.name}')
+            self._results.append(True)
+    
+    def record_failure(self):
+        with self._lock:
+            if self._state == self.HALF_OPEN:
+                self._trip()
+                return
+            self._results.append(False)
+            if self._state == self.CLOSED and len(self._results) >= self.min_requests:
+                failures = self._results.count(False)
+                if failures / len(self._results) >= self.failure_rate:
+                    self._trip()
+    
+    def timeout(self):
+        """根据最近延迟的百分位数计算本次请求的超时时间（秒）"""
+        with self._lock:
+            if len(self._latencies) < self.min_requests:
+                return self.max_timeout
+            latencies = sorted(self._latencies)
+        index = min(len(latencies) - 1, int(len(latencies) * self.timeout_percentile / 100))
+        return min(self.max_timeout, max(self.min_timeout, latencies[index] * self.timeout_multiplier))
+    
+    def snapshot(self):
+        """当前状态（调试用）"""
+        timeout = self.timeout()
+        with self._lock:
+            self._refresh_state()
+            return {
+                'state': self._state,
+                'requests': len(self._results),
+                'failures': self._results.count(False),
+                'timeout': round(timeout, 3)
+            }
+
+
+def _create_wx_breaker(name):
+    return CircuitBreaker(
+        name,
+        window_size=int(os.getenv('WX_BREAKER_WINDOW', '50')),
+        min_requests=int(os.getenv('WX_BREAKER_MIN_REQUESTS', '10')),
+        failure_rate=float(os.getenv('WX_BREAKER_FAILURE_RATE', '0.5')),
+        open_seconds=float(os.getenv('WX_BREAKER_OPEN_SECONDS', '30')),
+        timeout_percentile=float(os.getenv('WX_TIMEOUT_PERCENTILE', '99')),
+        timeout_multiplier=float(os.getenv('WX_TIMEOUT_MULTIPLIER', '3')),
+        min_timeout=float(os.getenv('WX_TIMEOUT_MIN', '1')),
+        max_timeout=float(os.getenv('WX_TIMEOUT_MAX', '10'))
+    )
+
+
+# 每类微信接口一个熔断器（延迟分布不同，超时时间分别计算）
+wx_breakers = {
+    'token': _create_wx_breaker('token'),  # stable_token / token
+    'send': _create_wx_breaker('send'),  # subscribe/send
+    'login': _create_wx_breaker('login'),  # jscode2session
+}
+
+# 微信系统繁忙等服务端错误计入熔断失败，业务错误码（如 43101）不计入
+WX_SYSTEM_ERRCODES = (-1, 45009)
+
+
+def wx_request(breaker_name, method, url, **kwargs):
+    """
+    调用微信接口（经过熔断器，使用自适应超时）
+    
+    Returns:
+        dict: 微信接口返回的 JSON
+    
+    Raises:
+        WxCircuitOpenError: 熔断中，请求未发出
+        requests.exceptions.RequestException: 网络错误或超时
+    """
+    breaker = wx_breakers[breaker_name]
+    if not breaker.allow_request():
+        raise WxCircuitOpenError(f'微信接口熔断中: {breaker_name}')
+    
+    started = time.monotonic()
+    try:
+        response = requests.request(method, url, timeout=breaker.timeout(), **kwargs)
+        response.raise_for_status()
+        data = response.json()
+    except Exception:
+        breaker.record_failure()
+        raise
+    
+    if data.get('errcode') in WX_SYSTEM_ERRCODES:
+        breaker.record_failure()
+    else:
+        breaker.record_success(time.monotonic() - started)
+    return data
+
+
 # 数据库配置
 # 自动检测运行环境：如果在 Docker 容器中，使用 host.docker.internal；否则使用 localhost
 def get_db_host():
@@ -256,16 +505,175 @@ def ensure_database_exists():
         logger.warning(f'检查/创建数据库时出错: {str(e)}，将尝试直接连接数据库')
         # 如果无法创建数据库（可能是权限问题），继续尝试连接
 
-# 确保数据库存在
-ensure_database_exists()
+# 数据库连接字符串：默认由 DB_* 拼出 MySQL 连接；
+# 单机部署或本地测试可以设置 DATABASE_URL=sqlite:///reminders.db 使用内嵌 SQLite（WAL 模式），无需 MySQL 服务
+DATABASE_URL = os.getenv('DATABASE_URL') or f'mysql+pymysql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}?charset=utf8mb4'
+
+# 确保数据库存在（仅 MySQL）
+if DATABASE_URL.startswith('mysql'):
+    ensure_database_exists()
+
+# 连接池配置（Web 进程和 dispatcher 进程可分别设置）
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '5'))
+DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', '10'))
+
+
+# 只读从库（可选，逗号分隔的连接字符串），配置后读接口的查询发往从库
+DATABASE_REPLICA_URLS = [url.strip() for url in os.getenv('DATABASE_REPLICA_URLS', '').split(',') if url.strip()]
+# 用户写入后多少秒内的读请求仍发往主库（从库有复制延迟，保证用户能读到自己刚写入的数据）
+READ_AFTER_WRITE_SECONDS = float(os.getenv('READ_AFTER_WRITE_SECONDS', '5'))
+
+
+# SQLite 写锁等待时间（毫秒），并发写入时排队而不是立即报 database is locked
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', '30000'))
+
+
+def _configure_sqlite_connection(dbapi_connection, connection_record):
+    """
+    SQLite 连接初始化：WAL 模式下读不阻塞写、写不阻塞读；
+    synchronous=NORMAL 在 WAL 下只在检查点时 fsync，断电最多丢失最近的事务，不会损坏数据库
+    """
+    cursor = dbapi_connection.cursor()
+    cursor.execute('PRAGMA journal_mode=WAL')
+    cursor.execute('PRAGMA synchronous=NORMAL')
+    cursor.execute(f'PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}')
+    cursor.close()
+
+
+def create_db_engine(pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW, url=None):
+    """创建数据库引擎（url 为空时连接主库）"""
+    url = url or DATABASE_URL
+    if url.startswith('sqlite'):
+        # 连接在线程池的不同线程间复用，需要关闭 sqlite3 的同线程检查
+        connect_args = {'check_same_thread': False, 'timeout': SQLITE_BUSY_TIMEOUT_MS / 1000}
+        if url in ('sqlite://', 'sqlite:///:memory:'):
+            # 内存数据库每个连接都是独立的库，只能共用一个连接（测试用）
+            sqlite_engine = create_engine(url, connect_args=connect_args, poolclass=StaticPool, echo=False)
+        else:
+            sqlite_engine = create_engine(
+                url,
+                connect_args=connect_args,
+                pool_size=pool_size,
+                max_overflow=max_overflow,
+                echo=False
+            )
+        event.listen(sqlite_engine, 'connect', _configure_sqlite_connection)
+        return sqlite_engine
+    return create_engine(
+        url,
+        pool_pre_ping=True,
+        pool_recycle=3600,
+        pool_size=pool_size,
+        max_overflow=max_overflow,
+        echo=False
+    )
+
+
+class RoutingSession(Session):
+    """
+    读写分离会话：info['replica'] 指定了从库时，查询发往从库；
+    INSERT/UPDATE/DELETE 和 flush 始终发往主库
+    """
+    def get_bind(self, mapper=None, clause=None, **kw):
+        replica = self.info.get('replica')
+        if replica is not None and not self._flushing and not isinstance(clause, (Insert, Update, Delete)):
+            return replica
+        return super().get_bind(mapper=mapper, clause=clause, **kw)
 
-# 构建数据库连接字符串
-DATABASE_URL = f'mysql+pymysql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}?charset=utf8mb4'
 
 # 创建数据库引擎
-engine = create_engine(DATABASE_URL, pool_pre_ping=True, pool_recycle=3600, echo=False)
+engine = create_db_engine()
+replica_engines = [create_db_engine(url=url) for url in DATABASE_REPLICA_URLS]
 Base = declarative_base()
-SessionLocal = scoped_session(sessionmaker(bind=engine))
+SessionLocal = scoped_session(sessionmaker(bind=engine, class_=RoutingSession))
+
+
+def bind_engine(new_engine):
+    """切换全局数据库引擎（dispatcher 进程使用独立的引擎和连接池）"""
+    global engine
+    SessionLocal.remove()
+    SessionLocal.configure(bind=new_engine)
+    engine.dispose()
+    engine = new_engine
+
+
+def new_session():
+    """
+    创建独立的数据库会话
+    SessionLocal() 在同一线程内返回同一个会话，被已持有会话的调用链（如 send_reminder）间接调用的函数
+    必须使用独立会话，否则关闭时会把调用方的会话一起关闭
+    """
+    return SessionLocal.session_factory()
+
+
+# 最近写入过的用户 openid -> 写入时间（time.monotonic()），用于读写分离时的读己之写
+_recent_writers = {}
+_recent_writers_lock = threading.Lock()
+
+
+def mark_recent_write(openid):
+    """记录用户刚写入过数据，READ_AFTER_WRITE_SECONDS 内该用户的读请求发往主库"""
+    if not openid or not replica_engines:
+        return
+    now = time.monotonic()
+    with _recent_writers_lock:
+        _recent_writers[openid] = now
+        if len(_recent_writers) > 10000:
+            # 清理已过期的记录
+            for key in [k for k, v in _recent_writers.items() if now - v > READ_AFTER_WRITE_SECONDS]:
+                del _recent_writers[key]
+
+
+def wrote_recently(openid):
+    """用户是否在 READ_AFTER_WRITE_SECONDS 内写入过数据"""
+    if not openid:
+        return False
+    with _recent_writers_lock:
+        written_at = _recent_writers.get(openid)
+    return written_at is not None and time.monotonic() - written_at < READ_AFTER_WRITE_SECONDS
+
+
+def _client_wrote_recently():
+    """
+    小程序端通过 X-Since-Last-Write 头（距上次写请求的毫秒数）告知刚写入过数据
+    多个 worker 进程时写请求和读请求可能落在不同进程，仅靠进程内记录无法保证读己之写
+    """
+    try:
+        since_ms = float(request.headers.get('X-Since-Last-Write', ''))
+    except (RuntimeError, ValueError):
+        # 不在请求上下文中，或没有该请求头
+        return False
+    return since_ms < READ_AFTER_WRITE_SECONDS * 1000
+
+
+def read_session(openid=None):
+    """
+    创建只读查询使用的数据库会话（独立会话，用完需要 close）
+    配置了从库时随机选择一个从库；openid 对应的用户刚写入过数据时仍使用主库。
+    只用于读接口，发送、认领等需要最新数据的查询必须使用 SessionLocal()
+    
+    Args:
+        openid: 发起请求的用户（为空时不做读己之写检查）
+    """
+    db = SessionLocal.session_factory()
+    if replica_engines and not wrote_recently(openid) and not _client_wrote_recently():
+        db.info['replica'] = random.choice(replica_engines)
+    return db
+
+# 发送分桶数量（固定值，不随发送进程数量变化）
+# 发送进程的分片 = dispatch_bucket % 分片数，分片数可以任意调整而无需重算分桶
+DISPATCH_BUCKETS = 1024
+
+
+def dispatch_bucket_for(owner_openid):
+    """根据创建者 openid 计算发送分桶（同一创建者的提醒及其副本落在同一分桶）"""
+    return zlib.crc32((owner_openid or '').encode('utf-8')) % DISPATCH_BUCKETS
+
+
+def _default_dispatch_bucket(context):
+    """插入提醒时自动计算发送分桶"""
+    return dispatch_bucket_for(context.get_current_parameters().get('owner_openid'))
+
 
 # 数据库模型
 class Reminder(Base):
@@ -281,9 +689,23 @@ class Reminder(Base):
     reminder_time = Column(BigInteger, nullable=False)  # 提醒时间戳（毫秒）
     completed = Column(Boolean, default=False)  # 是否完成
     enable_subscribe = Column(Boolean, default=False)  # 是否开启订阅
-    status = Column(String(20), default='pending')  # 状态：pending, sent, cancelled
+    status = Column(String(20), default='pending')  # 状态：pending, sending, sent, failed, expired, no_subscribe
     shared = Column(Boolean, default=False)  # 是否已分享
     create_time = Column(DateTime, default=datetime.now)  # 创建时间
+    dispatch_bucket = Column(Integer, default=_default_dispatch_bucket)  # 发送分桶（用于多个发送进程分片）
+    source_reminder_id = Column(String(200))  # 被分享副本对应的原提醒ID（创建者自己的提醒为空）
+    claimed_at = Column(BigInteger)  # sending：认领时间（毫秒），认领过期后可被重新认领
+    
+    __table_args__ = (
+        # 发送进程按状态和提醒时间扫描到期提醒
+        Index('idx_status_reminder_time', 'status', 'reminder_time'),
+        # 日历按时间范围查询用户的提醒（/api/reminders/range）
+        Index('idx_openid_reminder_time', 'openid', 'reminder_time'),
+        # 调试接口按创建时间倒序分页（/api/debug/reminders）
+        Index('idx_create_time_id', 'create_time', 'id'),
+        # 每个好友对同一条原提醒只能有一份副本（原提醒的 source_reminder_id 为 NULL，不受约束）
+        UniqueConstraint('owner_openid', 'openid', 'source_reminder_id', name='uq_reminder_copy'),
+    )
     
     def to_dict(self):
         """转换为字典"""
@@ -300,7 +722,8 @@ class Reminder(Base):
             'enableSubscribe': self.enable_subscribe,
             'status': self.status,
             'shared': self.shared,
-            'createTime': self.create_time.isoformat() if self.create_time else None
+            'sourceReminderId': self.source_reminder_id,
+            'createTime': self.create_time  # 由 FastJSONProvider 序列化为 ISO 8601
         }
 
 # 提醒分配关系表
@@ -323,10 +746,106 @@ class ReminderAssignment(Base):
             'ownerOpenid': self.owner_openid,
             'assignedOpenid': self.assigned_openid,
             'status': self.status,
-            'createTime': self.create_time.isoformat() if self.create_time else None,
-            'acceptTime': self.accept_time.isoformat() if self.accept_time else None
+            'createTime': self.create_time,  # 由 FastJSONProvider 序列化为 ISO 8601
+            'acceptTime': self.accept_time
+        }
+
+# 用户提醒汇总表（首页统计，按主键读取；写提醒时在同一事务中增量更新，缺失时按提醒表重建）
+class ReminderSummary(Base):
+    __tablename__ = 'reminder_summaries'
+    
+    openid = Column(String(100), primary_key=True)  # 用户openid
+    total = Column(Integer, nullable=False, default=0)  # 拥有的提醒数量（包括被分享的副本）
+    completed = Column(Integer, nullable=False, default=0)  # 已完成数量
+    shared = Column(Integer, nullable=False, default=0)  # 来自好友分享的副本数量
+    # 下一条未完成的提醒；next_reminder_time 为 0 表示需要重新计算，为空表示没有未来的提醒
+    next_reminder_id = Column(String(200))
+    next_reminder_time = Column(BigInteger)
+    
+    def to_dict(self):
+        """转换为字典"""
+        return {
+            'total': self.total,
+            'completed': self.completed,
+            'pending': self.total - self.completed,
+            'shared': self.shared,
+            'nextReminderId': self.next_reminder_id,
+            'nextReminderTime': self.next_reminder_time
         }
 
+# 发送分片租约表（多个发送进程通过租约分配分片）
+class DispatcherShard(Base):
+    __tablename__ = 'dispatcher_shards'
+    
+    shard_id = Column(Integer, primary_key=True, autoincrement=False)  # 分片编号
+    node_id = Column(String(100))  # 当前持有租约的发送进程
+    lease_expires_at = Column(BigInteger, nullable=False, default=0)  # 租约到期时间戳（毫秒）
+
+# 发送进程心跳表
+class DispatcherNode(Base):
+    __tablename__ = 'dispatcher_nodes'
+    
+    node_id = Column(String(100), primary_key=True)  # 发送进程ID
+    heartbeat_at = Column(BigInteger, nullable=False)  # 最近心跳时间戳（毫秒）
+    started_at = Column(DateTime, default=datetime.now)  # 启动时间
+
+# 订阅消息授权额度表（一次性订阅消息每次授权只能发送一条）
+class SubscribeCredit(Base):
+    __tablename__ = 'subscribe_credits'
+    
+    openid = Column(String(100), primary_key=True)  # 用户openid
+    template_id = Column(String(100), primary_key=True)  # 订阅消息模板ID
+    credits = Column(Integer, nullable=False, default=0)  # 剩余可发送次数
+    update_time = Column(DateTime, default=datetime.now, onupdate=datetime.now)  # 更新时间
+
+# 发件箱表（待发送的通知与业务修改在同一事务中写入，由后台任务投递）
+class OutboxMessage(Base):
+    __tablename__ = 'outbox'
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    kind = Column(String(50), nullable=False)  # 消息类型：subscribe_message
+    payload = Column(Text, nullable=False)  # 消息内容（JSON）
+    status = Column(String(20), nullable=False, default='pending')  # 状态：pending, sending, failed
+    attempts = Column(Integer, nullable=False, default=0)  # 已失败次数
+    available_at = Column(BigInteger, nullable=False)  # pending：最早投递时间；sending：认领过期时间（毫秒）
+    claim_token = Column(String(64))  # 认领批次
+    last_error = Column(String(500))  # 最近一次失败原因
+    create_time = Column(DateTime, default=datetime.now)  # 创建时间
+    
+    __table_args__ = (
+        Index('idx_outbox_status_available', 'status', 'available_at'),
+    )
+
+# 微信消息推送队列表（接口只写入原始消息，由后台任务批量解析处理）
+class WxEvent(Base):
+    __tablename__ = 'wx_events'
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    content_type = Column(String(10), nullable=False)  # 消息格式：xml, json
+    body = Column(Text, nullable=False)  # 原始消息内容
+    body_hash = Column(String(40), nullable=False, unique=True)  # 消息内容 sha1（微信超时重试推送的消息内容相同，据此去重）
+    status = Column(String(20), nullable=False, default='pending')  # 状态：pending, sending（处理中）, done, failed
+    available_at = Column(BigInteger, nullable=False, default=0)  # sending：认领过期时间（毫秒）
+    claim_token = Column(String(64))  # 认领批次
+    last_error = Column(String(500))  # 处理失败原因
+    create_time = Column(DateTime, default=datetime.now)  # 接收时间
+    
+    __table_args__ = (
+        Index('idx_wx_events_status_available', 'status', 'available_at'),
+    )
+
+# 订阅消息送达结果表（来自 subscribe_msg_sent_event 推送）
+class WxMessageDelivery(Base):
+    __tablename__ = 'wx_message_deliveries'
+    
+    msg_id = Column(String(64), primary_key=True)  # 发送接口返回的 msgid
+    openid = Column(String(100), nullable=False, index=True)  # 接收者openid
+    template_id = Column(String(100))  # 模板ID
+    error_code = Column(Integer)  # 0 成功，其他为失败原因
+    error_status = Column(String(50))  # success, fail:user refuse to accept the msg 等
+    event_time = Column(BigInteger)  # 推送事件时间戳（秒）
+    create_time = Column(DateTime, default=datetime.now)  # 记录时间
+
 # 创建表（如果不存在）
 def ensure_tables_exist():
     """确保数据库表存在，如果不存在则创建，并检查字段是否完整"""
@@ -335,15 +854,8 @@ def ensure_tables_exist():
     # 先检查表是否已存在，避免重复创建
     db = SessionLocal()
     try:
-        # 检查 reminders 表是否存在
-        result = db.execute(text("""
-            SELECT COUNT(*) as cnt
-            FROM information_schema.TABLES 
-            WHERE TABLE_SCHEMA = :db_name 
-            AND TABLE_NAME = 'reminders'
-        """), {'db_name': DB_NAME})
-        row = result.fetchone()
-        table_exists = row[0] > 0 if row else False
+        # 检查 reminders 表是否存在（通过 SQLAlchemy inspector，MySQL 和 SQLite 通用）
+        table_exists = inspect(engine).has_table('reminders')
         
         if table_exists:
             logger.info('✅ reminders 表已存在，跳过创建')
@@ -404,7 +916,7 @@ def ensure_tables_exist():
         error_msg = str(verify_error)
         logger.error(f'验证表存在失败: {error_msg}')
         # 如果表真的不存在，尝试最后一次创建
-        if "doesn't exist" in error_msg or "1146" in error_msg:
+        if "doesn't exist" in error_msg or "1146" in error_msg or "no such table" in error_msg:
             logger.warning('表验证失败，尝试最后一次创建...')
             try:
                 Base.metadata.create_all(engine, checkfirst=True)
@@ -417,20 +929,25 @@ def ensure_tables_exist():
                     logger.error(f'最后创建尝试失败: {create_error}')
                     raise create_error
     
+    # 创建后续版本新增的表（已存在的表会跳过）
+    try:
+        Base.metadata.create_all(engine, checkfirst=True)
+    except Exception as e:
+        logger.warning(f'创建新增表时出错: {str(e)}')
+    
     # 检查并添加缺失的字段（用于表结构升级）
+    # 通过 SQLAlchemy inspector 读取已有的字段和索引，MySQL 和 SQLite 通用
+    is_mysql = engine.dialect.name == 'mysql'
     db = SessionLocal()
     try:
+        inspector = inspect(engine)
+        reminder_columns = {column['name'] for column in inspector.get_columns('reminders')}
+        reminder_indexes = {index['name'] for index in inspector.get_indexes('reminders')}
+        reminder_indexes |= {constraint['name'] for constraint in inspector.get_unique_constraints('reminders')}
+        
         # 检查 reminders 表是否存在 owner_openid 字段
         try:
-            result = db.execute(text("""
-                SELECT COUNT(*) as cnt
-                FROM information_schema.COLUMNS 
-                WHERE TABLE_SCHEMA = :db_name 
-                AND TABLE_NAME = 'reminders' 
-                AND COLUMN_NAME = 'owner_openid'
-            """), {'db_name': DB_NAME})
-            row = result.fetchone()
-            has_owner_openid = row[0] > 0 if row else False
+            has_owner_openid = 'owner_openid' in reminder_columns
             
             if not has_owner_openid:
                 logger.info('检测到 reminders 表缺少 owner_openid 字段，正在添加...')
@@ -446,11 +963,12 @@ def ensure_tables_exist():
                         SET owner_openid = openid 
                         WHERE owner_openid = '' OR owner_openid IS NULL
                     """))
-                    # 然后设置为 NOT NULL
-                    db.execute(text("""
-                        ALTER TABLE reminders 
-                        MODIFY COLUMN owner_openid VARCHAR(100) NOT NULL DEFAULT ''
-                    """))
+                    # 然后设置为 NOT NULL（SQLite 不支持修改字段定义，保持可为空）
+                    if is_mysql:
+                        db.execute(text("""
+                            ALTER TABLE reminders 
+                            MODIFY COLUMN owner_openid VARCHAR(100) NOT NULL DEFAULT ''
+                        """))
                     db.commit()
                     logger.info('✅ 已添加 owner_openid 字段并更新数据')
                 except Exception as e:
@@ -461,15 +979,7 @@ def ensure_tables_exist():
         
         # 检查 shared 字段
         try:
-            result = db.execute(text("""
-                SELECT COUNT(*) as cnt
-                FROM information_schema.COLUMNS 
-                WHERE TABLE_SCHEMA = :db_name 
-                AND TABLE_NAME = 'reminders' 
-                AND COLUMN_NAME = 'shared'
-            """), {'db_name': DB_NAME})
-            row = result.fetchone()
-            has_shared = row[0] > 0 if row else False
+            has_shared = 'shared' in reminder_columns
             
             if not has_shared:
                 logger.info('检测到 reminders 表缺少 shared 字段，正在添加...')
@@ -489,15 +999,7 @@ def ensure_tables_exist():
         # 检查索引（如果字段存在）
         if has_owner_openid:
             try:
-                result = db.execute(text("""
-                    SELECT COUNT(*) as cnt
-                    FROM information_schema.STATISTICS 
-                    WHERE TABLE_SCHEMA = :db_name 
-                    AND TABLE_NAME = 'reminders' 
-                    AND INDEX_NAME = 'idx_owner_openid'
-                """), {'db_name': DB_NAME})
-                row = result.fetchone()
-                has_index = row[0] > 0 if row else False
+                has_index = 'idx_owner_openid' in reminder_indexes
                 
                 if not has_index:
                     logger.info('检测到 reminders 表缺少 idx_owner_openid 索引，正在添加...')
@@ -512,7 +1014,133 @@ def ensure_tables_exist():
                         db.rollback()
             except Exception as e:
                 logger.warning(f'检查索引时出错: {str(e)}')
-                
+        
+        # 检查 dispatch_bucket 字段
+        try:
+            has_dispatch_bucket = 'dispatch_bucket' in reminder_columns
+            
+            if not has_dispatch_bucket:
+                logger.info('检测到 reminders 表缺少 dispatch_bucket 字段，正在添加...')
+                try:
+                    db.execute(text("""
+                        ALTER TABLE reminders 
+                        ADD COLUMN dispatch_bucket INTEGER NULL
+                    """))
+                    db.commit()
+                    logger.info('✅ 已添加 dispatch_bucket 字段')
+                except Exception as e:
+                    logger.warning(f'添加 dispatch_bucket 字段失败（可能已存在）: {str(e)}')
+                    db.rollback()
+            
+            backfill_dispatch_buckets(db)
+        except Exception as e:
+            logger.warning(f'检查 dispatch_bucket 字段时出错: {str(e)}')
+            db.rollback()
+        
+        # 检查 claimed_at 字段（发送认领过期时间）
+        try:
+            if 'claimed_at' not in reminder_columns:
+                logger.info('检测到 reminders 表缺少 claimed_at 字段，正在添加...')
+                try:
+                    db.execute(text("""
+                        ALTER TABLE reminders 
+                        ADD COLUMN claimed_at BIGINT NULL
+                    """))
+                    db.commit()
+                    logger.info('✅ 已添加 claimed_at 字段')
+                except Exception as e:
+                    logger.warning(f'添加 claimed_at 字段失败（可能已存在）: {str(e)}')
+                    db.rollback()
+        except Exception as e:
+            logger.warning(f'检查 claimed_at 字段时出错: {str(e)}')
+        
+        # 检查 source_reminder_id 字段和副本唯一索引
+        try:
+            has_source_reminder_id = 'source_reminder_id' in reminder_columns
+            
+            if not has_source_reminder_id:
+                logger.info('检测到 reminders 表缺少 source_reminder_id 字段，正在添加...')
+                try:
+                    db.execute(text("""
+                        ALTER TABLE reminders 
+                        ADD COLUMN source_reminder_id VARCHAR(200) NULL
+                    """))
+                    # 已接受的副本通过分配记录找回原提醒（与之前一样按 owner_openid + reminder_time 对应）
+                    # MySQL 不允许 UPDATE 的子查询引用被更新的表，改用多表 UPDATE
+                    if is_mysql:
+                        db.execute(text("""
+                            UPDATE reminders c
+                            JOIN reminder_assignments a
+                                ON a.owner_openid = c.owner_openid AND a.assigned_openid = c.openid AND a.status = 'accepted'
+                            JOIN reminders o
+                                ON o.id = a.reminder_id AND o.reminder_time = c.reminder_time
+                            SET c.source_reminder_id = o.id
+                            WHERE c.openid <> c.owner_openid AND c.source_reminder_id IS NULL
+                        """))
+                    else:
+                        db.execute(text("""
+                            UPDATE reminders
+                            SET source_reminder_id = (
+                                SELECT o.id
+                                FROM reminder_assignments a
+                                JOIN reminders o ON o.id = a.reminder_id
+                                WHERE a.owner_openid = reminders.owner_openid
+                                AND a.assigned_openid = reminders.openid
+                                AND a.status = 'accepted'
+                                AND o.reminder_time = reminders.reminder_time
+                                LIMIT 1
+                            )
+                            WHERE openid <> owner_openid AND source_reminder_id IS NULL
+                        """))
+                    db.commit()
+                    logger.info('✅ 已添加 source_reminder_id 字段')
+                except Exception as e:
+                    logger.warning(f'添加 source_reminder_id 字段失败（可能已存在）: {str(e)}')
+                    db.rollback()
+            
+            if 'uq_reminder_copy' not in reminder_indexes:
+                logger.info('检测到 reminders 表缺少 uq_reminder_copy 唯一索引，正在添加...')
+                try:
+                    db.execute(text("""
+                        CREATE UNIQUE INDEX uq_reminder_copy ON reminders(owner_openid, openid, source_reminder_id)
+                    """))
+                    db.commit()
+                    logger.info('✅ 已添加 uq_reminder_copy 唯一索引')
+                except Exception as e:
+                    # 以前并发接受可能留下重复副本，需要人工清理后重启
+                    logger.warning(f'添加 uq_reminder_copy 唯一索引失败（可能存在重复副本）: {str(e)}')
+                    db.rollback()
+        except Exception as e:
+            logger.warning(f'检查 source_reminder_id 字段时出错: {str(e)}')
+            db.rollback()
+        
+        # 检查查询索引：到期扫描、日历范围查询、调试分页
+        try:
+            for index_name, columns in (
+                ('idx_status_reminder_time', 'status, reminder_time'),
+                ('idx_openid_reminder_time', 'openid, reminder_time'),
+                ('idx_create_time_id', 'create_time, id'),
+            ):
+                if index_name in reminder_indexes:
+                    continue
+                logger.info(f'检测到 reminders 表缺少 {index_name} 索引，正在添加...')
+                try:
+                    db.execute(text(f"CREATE INDEX {index_name} ON reminders({columns})"))
+                    db.commit()
+                    logger.info(f'✅ 已添加 {index_name} 索引')
+                except Exception as e:
+                    logger.warning(f'添加索引失败（可能已存在）: {str(e)}')
+                    db.rollback()
+        except Exception as e:
+            logger.warning(f'检查索引时出错: {str(e)}')
+
+        # 检查全文检索索引（/api/reminders/search）
+        try:
+            ensure_search_index(db, reminder_indexes)
+        except Exception as e:
+            logger.warning(f'检查全文检索索引时出错: {str(e)}')
+            db.rollback()
+
     except Exception as e:
         logger.warning(f'检查表结构时出错: {str(e)}')
     finally:
@@ -520,11 +1148,112 @@ def ensure_tables_exist():
     
     logger.info('数据库表检查/创建完成')
 
+def backfill_dispatch_buckets(db, batch_size=1000):
+    """
+    为升级前的提醒补齐 dispatch_bucket（分批处理，每批一条 UPDATE）
+    MySQL 直接在 SQL 中用 CRC32 计算（utf8mb4 下与 dispatch_bucket_for 结果相同）；
+    其他数据库按批读出 owner_openid，计算后用 executemany 一次写回
+    """
+    total = 0
+    if db.get_bind().dialect.name == 'mysql':
+        while True:
+            result = db.execute(text("""
+                UPDATE reminders
+                SET dispatch_bucket = CRC32(owner_openid) % :buckets
+                WHERE dispatch_bucket IS NULL
+                LIMIT :batch_size
+            """), {'buckets': DISPATCH_BUCKETS, 'batch_size': batch_size})
+            db.commit()
+            if not result.rowcount:
+                break
+            total += result.rowcount
+    else:
+        statement = Reminder.__table__.update().where(
+            Reminder.id == bindparam('reminder_id')
+        ).values(dispatch_bucket=bindparam('bucket'))
+        while True:
+            rows = db.query(Reminder.id, Reminder.owner_openid).filter(
+                Reminder.dispatch_bucket.is_(None)
+            ).limit(batch_size).all()
+            if not rows:
+                break
+            db.execute(statement, [
+                {'reminder_id': row.id, 'bucket': dispatch_bucket_for(row.owner_openid)} for row in rows
+            ])
+            db.commit()
+            total += len(rows)
+    if total:
+        logger.info(f'✅ 已为 {total} 个提醒补齐 dispatch_bucket')
+
+
+# 全文检索索引：MySQL 为 thing1 + thing4 上的 FULLTEXT 索引（ngram 分词，中文按连续两个字切分）；
+# SQLite 为 FTS5 外部内容表（trigram 分词），由 reminders 上的触发器在同一事务内维护
+SEARCH_INDEX_NAME = 'ft_reminder_text'
+SEARCH_FTS_TABLE = 'reminder_search'
+# 每个数据库连接池是否已创建全文检索索引（进程内只检查一次，创建索引后清空）
+_search_index_ready = {}
+SQLITE_SEARCH_TRIGGERS = (
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {SEARCH_FTS_TABLE}_ai AFTER INSERT ON reminders BEGIN
+        INSERT INTO {SEARCH_FTS_TABLE}(rowid, thing1, thing4) VALUES (new.rowid, new.thing1, new.thing4);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {SEARCH_FTS_TABLE}_ad AFTER DELETE ON reminders BEGIN
+        INSERT INTO {SEARCH_FTS_TABLE}({SEARCH_FTS_TABLE}, rowid, thing1, thing4)
+        VALUES ('delete', old.rowid, old.thing1, old.thing4);
+    END
+    """,
+    # 只有标题、描述变化时才更新索引，发送状态、完成状态的更新不受影响
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {SEARCH_FTS_TABLE}_au AFTER UPDATE OF thing1, thing4 ON reminders BEGIN
+        INSERT INTO {SEARCH_FTS_TABLE}({SEARCH_FTS_TABLE}, rowid, thing1, thing4)
+        VALUES ('delete', old.rowid, old.thing1, old.thing4);
+        INSERT INTO {SEARCH_FTS_TABLE}(rowid, thing1, thing4) VALUES (new.rowid, new.thing1, new.thing4);
+    END
+    """,
+)
+
+
+def ensure_search_index(db, reminder_indexes):
+    """创建全文检索索引（已有数据一并建立索引）；数据库不支持时搜索退化为 LIKE 扫描该用户的提醒"""
+    dialect = db.get_bind().dialect.name
+    if dialect == 'mysql':
+        if SEARCH_INDEX_NAME in reminder_indexes:
+            return
+        logger.info(f'检测到 reminders 表缺少 {SEARCH_INDEX_NAME} 全文索引，正在添加（数据量大时需要较长时间）...')
+        # 默认停用词表是英文单词，ngram 分词会丢掉包含停用词的词元（如含字母 a 的两字词元），建索引时关闭
+        db.execute(text("SET SESSION innodb_ft_enable_stopword = OFF"))
+        db.execute(text(f"ALTER TABLE reminders ADD FULLTEXT INDEX {SEARCH_INDEX_NAME} (thing1, thing4) WITH PARSER ngram"))
+        db.commit()
+        _search_index_ready.clear()
+        logger.info(f'✅ 已添加 {SEARCH_INDEX_NAME} 全文索引')
+    elif dialect == 'sqlite':
+        exists = db.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"), {'name': SEARCH_FTS_TABLE}
+        ).first()
+        if exists:
+            return
+        logger.info(f'检测到缺少全文检索表 {SEARCH_FTS_TABLE}，正在创建...')
+        # 外部内容表不重复保存文本，rowid 对应 reminders 的 rowid
+        # 注意：VACUUM 可能改变 reminders 的 rowid，执行后需要 INSERT INTO reminder_search(reminder_search) VALUES('rebuild')
+        db.execute(text(
+            f"CREATE VIRTUAL TABLE {SEARCH_FTS_TABLE} USING fts5("
+            f"thing1, thing4, content='reminders', tokenize='trigram')"
+        ))
+        for trigger in SQLITE_SEARCH_TRIGGERS:
+            db.execute(text(trigger))
+        db.execute(text(f"INSERT INTO {SEARCH_FTS_TABLE}({SEARCH_FTS_TABLE}) VALUES ('rebuild')"))
+        db.commit()
+        _search_index_ready.clear()
+        logger.info(f'✅ 已创建全文检索表 {SEARCH_FTS_TABLE}')
+
+
 # 确保表存在的辅助函数（在数据库操作失败时调用）
 def handle_table_error(error, operation_name="数据库操作"):
     """处理表不存在的错误，自动创建表"""
     error_msg = str(error)
-    if "doesn't exist" in error_msg or "1146" in error_msg or "Table" in error_msg and "doesn't exist" in error_msg:
+    if "doesn't exist" in error_msg or "1146" in error_msg or "no such table" in error_msg:
         logger.warning(f'检测到表不存在错误 ({operation_name})，尝试自动创建表')
         try:
             ensure_tables_exist()
@@ -549,11 +1278,41 @@ def init_app():
         # 确保表存在
         ensure_tables_exist()
         
+        if DISPATCH_MODE == 'external':
+            # 提醒由独立的 dispatcher 进程发送，Web 进程不启动调度器
+            logger.info('发送模式为 external，Web 进程不启动调度器')
+            return
+        
         # 初始化调度器
         if scheduler is None:
             scheduler = BackgroundScheduler()
             scheduler.start()
             logger.info('✅ 调度器启动成功')
+            
+            # 后台恢复定时任务并补发停机期间错过的提醒（不阻塞启动）
+            scheduler.add_job(run_startup_catch_up, id='startup_catch_up', replace_existing=True)
+            
+            # 定期投递发件箱中的通知
+            scheduler.add_job(
+                run_outbox_relay,
+                trigger='interval',
+                seconds=OUTBOX_POLL_SECONDS,
+                id='outbox_relay',
+                max_instances=1,
+                coalesce=True,
+                replace_existing=True
+            )
+            
+            # 定期处理微信推送消息
+            scheduler.add_job(
+                run_wx_event_worker,
+                trigger='interval',
+                seconds=WX_EVENT_POLL_SECONDS,
+                id='wx_event_worker',
+                max_instances=1,
+                coalesce=True,
+                replace_existing=True
+            )
     except Exception as e:
         logger.error(f'❌ 应用初始化失败: {str(e)}')
         logger.error(f'错误详情: {type(e).__name__}: {str(e)}')
@@ -580,7 +1339,7 @@ def get_access_token():
     
     # token 无效或不存在，重新获取
     # 使用稳定版 access_token API
-    url = 'https://api.weixin.qq.com/cgi-bin/stable_token'
+    url = f'{WX_API_BASE}/cgi-bin/stable_token'
     
     payload = {
         'grant_type': 'client_credential',
@@ -590,8 +1349,7 @@ def get_access_token():
     }
     
     try:
-        response = requests.post(url, json=payload, timeout=10)
-        data = response.json()
+        data = wx_request('token', 'POST', url, json=payload)
         
         if 'access_token' in data:
             access_token = data['access_token']
@@ -606,6 +1364,9 @@ def get_access_token():
             # 如果稳定版 API 失败，尝试使用普通 API（兼容性处理）
             logger.warning('稳定版 API 失败，尝试使用普通 API...')
             return get_access_token_fallback()
+    except WxCircuitOpenError as e:
+        logger.warning(f'获取 access_token 跳过: {str(e)}')
+        return None
     except Exception as e:
         logger.error(f'获取 access_token 异常: {str(e)}')
         # 如果稳定版 API 异常，尝试使用普通 API（兼容性处理）
@@ -618,11 +1379,10 @@ def get_access_token_fallback():
     获取微信 access_token（普通版，作为稳定版的降级方案）
     有效期 2 小时
     """
-    url = f'https://api.weixin.qq.com/cgi-bin/token?grant_type=client_credential&appid={token_manager.appid}&secret={token_manager.appsecret}'
+    url = f'{WX_API_BASE}/cgi-bin/token?grant_type=client_credential&appid={token_manager.appid}&secret={token_manager.appsecret}'
     
     try:
-        response = requests.get(url, timeout=10)
-        data = response.json()
+        data = wx_request('token', 'GET', url)
         
         if 'access_token' in data:
             access_token = data['access_token']
@@ -639,41 +1399,194 @@ def get_access_token_fallback():
         return None
 
 
-def send_subscribe_message(openid, template_id, page, data):
+# 本地错误码：微信接口熔断中，消息已放入重发队列
+WX_ERRCODE_QUEUED = -2
+# 本地错误码：用户没有剩余的订阅授权，未调用微信接口
+WX_ERRCODE_NO_CREDIT = -3
+
+# 因没有订阅授权而跳过的微信接口调用次数（进程启动以来）
+subscribe_credit_stats = {'avoided': 0}
+_subscribe_credit_stats_lock = threading.Lock()
+
+
+def _change_subscribe_credit(db, openid, template_id, values):
+    """更新授权额度，记录不存在时插入（并发插入冲突时重新更新）"""
+    updated = db.query(SubscribeCredit).filter(
+        SubscribeCredit.openid == openid,
+        SubscribeCredit.template_id == template_id
+    ).update(values, synchronize_session=False)
+    if updated:
+        return
+    credits = values['credits']
+    initial = credits if isinstance(credits, int) else 1
+    try:
+        with db.begin_nested():
+            db.add(SubscribeCredit(openid=openid, template_id=template_id, credits=initial))
+    except IntegrityError:
+        db.query(SubscribeCredit).filter(
+            SubscribeCredit.openid == openid,
+            SubscribeCredit.template_id == template_id
+        ).update(values, synchronize_session=False)
+
+
+# 订阅授权来源：client（小程序上报 wx.requestSubscribeMessage 结果）或 push（微信推送 subscribe_msg_popup_event）
+# 同一次授权两边都会收到，只能选一个来源，否则会重复计数；配置了消息推送后建议使用 push
+SUBSCRIBE_CREDIT_SOURCE = os.getenv('SUBSCRIBE_CREDIT_SOURCE', 'client')
+
+
+def grant_subscribe_credits(db, openid, results):
     """
-    发送订阅消息
+    记录用户的订阅授权结果（wx.requestSubscribeMessage 的返回值）
+    accept 增加一次发送额度；ban（永久拒绝）额度清零；reject 只是本次未授权，不影响已有额度
+    调用方负责提交事务
     
     Args:
-        openid: 用户 openid
-        template_id: 模板ID
-        page: 点击消息跳转的页面
-        data: 模板数据
-    
-    Returns:
-        dict: 发送结果
+        results: {template_id: 'accept' | 'reject' | 'ban'}
     """
-    token = get_access_token()
-    if not token:
-        return {'errcode': -1, 'errmsg': '获取 access_token 失败'}
-    
-    url = f'https://api.weixin.qq.com/cgi-bin/message/subscribe/send?access_token={token}'
-    
-    payload = {
-        'touser': openid,
-        'template_id': template_id,
-        'page': page,
-        'data': data
-    }
-    
+    for template_id, result in results.items():
+        if result == 'accept':
+            _change_subscribe_credit(db, openid, template_id, {'credits': SubscribeCredit.credits + 1})
+        elif result == 'ban':
+            _change_subscribe_credit(db, openid, template_id, {'credits': 0})
+
+
+def has_subscribe_credit(openid, template_id):
+    """
+    用户是否还有订阅授权额度
+    没有记录（授权额度功能上线前授权的老用户）时视为有额度，由微信接口判断
+    """
+    db = new_session()
     try:
-        logger.info(f'准备发送订阅消息: openid={openid}, template_id={template_id}')
-        logger.info(f'请求数据: {payload}')
-        
-        response = requests.post(url, json=payload, timeout=10)
-        result = response.json()
-        
-        # 先检查错误码，如果是43101则不记录为ERROR
-        error_code = result.get('errcode')
+        row = db.query(SubscribeCredit.credits).filter(
+            SubscribeCredit.openid == openid,
+            SubscribeCredit.template_id == template_id
+        ).first()
+        return row is None or row.credits > 0
+    finally:
+        db.close()
+
+
+def record_subscribe_result(openid, template_id, error_code):
+    """根据发送结果更新授权额度：发送成功扣减一次，43101（用户未授权）清零"""
+    if error_code not in (0, 43101):
+        return
+    db = new_session()
+    try:
+        if error_code == 0:
+            db.query(SubscribeCredit).filter(
+                SubscribeCredit.openid == openid,
+                SubscribeCredit.template_id == template_id,
+                SubscribeCredit.credits > 0
+            ).update({'credits': SubscribeCredit.credits - 1}, synchronize_session=False)
+        else:
+            _change_subscribe_credit(db, openid, template_id, {'credits': 0})
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        logger.error(f'更新订阅授权额度失败: openid={openid}, 错误: {str(e)}')
+    finally:
+        db.close()
+
+
+# 发件箱投递配置
+OUTBOX_BATCH_SIZE = int(os.getenv('OUTBOX_BATCH_SIZE', '100'))  # 每批认领的消息数量
+OUTBOX_CONCURRENCY = int(os.getenv('OUTBOX_CONCURRENCY', '4'))  # 并发投递线程数
+OUTBOX_POLL_SECONDS = float(os.getenv('OUTBOX_POLL_SECONDS', '1'))  # 轮询间隔（秒）
+OUTBOX_MAX_ATTEMPTS = int(os.getenv('OUTBOX_MAX_ATTEMPTS', '5'))  # 最多失败次数，超过后标记为 failed
+OUTBOX_LEASE_SECONDS = 60  # 认领后多久未完成视为投递进程已退出，可被重新认领
+
+
+def enqueue_outbox(db, kind, payload, delay_seconds=0):
+    """
+    写入发件箱
+    与业务修改使用同一个 db 会话，由调用方提交，保证业务修改和通知要么都生效、要么都不生效
+    """
+    now_ms = int(datetime.now().timestamp() * 1000)
+    db.add(OutboxMessage(
+        kind=kind,
+        payload=json.dumps(payload, ensure_ascii=False),
+        status='pending',
+        attempts=0,
+        available_at=now_ms + int(delay_seconds * 1000)
+    ))
+
+
+def enqueue_subscribe_message(db, openid, template_id, page, data, delay_seconds=0):
+    """将订阅消息写入发件箱（调用方提交）"""
+    enqueue_outbox(db, 'subscribe_message', {
+        'openid': openid,
+        'template_id': template_id,
+        'page': page,
+        'data': data
+    }, delay_seconds)
+
+
+def enqueue_wx_send(openid, template_id, page, data):
+    """熔断期间将消息写入发件箱，熔断恢复后由发件箱投递任务重发"""
+    retry_after = max(wx_breakers['send'].retry_after(), wx_breakers['token'].retry_after())
+    db = new_session()
+    try:
+        enqueue_subscribe_message(db, openid, template_id, page, data, delay_seconds=retry_after)
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        logger.error(f'消息写入发件箱失败: openid={openid}, 错误: {str(e)}')
+        return {'errcode': -1, 'errmsg': f'微信接口熔断中，写入发件箱失败: {str(e)}'}
+    finally:
+        db.close()
+    logger.info(f'微信接口熔断中，消息已写入发件箱: openid={openid}')
+    return {'errcode': WX_ERRCODE_QUEUED, 'errmsg': '微信接口熔断中，消息已排队等待重发'}
+
+
+def send_subscribe_message(openid, template_id, page, data, queue_if_open=True, check_credit=True):
+    """
+    发送订阅消息
+    用户没有剩余订阅授权时不调用微信接口（必然返回 43101）；
+    微信接口熔断期间不发出请求，消息放入重发队列，熔断恢复后自动重发
+    
+    Args:
+        openid: 用户 openid
+        template_id: 模板ID
+        page: 点击消息跳转的页面
+        data: 模板数据
+        queue_if_open: 熔断时是否排队（False 时直接返回失败）
+        check_credit: 是否检查订阅授权额度
+    
+    Returns:
+        dict: 发送结果，排队时 errcode 为 WX_ERRCODE_QUEUED，没有授权额度时为 WX_ERRCODE_NO_CREDIT
+    """
+    if check_credit and not has_subscribe_credit(openid, template_id):
+        with _subscribe_credit_stats_lock:
+            subscribe_credit_stats['avoided'] += 1
+        logger.info(f'ℹ️ 用户没有订阅授权额度，跳过发送: openid={openid}, template_id={template_id}')
+        return {'errcode': WX_ERRCODE_NO_CREDIT, 'errmsg': '用户没有订阅授权额度'}
+    
+    if wx_breakers['send'].is_open() or wx_breakers['token'].is_open():
+        if queue_if_open:
+            return enqueue_wx_send(openid, template_id, page, data)
+        return {'errcode': -1, 'errmsg': '微信接口熔断中'}
+    
+    token = get_access_token()
+    if not token:
+        return {'errcode': -1, 'errmsg': '获取 access_token 失败'}
+    
+    url = f'{WX_API_BASE}/cgi-bin/message/subscribe/send?access_token={token}'
+    
+    payload = {
+        'touser': openid,
+        'template_id': template_id,
+        'page': page,
+        'data': data
+    }
+    
+    try:
+        logger.info(f'准备发送订阅消息: openid={openid}, template_id={template_id}')
+        logger.info(f'请求数据: {payload}')
+        
+        result = wx_request('send', 'POST', url, json=payload)
+        
+        # 先检查错误码，如果是43101则不记录为ERROR
+        error_code = result.get('errcode')
         error_msg = result.get('errmsg', '未知错误')
         
         # 43101 是用户拒绝接受消息，这是正常的用户行为，不应该当作错误
@@ -707,214 +1620,1294 @@ def send_subscribe_message(openid, template_id, page, data):
                 if new_token and new_token != token:
                     logger.info('重新获取 access_token 成功，重试发送消息...')
                     # 使用新 token 重试
-                    retry_url = f'https://api.weixin.qq.com/cgi-bin/message/subscribe/send?access_token={new_token}'
-                    retry_response = requests.post(retry_url, json=payload, timeout=10)
-                    retry_result = retry_response.json()
+                    retry_url = f'{WX_API_BASE}/cgi-bin/message/subscribe/send?access_token={new_token}'
+                    retry_result = wx_request('send', 'POST', retry_url, json=payload)
                     
                     if retry_result.get('errcode') == 0:
                         logger.info(f'✅ 重试发送订阅消息成功: openid={openid}')
                     else:
                         logger.error(f'❌ 重试发送订阅消息仍然失败: openid={openid}, errcode={retry_result.get("errcode")}, errmsg={retry_result.get("errmsg")}')
                     
-                    return retry_result
+                    result = retry_result
         
+        record_subscribe_result(openid, template_id, result.get('errcode'))
         return result
+    except WxCircuitOpenError as e:
+        if queue_if_open:
+            return enqueue_wx_send(openid, template_id, page, data)
+        return {'errcode': -1, 'errmsg': str(e)}
     except Exception as e:
         logger.error(f'发送订阅消息异常: {str(e)}', exc_info=True)
         return {'errcode': -1, 'errmsg': str(e)}
 
 
-def schedule_reminder(reminder):
+def _deliver_subscribe_message(payload):
+    """投递发件箱中的订阅消息，返回 (是否完成, 失败原因)"""
+    result = send_subscribe_message(
+        openid=payload['openid'],
+        template_id=payload['template_id'],
+        page=payload['page'],
+        data=payload['data'],
+        queue_if_open=False
+    )
+    error_code = result.get('errcode')
+    # 用户未授权（43101）或没有授权额度时重试也不会成功，视为投递完成
+    if error_code in (0, 43101, WX_ERRCODE_NO_CREDIT):
+        return True, None
+    return False, f'{error_code}: {result.get("errmsg", "未知错误")}'
+
+
+# 发件箱消息类型 -> 投递函数
+OUTBOX_HANDLERS = {
+    'subscribe_message': _deliver_subscribe_message,
+}
+
+
+def _deliver_outbox_message(row):
+    handler = OUTBOX_HANDLERS.get(row.kind)
+    if handler is None:
+        return False, f'未知的消息类型: {row.kind}'
+    try:
+        return handler(json.loads(row.payload))
+    except Exception as e:
+        logger.error(f'投递发件箱消息异常: id={row.id}, 错误: {str(e)}', exc_info=True)
+        return False, str(e)
+
+
+def claim_batch(db, model, batch_size, lease_seconds):
+    """
+    认领一批待处理的记录（发件箱、微信推送队列共用）
+    可认领：pending 且已到处理时间，或 sending 但认领已过期（处理进程已退出）
+    同一批记录用一次条件更新认领，多个进程同时运行也不会重复认领
+    
+    Returns:
+        (claim_token, list): 认领批次和认领到的记录
+    """
+    now_ms = int(datetime.now().timestamp() * 1000)
+    claimable = or_(
+        and_(model.status == 'pending', model.available_at <= now_ms),
+        and_(model.status == 'sending', model.available_at < now_ms)
+    )
+    ids = [row.id for row in db.query(model.id).filter(claimable).order_by(model.id).limit(batch_size).all()]
+    if not ids:
+        return None, []
+    
+    claim_token = uuid.uuid4().hex
+    db.query(model).filter(model.id.in_(ids), claimable).update({
+        'status': 'sending',
+        'claim_token': claim_token,
+        'available_at': now_ms + lease_seconds * 1000
+    }, synchronize_session=False)
+    db.commit()
+    rows = db.query(model).filter(model.claim_token == claim_token).order_by(model.id).all()
+    return claim_token, rows
+
+
+def relay_outbox(batch_size=None, executor=None):
+    """
+    投递一批发件箱消息
+    投递成功的消息直接删除；失败的按指数退避重新排队，超过最大次数后标记为 failed；
+    投递过程中熔断的消息在熔断恢复后重试，不计入失败次数
+    
+    Args:
+        batch_size: 每批认领数量（默认 OUTBOX_BATCH_SIZE）
+        executor: 并发投递使用的线程池（为空时串行投递）
+    
+    Returns:
+        int: 本批消息数量
+    """
+    if wx_breakers['send'].is_open() or wx_breakers['token'].is_open():
+        return 0
+    
+    db = SessionLocal()
+    try:
+        claim_token, rows = claim_batch(db, OutboxMessage, batch_size or OUTBOX_BATCH_SIZE, OUTBOX_LEASE_SECONDS)
+        if not rows:
+            return 0
+        
+        if executor is not None:
+            results = list(executor.map(_deliver_outbox_message, rows))
+        else:
+            results = [_deliver_outbox_message(row) for row in rows]
+        
+        now_ms = int(datetime.now().timestamp() * 1000)
+        done_ids = []
+        for row, (done, error) in zip(rows, results):
+            if done:
+                done_ids.append(row.id)
+                continue
+            retry_after = max(wx_breakers['send'].retry_after(), wx_breakers['token'].retry_after())
+            if retry_after > 0:
+                row.status = 'pending'
+                row.available_at = now_ms + int(retry_after * 1000)
+            elif row.attempts + 1 >= OUTBOX_MAX_ATTEMPTS:
+                row.status = 'failed'
+                row.attempts += 1
+                logger.error(f'❌ 发件箱消息投递失败次数过多，不再重试: id={row.id}, 错误: {error}')
+            else:
+                row.status = 'pending'
+                row.available_at = now_ms + min(600, 10 * 2 ** row.attempts) * 1000
+                row.attempts += 1
+            row.last_error = (error or '')[:500]
+        
+        if done_ids:
+            db.query(OutboxMessage).filter(
+                OutboxMessage.id.in_(done_ids),
+                OutboxMessage.claim_token == claim_token
+            ).delete(synchronize_session=False)
+        db.commit()
+        return len(rows)
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+_outbox_executor = None
+
+
+def run_outbox_relay():
+    """投递发件箱中所有到期的消息（定时任务执行函数，积压时连续投递直到清空）"""
+    global _outbox_executor
+    if _outbox_executor is None:
+        _outbox_executor = ThreadPoolExecutor(max_workers=OUTBOX_CONCURRENCY, thread_name_prefix='outbox')
+    try:
+        while relay_outbox(executor=_outbox_executor) >= OUTBOX_BATCH_SIZE:
+            pass
+    except Exception as e:
+        logger.error(f'投递发件箱消息异常: {str(e)}', exc_info=True)
+
+
+def build_reminder_template_data(reminder):
+    """
+    构建提醒订阅消息的模板数据
+    模板字段：事项主题(thing1)、事项时间(time2)、事项描述(thing4)
+    
+    Args:
+        reminder: Reminder 对象
+    """
+    thing1 = (reminder.thing1 or reminder.title or '')[:20]  # 事项主题，优先使用 thing1，否则使用 title
+    thing4 = (reminder.thing4 or reminder.title or '')[:20]  # 事项描述，优先使用 thing4，否则使用 title
+    return {
+        'thing1': {'value': thing1},  # 事项主题
+        'time2': {'value': reminder.time or ''},  # 事项时间
+        'thing4': {'value': thing4}  # 事项描述
+    }
+
+
+# 发送认领的有效期：认领后超过该时间仍是 sending（进程被杀、超时或异常退出），补发任务和发送进程可以重新认领
+SEND_CLAIM_TIMEOUT_SECONDS = int(os.getenv('SEND_CLAIM_TIMEOUT_SECONDS', '300'))
+# 发送异常（没有消息发出）后重试的间隔
+SEND_RETRY_SECONDS = int(os.getenv('SEND_RETRY_SECONDS', '60'))
+
+
+def sendable_condition(now_ms=None):
+    """
+    可以认领发送的提醒：pending，或 sending 但认领已过期
+    （claimed_at 为空的 sending 是升级前遗留的认领，同样视为过期）
+    """
+    now_ms = now_ms or int(datetime.now().timestamp() * 1000)
+    return and_(
+        Reminder.status.in_(('pending', 'sending')),
+        or_(
+            Reminder.status == 'pending',
+            Reminder.claimed_at.is_(None),
+            Reminder.claimed_at < now_ms - SEND_CLAIM_TIMEOUT_SECONDS * 1000
+        )
+    )
+
+
+def claim_reminder(db, reminder_id):
+    """
+    认领待发送的提醒（pending 或认领已过期的 sending -> sending）
+    使用条件更新保证同一提醒只会被一个任务或进程发送
+    
+    Returns:
+        bool: 是否认领成功
+    """
+    now_ms = int(datetime.now().timestamp() * 1000)
+    claimed = db.query(Reminder).filter(
+        Reminder.id == reminder_id,
+        sendable_condition(now_ms)
+    ).update({'status': 'sending', 'claimed_at': now_ms}, synchronize_session=False)
+    db.commit()
+    return claimed == 1
+
+
+def release_reminder_claim(reminder_ids, status, retry_seconds=None):
+    """
+    发送异常后释放认领（使用新会话，原会话可能已不可用）
+    已有消息发出时标记为 sent，避免重复发送；
+    没有消息发出时传入 retry_seconds：提醒保持 sending，认领时间前移到 retry_seconds 秒后过期，
+    到期前发送进程和补发任务都不会重新认领，避免每次轮询都立即重试
+    释放失败时提醒保持 sending，认领过期后由补发任务或发送进程重新认领
+    """
+    values = {'status': status}
+    if retry_seconds is not None:
+        now_ms = int(datetime.now().timestamp() * 1000)
+        values['claimed_at'] = now_ms - max(0, SEND_CLAIM_TIMEOUT_SECONDS - retry_seconds) * 1000
+    db = SessionLocal()
+    try:
+        db.query(Reminder).filter(
+            Reminder.id.in_(reminder_ids),
+            Reminder.status.in_(('pending', 'sending'))
+        ).update(values, synchronize_session=False)
+        db.commit()
+        logger.info(f'已释放发送认领: ID={list(reminder_ids)}, 状态={status}'
+                    + (f', {retry_seconds}秒后重试' if retry_seconds is not None else ''))
+    except Exception as e:
+        db.rollback()
+        logger.error(f'释放发送认领失败，等待认领过期后重试: ID={list(reminder_ids)}, 错误: {str(e)}')
+    finally:
+        db.close()
+
+
+def send_reminder(reminder_id, due_ms=None):
+    """
+    发送提醒（定时任务执行函数）
+    
+    调度器中只保存 (reminder_id, due_ms)，提醒内容在发送时才从数据库加载，
+    这样调度器的常驻内存只与待发送提醒的数量有关，与提醒内容长度无关
+    
+    Args:
+        reminder_id: 提醒ID
+        due_ms: 安排任务时的提醒时间戳（毫秒），用于识别已被修改的过期任务
+    """
+    db = SessionLocal()
+    claimed_ids = []  # 认领成功后需要更新状态的提醒（创建者提醒和被分配者的副本）
+    delivered = False  # 是否已有消息发出（或已排队重发）
+    try:
+        reminder = db.query(Reminder).filter(Reminder.id == reminder_id).first()
+        if not reminder:
+            logger.warning(f'提醒不存在，跳过发送: ID={reminder_id}')
+            return
+        
+        if due_ms is not None and reminder.reminder_time != due_ms:
+            # 提醒时间已被修改，修改时会重新安排任务，这里的旧任务直接跳过
+            logger.info(f'提醒时间已变更，跳过旧任务: ID={reminder_id}, 任务时间={due_ms}, 当前时间={reminder.reminder_time}')
+            return
+        
+        logger.info(f'开始发送提醒: ID={reminder.id}, openid={reminder.openid}, owner_openid={reminder.owner_openid}')
+        
+        template_data = build_reminder_template_data(reminder)
+        logger.info(f'模板数据: {template_data}')
+        
+        # 查找所有需要发送提醒的用户
+        # 1. 创建者（owner_openid）
+        # 2. 所有被分配者（通过reminder_assignments表查找）
+        owner_openid = reminder.owner_openid
+        
+        # 确定原提醒ID
+        # 如果当前提醒是创建者的（openid == owner_openid），则当前ID就是原提醒ID
+        # 如果当前提醒是被分配者的副本，原提醒ID记录在 source_reminder_id 中
+        if reminder.openid == owner_openid:
+            original_reminder_id = reminder.id
+            owner_reminder = reminder
+        else:
+            original_reminder_id = reminder.source_reminder_id
+            owner_reminder = db.query(Reminder).filter(
+                Reminder.id == original_reminder_id
+            ).first() if original_reminder_id else None
+        
+        # 微信接口熔断中：不认领，提醒保持 pending，熔断恢复后再发送
+        retry_after = max(wx_breakers['send'].retry_after(), wx_breakers['token'].retry_after())
+        if retry_after > 0:
+            logger.info(f'微信接口熔断中，提醒延后发送: ID={reminder_id}, {retry_after:.0f}秒后重试')
+            defer_reminder(reminder_id, due_ms, retry_after)
+            return
+        
+        # 认领提醒（pending -> sending），防止定时任务、补发任务或多个进程重复发送
+        claim_id = owner_reminder.id if owner_reminder else reminder.id
+        if not claim_reminder(db, claim_id):
+            logger.info(f'提醒已被认领或不是待发送状态，跳过: ID={reminder_id}, 认领ID={claim_id}')
+            return
+        claimed_ids.append(claim_id)
+        
+        # 获取所有被分配的提醒记录（通过原提醒ID查找）
+        # 注意：assignment.reminder_id是原提醒的ID（owner_openid_reminder_time）
+        assignments = db.query(ReminderAssignment).filter(
+            ReminderAssignment.reminder_id == original_reminder_id,
+            ReminderAssignment.status == 'accepted'
+        ).all()
+        
+        # 收集所有需要发送提醒的openid
+        openids_to_notify = set()
+        
+        # 添加创建者
+        if owner_reminder and owner_reminder.enable_subscribe:
+            openids_to_notify.add(owner_openid)
+            logger.info(f'添加创建者到通知列表: {owner_openid}')
+        
+        # 添加所有被分配者
+        # 注意：被分配者的提醒ID格式是 {assigned_openid}_{create_timestamp}，与原提醒无关
+        # 通过 (owner_openid, openid, source_reminder_id) 唯一索引查找副本
+        assigned_reminders = []
+        for assignment in assignments:
+            assigned_reminder = db.query(Reminder).filter(
+                Reminder.owner_openid == owner_openid,
+                Reminder.openid == assignment.assigned_openid,
+                Reminder.source_reminder_id == original_reminder_id
+            ).first()
+            
+            if assigned_reminder:
+                assigned_reminders.append(assigned_reminder)
+                claimed_ids.append(assigned_reminder.id)
+                # 验证assignment对应的提醒是否开启了订阅
+                if assigned_reminder.enable_subscribe:
+                    openids_to_notify.add(assignment.assigned_openid)
+                    logger.info(f'添加被分配者到通知列表: {assignment.assigned_openid}')
+        
+        logger.info(f'需要发送提醒的用户数量: {len(openids_to_notify)}, 用户列表: {list(openids_to_notify)}')
+        
+        # 发送提醒给所有用户
+        success_count = 0
+        fail_count = 0
+        refuse_count = 0  # 用户拒绝接受消息的数量
+        queued_count = 0  # 熔断中已排队等待重发的数量
+        no_credit_count = 0  # 没有订阅授权额度、未调用微信接口的数量
+        
+        for openid in openids_to_notify:
+            # 发送订阅消息
+            result = send_subscribe_message(
+                openid=openid,
+                template_id=TEMPLATE_ID,
+                page='pages/index/index',
+                data=template_data
+            )
+            
+            logger.info(f'订阅消息发送结果 (openid={openid}): {result}')
+            
+            error_code = result.get('errcode')
+            if error_code in (0, WX_ERRCODE_QUEUED):
+                delivered = True
+            if error_code == 0:
+                success_count += 1
+                logger.info(f'✅ 提醒发送成功: openid={openid}')
+            elif error_code == WX_ERRCODE_QUEUED:
+                # 发送过程中熔断，消息已排队，熔断恢复后自动重发
+                queued_count += 1
+            elif error_code == WX_ERRCODE_NO_CREDIT:
+                # 没有授权额度，调用微信接口也会返回 43101，与用户拒绝同样处理
+                no_credit_count += 1
+            elif error_code == 43101:
+                # 用户拒绝接受消息，这是正常的用户行为，不计入失败
+                refuse_count += 1
+                logger.info(f'ℹ️ 用户拒绝接受消息: openid={openid}（这是正常的用户选择）')
+            else:
+                fail_count += 1
+                error_msg = result.get('errmsg', '未知错误')
+                logger.error(f'❌ 提醒发送失败: openid={openid}, errcode={error_code}, errmsg={error_msg}')
+        
+        # 更新所有相关提醒的状态到数据库
+        # 只要有成功发送的，就标记为 sent；如果全部失败（不包括用户拒绝），才标记为 failed
+        # 用户拒绝接受消息（43101）不应该影响状态，因为这是用户的选择
+        if success_count + queued_count > 0 or (fail_count == 0 and refuse_count + no_credit_count > 0):
+            # 有成功发送（或已排队重发）的，或者只有用户拒绝的，都标记为 sent（因为已经尝试发送了）
+            final_status = 'sent'
+        else:
+            # 只有真正的失败才标记为 failed
+            final_status = 'failed'
+        
+        # 更新创建者的提醒状态
+        if owner_reminder:
+            owner_reminder.status = final_status
+        
+        # 更新所有被分配者的提醒状态
+        for assigned_reminder in assigned_reminders:
+            assigned_reminder.status = final_status
+        
+        db.commit()
+        logger.info(f'提醒发送完成: 成功={success_count}, 排队={queued_count}, 用户拒绝={refuse_count}, '
+                    f'无授权跳过={no_credit_count}, 失败={fail_count}')
+        
+    except Exception as e:
+        db.rollback()
+        logger.error(f'发送提醒异常: ID={reminder_id}, 错误: {str(e)}', exc_info=True)
+        if claimed_ids:
+            # 认领后出错：不能让提醒停留在 sending（补发任务和发送进程只处理可认领的提醒）
+            if delivered:
+                release_reminder_claim(claimed_ids, 'sent')
+            else:
+                release_reminder_claim(claimed_ids[:1], 'sending', retry_seconds=SEND_RETRY_SECONDS)
+                defer_reminder(reminder_id, due_ms, SEND_RETRY_SECONDS)
+    finally:
+        db.close()
+
+
+def defer_reminder(reminder_id, due_ms, delay_seconds):
+    """
+    延后发送提醒（微信接口熔断期间）
+    inline 模式下重新安排定时任务；external 模式下提醒保持 pending，由发送进程在熔断恢复后重新扫描
+    """
+    if DISPATCH_MODE == 'external' or scheduler is None:
+        return
+    scheduler.add_job(
+        send_reminder,
+        trigger=DateTrigger(run_date=datetime.now() + timedelta(seconds=delay_seconds + 1)),
+        args=(reminder_id, due_ms),
+        id=f"reminder_{reminder_id}",
+        replace_existing=True
+    )
+
+
+def initial_reminder_status(enable_subscribe, reminder_time_ms):
+    """
+    新建提醒的状态：开启订阅时为 pending（等待发送）；
+    未开启订阅时，提醒时间已过为 expired，未到为 no_subscribe
+    """
+    if enable_subscribe and reminder_time_ms:
+        return 'pending'
+    if reminder_time_ms and datetime.fromtimestamp(reminder_time_ms / 1000) <= datetime.now():
+        return 'expired'
+    return 'no_subscribe'
+
+
+def schedule_reminder(reminder):
+    """
+    安排提醒任务
+    
+    调度器中只登记 (reminder_id, due_ms) 两个字段，不持有提醒内容
+    
+    Args:
+        reminder: 提醒信息字典（只使用 id 和 reminderTime）
+    """
+    if DISPATCH_MODE == 'external':
+        # 独立 dispatcher 进程会从数据库扫描到期提醒，这里只需写库
+        return
+    
+    try:
+        reminder_id = reminder['id']
+        due_ms = reminder['reminderTime']
+        reminder_time = datetime.fromtimestamp(due_ms / 1000)
+        now = datetime.now()
+        
+        logger.info(f'安排提醒任务: ID={reminder_id}, 提醒时间={reminder_time}, 当前时间={now}')
+        
+        # 如果提醒时间已过，不安排任务
+        if reminder_time <= now:
+            logger.warning(f'提醒时间已过: {reminder_time}, 当前时间: {now}, 时间差: {(now - reminder_time).total_seconds()}秒')
+            # 如果时间已过但不超过1分钟，仍然安排（可能是时间同步问题）
+            if (now - reminder_time).total_seconds() > 60:
+                return
+            else:
+                logger.info(f'提醒时间已过但不超过1分钟，仍然安排任务')
+        
+        # 确保调度器已初始化
+        global scheduler
+        if scheduler is None:
+            logger.warning('调度器未初始化，尝试初始化...')
+            init_app()
+            if scheduler is None:
+                logger.error('调度器初始化失败，无法安排提醒任务')
+                return
+        
+        # 添加定时任务（任务参数只有提醒ID和提醒时间）
+        job_id = f"reminder_{reminder_id}"
+        scheduler.add_job(
+            send_reminder,
+            trigger=DateTrigger(run_date=reminder_time),
+            args=(reminder_id, due_ms),
+            id=job_id,
+            replace_existing=True
+        )
+        
+        # 验证任务是否添加成功
+        job = scheduler.get_job(job_id)
+        if job:
+            logger.info(f'✅ 已安排提醒任务: ID={reminder_id}, 任务ID={job_id}, 执行时间={reminder_time}, 当前时间={now}')
+        else:
+            logger.error(f'❌ 任务添加失败: ID={reminder_id}, 任务ID={job_id}')
+            
+    except Exception as e:
+        logger.error(f'安排提醒任务异常: {str(e)}', exc_info=True)
+
+
+def schedule_reminders(reminders):
+    """
+    批量安排提醒任务（批量创建使用），只取一次调度器，不逐条校验和打日志
+    
+    Args:
+        reminders: [(reminder_id, due_ms), ...]
+    
+    Returns:
+        实际登记到调度器的任务数量
+    """
+    if DISPATCH_MODE == 'external' or not reminders:
+        return 0
+    
+    global scheduler
+    if scheduler is None:
+        init_app()
+        if scheduler is None:
+            logger.error('调度器初始化失败，无法安排提醒任务')
+            return 0
+    
+    now = datetime.now()
+    scheduled = 0
+    for reminder_id, due_ms in reminders:
+        reminder_time = datetime.fromtimestamp(due_ms / 1000)
+        # 与 schedule_reminder 一致：已过期超过1分钟的不再安排
+        if (now - reminder_time).total_seconds() > 60:
+            continue
+        try:
+            scheduler.add_job(
+                send_reminder,
+                trigger=DateTrigger(run_date=reminder_time),
+                args=(reminder_id, due_ms),
+                id=f"reminder_{reminder_id}",
+                replace_existing=True
+            )
+            scheduled += 1
+        except Exception as e:
+            logger.error(f'安排提醒任务异常: ID={reminder_id}, {str(e)}')
+    logger.info(f'批量安排提醒任务: {scheduled}/{len(reminders)} 个')
+    return scheduled
+
+
+# 补发配置：服务停机期间错过的提醒
+# 扫描窗口（秒）：只处理提醒时间在 [当前时间 - 窗口, 当前时间] 之间的 pending 提醒
+CATCHUP_GRACE_SECONDS = int(os.getenv('CATCHUP_GRACE_SECONDS', '86400'))
+# 按错过时长选择处理策略，格式 "最大时长秒数:动作,...,*:动作"，动作为 send / expire / skip
+CATCHUP_POLICY = os.getenv('CATCHUP_POLICY', '1800:send,*:expire')
+# 每批扫描的提醒数量（每批单独使用一次数据库连接）
+CATCHUP_BATCH_SIZE = int(os.getenv('CATCHUP_BATCH_SIZE', '200'))
+# 每秒最多补发的提醒数量
+CATCHUP_RATE_PER_SECOND = float(os.getenv('CATCHUP_RATE_PER_SECOND', '20'))
+
+CATCHUP_ACTIONS = ('send', 'expire', 'skip')
+
+
+def parse_catchup_policy(spec):
+    """
+    解析补发策略
+    
+    Args:
+        spec: 策略字符串，如 "1800:send,7200:expire,*:skip"
+    
+    Returns:
+        list: [(最大错过时长秒数或 None, 动作), ...]，按时长升序，None 表示其余所有
+    """
+    rules = []
+    for part in spec.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        max_age, _, action = part.partition(':')
+        action = action.strip()
+        if action not in CATCHUP_ACTIONS:
+            raise ValueError(f'无效的补发动作: {action}')
+        max_age = max_age.strip()
+        rules.append((None if max_age == '*' else int(max_age), action))
+    rules.sort(key=lambda rule: float('inf') if rule[0] is None else rule[0])
+    return rules
+
+
+def catchup_action_for(age_seconds, rules):
+    """根据错过时长返回补发动作，未匹配任何规则时跳过"""
+    for max_age, action in rules:
+        if max_age is None or age_seconds <= max_age:
+            return action
+    return 'skip'
+
+
+def catch_up_reminders(grace_seconds=None, policy=None, batch_size=None, rate_per_second=None, dry_run=False, shard_filter=None):
+    """
+    补发服务停机期间错过的提醒
+    
+    按提醒时间从早到晚分批扫描可认领的创建者提醒（pending，或认领已过期的 sending；被分配者的提醒随创建者一起发送），
+    按错过时长执行策略：send 发送、expire 标记为 expired、skip 保持不变。
+    使用 (reminder_time, id) 键集分页，每批只取必要字段并单独开关会话，
+    大量积压时内存和连接池占用都保持恒定。
+    
+    Args:
+        shard_filter: 可选，返回额外过滤条件的函数（分片发送进程只处理自己持有的分片）
+    
+    Returns:
+        dict: 各动作的处理数量
+    """
+    grace_seconds = CATCHUP_GRACE_SECONDS if grace_seconds is None else grace_seconds
+    rules = parse_catchup_policy(policy or CATCHUP_POLICY)
+    batch_size = batch_size or CATCHUP_BATCH_SIZE
+    rate_per_second = rate_per_second or CATCHUP_RATE_PER_SECOND
+    send_interval = 1.0 / rate_per_second if rate_per_second > 0 else 0
+    
+    now_ms = int(datetime.now().timestamp() * 1000)
+    window_start = now_ms - grace_seconds * 1000
+    stats = {'scanned': 0, 'send': 0, 'expire': 0, 'skip': 0}
+    last_key = None
+    next_send_at = time.monotonic()
+    
+    logger.info(f'开始补发错过的提醒: 窗口={grace_seconds}秒, 策略={rules}, 批大小={batch_size}, 速率={rate_per_second}/秒, dry_run={dry_run}')
+    
+    while True:
+        db = SessionLocal()
+        try:
+            query = db.query(Reminder.id, Reminder.owner_openid, Reminder.reminder_time).filter(
+                sendable_condition(),
+                Reminder.enable_subscribe == True,
+                Reminder.openid == Reminder.owner_openid,
+                Reminder.reminder_time >= window_start,
+                Reminder.reminder_time <= now_ms
+            )
+            if shard_filter is not None:
+                query = query.filter(shard_filter())
+            if last_key is not None:
+                last_time, last_id = last_key
+                query = query.filter(or_(
+                    Reminder.reminder_time > last_time,
+                    and_(Reminder.reminder_time == last_time, Reminder.id > last_id)
+                ))
+            batch = query.order_by(Reminder.reminder_time, Reminder.id).limit(batch_size).all()
+            
+            if not batch:
+                break
+            last_key = (batch[-1].reminder_time, batch[-1].id)
+            stats['scanned'] += len(batch)
+            
+            to_send = []
+            to_expire = []
+            for row in batch:
+                action = catchup_action_for((now_ms - row.reminder_time) / 1000, rules)
+                stats[action] += 1
+                if action == 'send':
+                    to_send.append(row)
+                elif action == 'expire':
+                    to_expire.append(row)
+            
+            if to_expire and not dry_run:
+                # 创建者提醒和被分配者的副本一起标记为过期
+                for row in to_expire:
+                    db.query(Reminder).filter(
+                        Reminder.owner_openid == row.owner_openid,
+                        or_(Reminder.id == row.id, Reminder.source_reminder_id == row.id),
+                        sendable_condition(now_ms)
+                    ).update({'status': 'expired'}, synchronize_session=False)
+                db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+        
+        if dry_run:
+            continue
+        
+        for row in to_send:
+            # 限速：两次发送之间至少间隔 send_interval 秒
+            delay = next_send_at - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            next_send_at = max(next_send_at, time.monotonic()) + send_interval
+            send_reminder(row.id, row.reminder_time)
+    
+    logger.info(f'补发完成: {stats}')
+    return stats
+
+
+def restore_scheduled_reminders(batch_size=None):
+    """
+    重新安排未来的 pending 提醒（调度器任务只保存在内存中，重启后需要恢复）
+    
+    Returns:
+        int: 恢复的任务数量
+    """
+    batch_size = batch_size or CATCHUP_BATCH_SIZE
+    now_ms = int(datetime.now().timestamp() * 1000)
+    restored = 0
+    last_key = None
+    
+    while True:
+        db = SessionLocal()
+        try:
+            query = db.query(Reminder.id, Reminder.reminder_time).filter(
+                Reminder.status == 'pending',
+                Reminder.enable_subscribe == True,
+                Reminder.openid == Reminder.owner_openid,
+                Reminder.reminder_time > now_ms
+            )
+            if last_key is not None:
+                last_time, last_id = last_key
+                query = query.filter(or_(
+                    Reminder.reminder_time > last_time,
+                    and_(Reminder.reminder_time == last_time, Reminder.id > last_id)
+                ))
+            batch = query.order_by(Reminder.reminder_time, Reminder.id).limit(batch_size).all()
+        finally:
+            db.close()
+        
+        if not batch:
+            break
+        last_key = (batch[-1].reminder_time, batch[-1].id)
+        schedule_reminders([(row.id, row.reminder_time) for row in batch])
+        restored += len(batch)
+    
+    logger.info(f'已恢复 {restored} 个定时提醒任务')
+    return restored
+
+
+def run_startup_catch_up():
+    """启动时恢复未来的定时任务，并补发停机期间错过的提醒"""
+    try:
+        restore_scheduled_reminders()
+        catch_up_reminders()
+    except Exception as e:
+        logger.error(f'启动补发异常: {str(e)}', exc_info=True)
+
+
+def _request_openids():
+    """从请求参数、请求体和提醒ID（{openid}_{时间戳}）中取出涉及的用户 openid"""
+    openids = set()
+    sources = [request.args]
+    body = request.get_json(silent=True)
+    if isinstance(body, dict):
+        sources.append(body)
+    for source in sources:
+        for key in ('openid', 'owner_openid', 'assigned_openid', 'ownerOpenid'):
+            value = source.get(key)
+            if isinstance(value, str) and value:
+                openids.add(value)
+    reminder_id = (request.view_args or {}).get('reminder_id')
+    if reminder_id and '_' in reminder_id:
+        openids.add(reminder_id.rsplit('_', 1)[0])
+    return openids
+
+
+def get_db():
+    """
+    当前请求的数据库会话（主库）
+    同一请求内多次调用返回同一个会话，请求结束时自动关闭，处理函数中不需要 close
+    """
+    if 'db' not in g:
+        g.db = new_session()
+    return g.db
+
+
+def get_read_db(openid=None):
+    """当前请求的只读数据库会话（配置了从库时发往从库，见 read_session），请求结束时自动关闭"""
+    if 'read_db' not in g:
+        g.read_db = read_session(openid)
+    return g.read_db
+
+
+@app.teardown_appcontext
+def close_db_sessions(exc):
+    """请求结束时关闭本请求的数据库会话（未提交的修改会回滚）"""
+    for key in ('db', 'read_db'):
+        db = g.pop(key, None)
+        if db is not None:
+            db.close()
+    SessionLocal.remove()
+
+
+# 单个请求的 SQL 语句数量上限，超过时记录警告（通常说明存在 N+1 查询）
+DB_QUERY_BUDGET = int(os.getenv('DB_QUERY_BUDGET', '20'))
+
+# 按接口汇总的 SQL 统计（进程启动以来）：endpoint -> {requests, queries, time_ms, max_queries, over_budget}
+db_query_stats = {}
+_db_query_stats_lock = threading.Lock()
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info['query_started'] = time.perf_counter()
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.pop('query_started', None)
+    if started is not None and has_request_context():
+        g.db_queries = g.get('db_queries', 0) + 1
+        g.db_time = g.get('db_time', 0.0) + (time.perf_counter() - started)
+
+
+@app.after_request
+def record_db_queries(response):
+    """记录本请求的 SQL 语句数量和耗时，通过 X-DB-Queries、X-DB-Time-Ms 响应头返回"""
+    queries = g.get('db_queries', 0)
+    time_ms = g.get('db_time', 0.0) * 1000
+    response.headers['X-DB-Queries'] = str(queries)
+    response.headers['X-DB-Time-Ms'] = f'{time_ms:.1f}'
+    
+    endpoint = request.endpoint or request.path
+    over_budget = queries > DB_QUERY_BUDGET
+    if over_budget:
+        logger.warning(f'⚠️ 请求 SQL 语句数超出预算: {request.method} {request.path}, '
+                       f'语句数={queries}, 预算={DB_QUERY_BUDGET}, 耗时={time_ms:.1f}ms')
+    with _db_query_stats_lock:
+        stats = db_query_stats.setdefault(endpoint, {
+            'requests': 0, 'queries': 0, 'time_ms': 0.0, 'max_queries': 0, 'over_budget': 0
+        })
+        stats['requests'] += 1
+        stats['queries'] += queries
+        stats['time_ms'] += time_ms
+        stats['max_queries'] = max(stats['max_queries'], queries)
+        stats['over_budget'] += int(over_budget)
+    return response
+
+
+@app.after_request
+def remember_recent_writers(response):
+    """写请求成功后记录涉及的用户，短时间内这些用户的读请求发往主库"""
+    if replica_engines and request.method in ('POST', 'PUT', 'DELETE') and response.status_code < 400:
+        for openid in _request_openids():
+            mark_recent_write(openid)
+    return response
+
+
+# 响应压缩：JSON 响应体超过阈值时按 Accept-Encoding 使用 brotli（已安装时）或 gzip 压缩
+COMPRESS_MIN_BYTES = int(os.getenv('COMPRESS_MIN_BYTES', '1024'))  # 小于该大小的响应不压缩
+COMPRESS_GZIP_LEVEL = int(os.getenv('COMPRESS_GZIP_LEVEL', '6'))  # 1-9
+COMPRESS_BROTLI_LEVEL = int(os.getenv('COMPRESS_BROTLI_LEVEL', '5'))  # 0-11，5 以上 CPU 开销增长明显
+# 压缩结果缓存上限（字节）：GET 响应按 ETag 缓存压缩后的内容，内容未变化的重复请求不再压缩
+COMPRESS_CACHE_MAX_BYTES = int(os.getenv('COMPRESS_CACHE_MAX_BYTES', str(32 * 1024 * 1024)))
+
+_compressed_cache = OrderedDict()  # (etag, encoding) -> 压缩后的字节，按最近使用排序
+_compressed_cache_size = 0
+_compressed_cache_lock = threading.Lock()
+compression_stats = {
+    'responses': 0, 'bytes_in': 0, 'bytes_out': 0, 'cpu_ms': 0.0, 'cache_hits': 0, 'not_modified': 0
+}
+_compression_stats_lock = threading.Lock()
+
+
+def choose_content_encoding(accept_encodings):
+    """按客户端 Accept-Encoding 选择压缩方式（br 优先），都不支持时返回 None"""
+    if brotli is not None and accept_encodings['br']:
+        return 'br'
+    if accept_encodings['gzip']:
+        return 'gzip'
+    return None
+
+
+def compress_body(body, encoding):
+    """压缩响应体（gzip 固定 mtime，相同内容得到相同结果）"""
+    if encoding == 'br':
+        return brotli.compress(body, quality=COMPRESS_BROTLI_LEVEL)
+    return gzip.compress(body, compresslevel=COMPRESS_GZIP_LEVEL, mtime=0)
+
+
+def _cached_compress(etag, encoding, body):
+    """按 (ETag, 压缩方式) 缓存压缩结果，返回 (压缩后的字节, 是否命中缓存)"""
+    global _compressed_cache_size
+    key = (etag, encoding)
+    if etag:
+        with _compressed_cache_lock:
+            compressed = _compressed_cache.get(key)
+            if compressed is not None:
+                _compressed_cache.move_to_end(key)
+                return compressed, True
+    compressed = compress_body(body, encoding)
+    if etag and len(compressed) <= COMPRESS_CACHE_MAX_BYTES:
+        with _compressed_cache_lock:
+            if key not in _compressed_cache:
+                _compressed_cache[key] = compressed
+                _compressed_cache_size += len(compressed)
+            while _compressed_cache_size > COMPRESS_CACHE_MAX_BYTES:
+                _, evicted = _compressed_cache.popitem(last=False)
+                _compressed_cache_size -= len(evicted)
+    return compressed, False
+
+
+@app.after_request
+def compress_response(response):
+    """
+    GET 的 JSON 响应加弱 ETag（客户端带 If-None-Match 且内容未变化时返回 304），
+    超过 COMPRESS_MIN_BYTES 的 JSON 响应按 Accept-Encoding 压缩
+    """
+    if (response.status_code != 200 or response.direct_passthrough or response.is_streamed
+            or response.mimetype != 'application/json' or 'Content-Encoding' in response.headers):
+        return response
+    
+    body = response.get_data()
+    etag = None
+    if request.method == 'GET':
+        etag = hashlib.blake2b(body, digest_size=16).hexdigest()
+        # 弱 ETag：压缩和未压缩的响应内容相同，共用同一个 ETag
+        response.set_etag(etag, weak=True)
+        response.vary.add('Accept-Encoding')
+        if request.if_none_match.contains_weak(etag):
+            with _compression_stats_lock:
+                compression_stats['not_modified'] += 1
+            response.status_code = 304
+            response.set_data(b'')
+            return response
+    
+    if len(body) < COMPRESS_MIN_BYTES:
+        return response
+    encoding = choose_content_encoding(request.accept_encodings)
+    if encoding is None:
+        return response
+    
+    started = time.thread_time()
+    compressed, cache_hit = _cached_compress(etag, encoding, body)
+    cpu_ms = (time.thread_time() - started) * 1000
+    response.set_data(compressed)
+    response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    with _compression_stats_lock:
+        compression_stats['responses'] += 1
+        compression_stats['bytes_in'] += len(body)
+        compression_stats['bytes_out'] += len(compressed)
+        compression_stats['cpu_ms'] += cpu_ms
+        compression_stats['cache_hits'] += int(cache_hit)
+    return response
+
+
+@app.route('/api/debug/compression', methods=['GET'])
+def get_compression_stats():
+    """
+    查看响应压缩统计（调试用，进程启动以来）
+    """
+    with _compression_stats_lock:
+        stats = dict(compression_stats)
+    with _compressed_cache_lock:
+        cache = {'entries': len(_compressed_cache), 'bytes': _compressed_cache_size, 'max_bytes': COMPRESS_CACHE_MAX_BYTES}
+    return jsonify({
+        'errcode': 0,
+        'errmsg': 'success',
+        'data': dict(
+            stats,
+            cpu_ms=round(stats['cpu_ms'], 1),
+            saved_bytes=stats['bytes_in'] - stats['bytes_out'],
+            ratio=round(stats['bytes_out'] / stats['bytes_in'], 3) if stats['bytes_in'] else None,
+            encodings=['br', 'gzip'] if brotli is not None else ['gzip'],
+            min_bytes=COMPRESS_MIN_BYTES,
+            gzip_level=COMPRESS_GZIP_LEVEL,
+            brotli_level=COMPRESS_BROTLI_LEVEL,
+            cache=cache
+        )
+    })
+
+
+# 列表接口的查询列（字段与 Reminder.to_dict 一致，另加 fromOwner）
+# 用 Core select 直接取元组，不构造 ORM 对象；fromOwner（是否来自分享）在 SQL 中计算
+REMINDER_LIST_COLUMNS = (
+    Reminder.id.label('id'),
+    Reminder.openid.label('openid'),
+    Reminder.owner_openid.label('ownerOpenid'),
+    Reminder.title.label('title'),
+    Reminder.thing1.label('thing1'),
+    Reminder.thing4.label('thing4'),
+    Reminder.time.label('time'),
+    Reminder.reminder_time.label('reminderTime'),
+    Reminder.completed.label('completed'),
+    Reminder.enable_subscribe.label('enableSubscribe'),
+    Reminder.status.label('status'),
+    Reminder.shared.label('shared'),
+    Reminder.source_reminder_id.label('sourceReminderId'),
+    Reminder.create_time.label('createTime'),
+    # 自己创建的 owner_openid == openid；被分享的副本 owner_openid 为原创建者
+    type_coerce(Reminder.owner_openid != Reminder.openid, Boolean).label('fromOwner'),
+)
+
+
+def fetch_reminder_rows(db, statement):
+    """执行列表查询（select(*REMINDER_LIST_COLUMNS)...），返回字典列表（createTime 仍为 datetime，由 FastJSONProvider 序列化）"""
+    result = db.execute(statement)
+    keys = tuple(result.keys())
+    return [dict(zip(keys, row)) for row in result]
+
+
+def json_response(payload, status=200):
+    """直接序列化为 UTF-8 JSON 字节返回（见 FastJSONProvider）"""
+    return app.response_class(app.json.dumps_bytes(payload), status=status, mimetype='application/json')
+
+
+def int_arg(name, default=None):
+    """读取整数查询参数，格式错误时抛出 ValueError"""
+    value = request.args.get(name)
+    if value is None or value == '':
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        raise ValueError(f'参数 {name} 必须是整数: {value}')
+
+
+# 导出：每批从数据库游标取出的行数（每批生成一段输出，内存占用与总行数无关）
+EXPORT_BATCH_SIZE = int(os.getenv('EXPORT_BATCH_SIZE', '1000'))
+EXPORT_FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+
+def iter_reminder_export(db, openid=None, fmt='ndjson', batch_size=EXPORT_BATCH_SIZE, filters=(), limit=None):
+    """
+    流式导出提醒，逐批生成 NDJSON（每行一个 JSON 对象）或 CSV 字节
+    使用服务端游标（MySQL 为 SSCursor）+ yield_per，不会把整张表读进内存
+    
+    Args:
+        openid: 只导出该用户拥有的提醒，为空时导出全部
+        fmt: ndjson 或 csv
+        filters: 额外的 WHERE 条件
+        limit: 最多导出的行数
+    """
+    statement = select(*REMINDER_LIST_COLUMNS).where(*filters)
+    if openid:
+        statement = statement.where(Reminder.openid == openid).order_by(Reminder.create_time)
+    else:
+        # 全表导出按主键顺序读取，避免数据库对整张表排序
+        statement = statement.order_by(Reminder.id)
+    if limit:
+        statement = statement.limit(limit)
+    result = db.execute(statement.execution_options(stream_results=True, yield_per=batch_size))
+    keys = list(result.keys())
+    
+    if fmt == 'csv':
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        # 带 BOM，Excel 打开时中文不乱码
+        buffer.write('\ufeff')
+        writer.writerow(keys)
+        for rows in result.partitions():
+            for row in rows:
+                writer.writerow([value.isoformat() if isinstance(value, datetime) else value for value in row])
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+        if buffer.tell():
+            yield buffer.getvalue().encode('utf-8')
+        return
+    
+    dumps = app.json.dumps_bytes
+    for rows in result.partitions():
+        yield b''.join(dumps(dict(zip(keys, row))) + b'\n' for row in rows)
+
+
+# 提醒查询缓存：分享到大群的提醒会被大量好友同时打开，详情和接受接口反复读取同一条原提醒
+# 进程内短 TTL 缓存；本进程内修改/删除时主动失效，其他进程（或发送进程）的修改最多 TTL 秒后可见
+REMINDER_CACHE_TTL_SECONDS = float(os.getenv('REMINDER_CACHE_TTL_SECONDS', '5'))
+REMINDER_CACHE_MAX_SIZE = int(os.getenv('REMINDER_CACHE_MAX_SIZE', '10000'))
+_reminder_cache = {}  # reminder_id -> (过期时间 time.monotonic(), 提醒字典)
+_reminder_cache_lock = threading.Lock()
+_reminder_cache_generation = 0  # 每次失效加一，防止失效前读到的旧数据在失效后写回缓存
+reminder_cache_stats = {'hits': 0, 'misses': 0}
+
+
+def get_cached_reminder(db, reminder_id, use_cache=True):
+    """
+    读取提醒（to_dict 格式，调用方不要修改返回的字典），命中缓存时不查库
+    
+    Returns:
+        提醒字典；提醒不存在时返回 None（不缓存）
+    """
+    if not use_cache or REMINDER_CACHE_TTL_SECONDS <= 0:
+        reminder = db.query(Reminder).filter(Reminder.id == reminder_id).first()
+        return reminder.to_dict() if reminder else None
+    
+    with _reminder_cache_lock:
+        entry = _reminder_cache.get(reminder_id)
+        if entry and entry[0] > time.monotonic():
+            reminder_cache_stats['hits'] += 1
+            return entry[1]
+        reminder_cache_stats['misses'] += 1
+        generation = _reminder_cache_generation
+    
+    reminder = db.query(Reminder).filter(Reminder.id == reminder_id).first()
+    if reminder is None:
+        return None
+    data = reminder.to_dict()
+    
+    with _reminder_cache_lock:
+        if generation == _reminder_cache_generation:
+            now = time.monotonic()
+            if len(_reminder_cache) >= REMINDER_CACHE_MAX_SIZE:
+                # 先清理过期的，仍然满了就整体清空
+                for key in [k for k, v in _reminder_cache.items() if v[0] <= now]:
+                    del _reminder_cache[key]
+                if len(_reminder_cache) >= REMINDER_CACHE_MAX_SIZE:
+                    _reminder_cache.clear()
+            _reminder_cache[reminder_id] = (now + REMINDER_CACHE_TTL_SECONDS, data)
+    return data
+
+
+def invalidate_cached_reminders(*reminder_ids):
+    """提醒被修改或删除后（提交之后）调用，使本进程内的缓存失效"""
+    global _reminder_cache_generation
+    with _reminder_cache_lock:
+        _reminder_cache_generation += 1
+        for reminder_id in reminder_ids:
+            _reminder_cache.pop(reminder_id, None)
+
+
+# 批量创建提醒时单次请求最多包含的提醒数量
+REMINDER_BATCH_MAX = int(os.getenv('REMINDER_BATCH_MAX', '1000'))
+
+
+def build_reminder_row(data, openid, reminder_id):
+    """
+    校验创建提醒的字段并生成待插入的行（单条创建和批量创建共用）
+    
+    Returns:
+        (行字典, 错误信息)，校验失败时行字典为 None
+    """
+    if 'reminderTime' not in data:
+        return None, '缺少必要字段: reminderTime'
+    reminder_time = data['reminderTime']
+    if isinstance(reminder_time, bool) or not isinstance(reminder_time, (int, float)):
+        return None, 'reminderTime 必须是毫秒时间戳'
+    
+    # 验证事项相关字段（thing1, thing4, time 均为必填）
+    thing1 = data.get('thing1', data.get('title', ''))
+    thing4 = data.get('thing4', '')
+    time_str = data.get('time', '')
+    if not thing1 or not thing4 or not time_str:
+        return None, '缺少必要字段: thing1（事项主题）、thing4（事项描述）、time（事项时间）均为必填'
+    
+    enable_subscribe = bool(data.get('enableSubscribe', False))
+    return {
+        'id': reminder_id,
+        'openid': openid,  # 当前拥有者
+        'owner_openid': openid,  # 创建者就是当前用户
+        'title': thing1,  # 兼容字段，使用 thing1
+        'thing1': thing1,  # 事项主题
+        'thing4': thing4,  # 事项描述
+        'time': time_str,  # 事项时间
+        'reminder_time': int(reminder_time),
+        'enable_subscribe': enable_subscribe,
+        # 插入前就确定最终状态，创建只需要一条 INSERT 和一次提交
+        'status': initial_reminder_status(enable_subscribe, reminder_time),
+        'completed': False,
+        'shared': False
+    }, None
+
+
+def _reminder_field(reminder, column):
+    """取提醒的列值（行字典或 Reminder 对象）"""
+    return reminder[column] if isinstance(reminder, dict) else getattr(reminder, column)
+
+
+def adjust_reminder_summaries(db, added=(), removed=()):
+    """
+    在调用方的事务中增量更新提醒汇总（不提交），每个涉及的用户一条 UPDATE
+    汇总行不存在时不更新，读取时会按提醒表重建
+    
+    Args:
+        added: 新增的提醒（行字典或 Reminder 对象，使用 id/openid/owner_openid/completed/reminder_time）
+        removed: 删除的提醒；修改完成状态按「删除旧状态 + 新增新状态」传入
+    """
+    now_ms = int(datetime.now().timestamp() * 1000)
+    changes = {}
+    for reminders, sign in ((added, 1), (removed, -1)):
+        for reminder in reminders:
+            openid = _reminder_field(reminder, 'openid')
+            change = changes.setdefault(openid, {'total': 0, 'completed': 0, 'shared': 0, 'next': None, 'removed': []})
+            change['total'] += sign
+            change['completed'] += sign * bool(_reminder_field(reminder, 'completed'))
+            change['shared'] += sign * (_reminder_field(reminder, 'owner_openid') != openid)
+            if sign < 0:
+                change['removed'].append(_reminder_field(reminder, 'id'))
+                continue
+            due_ms = _reminder_field(reminder, 'reminder_time')
+            if not _reminder_field(reminder, 'completed') and due_ms > now_ms and (
+                change['next'] is None or due_ms < change['next'][1]
+            ):
+                change['next'] = (_reminder_field(reminder, 'id'), due_ms)
+    
+    table = ReminderSummary.__table__
+    for openid, change in changes.items():
+        values = {
+            'total': table.c.total + change['total'],
+            'completed': table.c.completed + change['completed'],
+            'shared': table.c.shared + change['shared'],
+        }
+        if change['removed'] and change['next']:
+            # 同时删除和新增（取消完成等）：直接标记为需要重新计算
+            values['next_reminder_time'] = 0
+        elif change['removed']:
+            # 删除或完成了下一条提醒：标记为需要重新计算
+            values['next_reminder_time'] = case(
+                (table.c.next_reminder_id.in_(change['removed']), 0), else_=table.c.next_reminder_time
+            )
+        elif change['next']:
+            # 新提醒比原来的下一条更早时替换（为 0 时保持待重新计算）
+            # MySQL 按顺序执行赋值：SET 按列定义顺序生成，next_reminder_id 在前，两者都用 next_reminder_time 的旧值判断
+            earlier = or_(table.c.next_reminder_time.is_(None), table.c.next_reminder_time > change['next'][1])
+            values['next_reminder_id'] = case((earlier, change['next'][0]), else_=table.c.next_reminder_id)
+            values['next_reminder_time'] = case((earlier, change['next'][1]), else_=table.c.next_reminder_time)
+        db.execute(table.update().where(table.c.openid == openid).values(**values))
+
+
+def reset_reminder_summaries(db, openids, counts=True):
     """
-    安排提醒任务
+    在调用方的事务中让汇总失效（不提交）：counts 为真时删除汇总行（读取时重建），否则只重新计算下一条提醒
+    用于批量修改完成状态、修改提醒时间、批量导入等不方便逐条计算增量的写入
+    """
+    openids = [openid for openid in set(openids) if openid]
+    if not openids:
+        return
+    table = ReminderSummary.__table__
+    if counts:
+        db.execute(table.delete().where(table.c.openid.in_(openids)))
+    else:
+        db.execute(table.update().where(table.c.openid.in_(openids)).values(next_reminder_time=0))
+
+
+def load_reminder_summary(db, openid):
+    """
+    读取用户的提醒汇总，通常只有一次主键读取
+    汇总行不存在时用一条 INSERT ... SELECT 按提醒表重建；下一条提醒已过期或被标记时按 (openid, reminder_time) 索引重新查找
+    """
+    summary = db.get(ReminderSummary, openid)
+    if summary is None:
+        # 单条语句统计并写入，与并发写提醒的事务互斥（MySQL 对扫描到的行加共享锁，SQLite 写事务串行）
+        aggregate = select(
+            literal(openid),
+            func.count(),
+            func.coalesce(func.sum(case((Reminder.completed == True, 1), else_=0)), 0),
+            func.coalesce(func.sum(case((Reminder.owner_openid != Reminder.openid, 1), else_=0)), 0),
+            literal(0),
+        ).where(Reminder.openid == openid)
+        db.execute(ReminderSummary.__table__.insert().from_select(
+            ['openid', 'total', 'completed', 'shared', 'next_reminder_time'], aggregate
+        ).prefix_with('IGNORE', dialect='mysql').prefix_with('OR IGNORE', dialect='sqlite'))
+        db.commit()
+        summary = db.get(ReminderSummary, openid)
     
-    Args:
-        reminder: 提醒信息字典
+    now_ms = int(datetime.now().timestamp() * 1000)
+    stale_time = summary.next_reminder_time
+    if stale_time is not None and stale_time <= now_ms:
+        upcoming = db.execute(
+            select(Reminder.id, Reminder.reminder_time).where(
+                Reminder.openid == openid,
+                Reminder.reminder_time > now_ms,
+                Reminder.completed == False
+            ).order_by(Reminder.reminder_time).limit(1)
+        ).first()
+        summary.next_reminder_id = upcoming.id if upcoming else None
+        summary.next_reminder_time = upcoming.reminder_time if upcoming else None
+        result = summary.to_dict()
+        # 期间有新提醒写入了更早的下一条时不覆盖
+        db.execute(ReminderSummary.__table__.update().where(
+            ReminderSummary.openid == openid,
+            ReminderSummary.next_reminder_time == stale_time
+        ).values(next_reminder_id=result['nextReminderId'], next_reminder_time=result['nextReminderTime']))
+        db.commit()
+        return result
+    return summary.to_dict()
+
+
+def insert_reminder_rows(db, rows):
     """
+    插入提醒行并提交（同一事务中更新提醒汇总），表不存在时创建后重试一次
+    多行时走 executemany，pymysql 会合并成一条多行 INSERT
+    """
+    statement = Reminder.__table__.insert()
     try:
-        reminder_time = datetime.fromtimestamp(reminder['reminderTime'] / 1000)
-        now = datetime.now()
-        
-        logger.info(f'安排提醒任务: ID={reminder["id"]}, 提醒时间={reminder_time}, 当前时间={now}')
-        
-        # 如果提醒时间已过，不安排任务
-        if reminder_time <= now:
-            logger.warning(f'提醒时间已过: {reminder_time}, 当前时间: {now}, 时间差: {(now - reminder_time).total_seconds()}秒')
-            # 如果时间已过但不超过1分钟，仍然安排（可能是时间同步问题）
-            if (now - reminder_time).total_seconds() > 60:
-                return
-            else:
-                logger.info(f'提醒时间已过但不超过1分钟，仍然安排任务')
-        
-        def send_reminder():
-            """发送提醒的函数"""
-            try:
-                logger.info(f'开始发送提醒: ID={reminder["id"]}, openid={reminder["openid"]}, owner_openid={reminder.get("ownerOpenid")}')
-                
-                # 构建模板数据
-                # 模板字段：事项主题(thing1)、事项时间(time2)、事项描述(thing4)
-                reminder_time = reminder.get('time', '')
-                thing1 = reminder.get('thing1', reminder.get('title', ''))[:20]  # 事项主题，优先使用 thing1，否则使用 title
-                thing4 = reminder.get('thing4', reminder.get('title', ''))[:20]  # 事项描述，优先使用 thing4，否则使用 title
-                template_data = {
-                    'thing1': {'value': thing1},  # 事项主题
-                    'time2': {'value': reminder_time},  # 事项时间
-                    'thing4': {'value': thing4}  # 事项描述
-                }
-                
-                logger.info(f'模板数据: {template_data}')
-                
-                db = SessionLocal()
-                try:
-                    # 查找所有需要发送提醒的用户
-                    # 1. 创建者（owner_openid）
-                    # 2. 所有被分配者（通过reminder_assignments表查找）
-                    owner_openid = reminder.get('ownerOpenid') or reminder.get('owner_openid')
-                    reminder_time_stamp = reminder.get('reminderTime')
-                    current_reminder_id = reminder.get('id')
-                    current_openid = reminder.get('openid')
-                    
-                    # 确定原提醒ID
-                    # 如果当前提醒是创建者的（openid == owner_openid），则当前ID就是原提醒ID
-                    # 如果当前提醒是被分配者的（openid != owner_openid），则需要通过owner_openid和reminder_time构造原提醒ID
-                    if current_openid == owner_openid:
-                        original_reminder_id = current_reminder_id
-                    else:
-                        # 被分配者的提醒，原提醒ID是 owner_openid_reminder_time
-                        original_reminder_id = f"{owner_openid}_{reminder_time_stamp}"
-                    
-                    # 获取创建者的提醒记录（通过owner_openid和reminder_time查找）
-                    owner_reminder = db.query(Reminder).filter(
-                        Reminder.owner_openid == owner_openid,
-                        Reminder.openid == owner_openid,
-                        Reminder.reminder_time == reminder_time_stamp
-                    ).first()
-                    
-                    # 获取所有被分配的提醒记录（通过原提醒ID查找）
-                    # 注意：assignment.reminder_id是原提醒的ID（owner_openid_reminder_time）
-                    assignments = db.query(ReminderAssignment).filter(
-                        ReminderAssignment.reminder_id == original_reminder_id,
-                        ReminderAssignment.status == 'accepted'
-                    ).all()
-                    
-                    # 收集所有需要发送提醒的openid
-                    openids_to_notify = set()
-                    
-                    # 添加创建者
-                    if owner_reminder and owner_reminder.enable_subscribe:
-                        openids_to_notify.add(owner_openid)
-                        logger.info(f'添加创建者到通知列表: {owner_openid}')
-                    
-                    # 添加所有被分配者
-                    for assignment in assignments:
-                        # 验证assignment对应的提醒是否存在且开启了订阅
-                        # 注意：被分配者的提醒ID格式是 {assigned_openid}_{create_timestamp}，不是 {assigned_openid}_{reminder_time_stamp}
-                        # 所以需要通过 owner_openid、openid 和 reminder_time 来查找
-                        assigned_reminder = db.query(Reminder).filter(
-                            Reminder.owner_openid == owner_openid,
-                            Reminder.openid == assignment.assigned_openid,
-                            Reminder.reminder_time == reminder_time_stamp
-                        ).first()
-                        
-                        if assigned_reminder and assigned_reminder.enable_subscribe:
-                            openids_to_notify.add(assignment.assigned_openid)
-                            logger.info(f'添加被分配者到通知列表: {assignment.assigned_openid}')
-                    
-                    logger.info(f'需要发送提醒的用户数量: {len(openids_to_notify)}, 用户列表: {list(openids_to_notify)}')
-                    
-                    # 发送提醒给所有用户
-                    success_count = 0
-                    fail_count = 0
-                    refuse_count = 0  # 用户拒绝接受消息的数量
-                    
-                    for openid in openids_to_notify:
-                        # 发送订阅消息
-                        result = send_subscribe_message(
-                            openid=openid,
-                            template_id=TEMPLATE_ID,
-                            page='pages/index/index',
-                            data=template_data
-                        )
-                        
-                        logger.info(f'订阅消息发送结果 (openid={openid}): {result}')
-                        
-                        error_code = result.get('errcode')
-                        if error_code == 0:
-                            success_count += 1
-                            logger.info(f'✅ 提醒发送成功: openid={openid}')
-                        elif error_code == 43101:
-                            # 用户拒绝接受消息，这是正常的用户行为，不计入失败
-                            refuse_count += 1
-                            logger.info(f'ℹ️ 用户拒绝接受消息: openid={openid}（这是正常的用户选择）')
-                        else:
-                            fail_count += 1
-                            error_msg = result.get('errmsg', '未知错误')
-                            logger.error(f'❌ 提醒发送失败: openid={openid}, errcode={error_code}, errmsg={error_msg}')
-                    
-                    # 更新所有相关提醒的状态到数据库
-                    # 只要有成功发送的，就标记为 sent；如果全部失败（不包括用户拒绝），才标记为 failed
-                    # 用户拒绝接受消息（43101）不应该影响状态，因为这是用户的选择
-                    if success_count > 0 or (success_count == 0 and fail_count == 0 and refuse_count > 0):
-                        # 有成功发送的，或者只有用户拒绝的，都标记为 sent（因为已经尝试发送了）
-                        final_status = 'sent'
-                    else:
-                        # 只有真正的失败才标记为 failed
-                        final_status = 'failed'
-                    
-                    # 更新创建者的提醒状态
-                    if owner_reminder:
-                        owner_reminder.status = final_status
-                    
-                    # 更新所有被分配者的提醒状态
-                    for assignment in assignments:
-                        # 通过 owner_openid、openid 和 reminder_time 查找被分配者的提醒
-                        assigned_reminder = db.query(Reminder).filter(
-                            Reminder.owner_openid == owner_openid,
-                            Reminder.openid == assignment.assigned_openid,
-                            Reminder.reminder_time == reminder_time_stamp
-                        ).first()
-                        
-                        if assigned_reminder:
-                            assigned_reminder.status = final_status
-                    
-                    db.commit()
-                    logger.info(f'提醒发送完成: 成功={success_count}, 用户拒绝={refuse_count}, 失败={fail_count}')
-                    
-                except Exception as e:
-                    db.rollback()
-                    logger.error(f'发送提醒异常: ID={reminder["id"]}, 错误: {str(e)}', exc_info=True)
-                finally:
-                    db.close()
-            except Exception as e:
-                logger.error(f'发送提醒异常: ID={reminder["id"]}, 错误: {str(e)}', exc_info=True)
-        
-        # 确保调度器已初始化
-        global scheduler
-        if scheduler is None:
-            logger.warning('调度器未初始化，尝试初始化...')
-            init_app()
-            if scheduler is None:
-                logger.error('调度器初始化失败，无法安排提醒任务')
-                return
-        
-        # 添加定时任务
-        job_id = f"reminder_{reminder['id']}"
-        scheduler.add_job(
-            send_reminder,
-            trigger=DateTrigger(run_date=reminder_time),
-            id=job_id,
-            replace_existing=True
-        )
-        
-        # 验证任务是否添加成功
-        job = scheduler.get_job(job_id)
-        if job:
-            logger.info(f'✅ 已安排提醒任务: ID={reminder["id"]}, 任务ID={job_id}, 执行时间={reminder_time}, 当前时间={now}')
+        db.execute(statement, rows)
+        adjust_reminder_summaries(db, added=rows)
+        db.commit()
+    except Exception as add_error:
+        # 如果表不存在，尝试创建后重试
+        db.rollback()
+        if handle_table_error(add_error, "创建提醒"):
+            db.execute(statement, rows)
+            adjust_reminder_summaries(db, added=rows)
+            db.commit()
         else:
-            logger.error(f'❌ 任务添加失败: ID={reminder["id"]}, 任务ID={job_id}')
-            
-    except Exception as e:
-        logger.error(f'安排提醒任务异常: {str(e)}', exc_info=True)
+            raise add_error
 
 
 @app.route('/api/reminder', methods=['POST'])
@@ -947,66 +2940,23 @@ def create_reminder():
                     'errmsg': f'缺少必要字段: {field}'
                 }), 400
         
-        # 验证事项相关字段（thing1, thing4, time 至少有一个）
-        thing1 = data.get('thing1', data.get('title', ''))
-        thing4 = data.get('thing4', '')
-        time_str = data.get('time', '')
-        
-        if not thing1 or not thing4 or not time_str:
-            logger.warning(f'缺少事项字段: thing1={thing1}, thing4={thing4}, time={time_str}, 请求数据: {data}')
-            return jsonify({
-                'errcode': 400,
-                'errmsg': '缺少必要字段: thing1（事项主题）、thing4（事项描述）、time（事项时间）均为必填'
-            }), 400
-        
         # 创建提醒记录
         # 使用 openid + 创建时间戳（毫秒）作为唯一 ID，这样ID不会因为reminderTime改变而改变
         create_timestamp = int(datetime.now().timestamp() * 1000)  # 当前时间戳（毫秒）
         reminder_id = f"{data['openid']}_{create_timestamp}"
-        owner_openid = data['openid']  # 创建者就是当前用户
-        db = SessionLocal()
+        row, error = build_reminder_row(data, data['openid'], reminder_id)
+        if error:
+            logger.warning(f'提醒字段校验失败: {error}, 请求数据: {data}')
+            return jsonify({
+                'errcode': 400,
+                'errmsg': error
+            }), 400
+        enable_subscribe = row['enable_subscribe']
+        status = row['status']
+        
+        db = get_db()
         try:
-            try:
-                reminder = Reminder(
-                    id=reminder_id,
-                    openid=data['openid'],  # 当前拥有者
-                    owner_openid=owner_openid,  # 创建者
-                    title=thing1,  # 兼容字段，使用 thing1
-                    thing1=thing1,  # 事项主题
-                    thing4=thing4,  # 事项描述
-                    time=time_str,  # 事项时间
-                    reminder_time=data['reminderTime'],
-                    enable_subscribe=data.get('enableSubscribe', False),
-                    status='pending',
-                    completed=False,
-                    shared=False
-                )
-                db.add(reminder)
-                db.commit()
-            except Exception as add_error:
-                # 如果表不存在，尝试创建后重试
-                if handle_table_error(add_error, "创建提醒"):
-                    reminder = Reminder(
-                        id=reminder_id,
-                        openid=data['openid'],
-                        owner_openid=owner_openid,
-                        title=thing1,
-                        thing1=thing1,
-                        thing4=thing4,
-                        time=time_str,
-                        reminder_time=data['reminderTime'],
-                        enable_subscribe=data.get('enableSubscribe', False),
-                        status='pending',
-                        completed=False,
-                        shared=False
-                    )
-                    db.add(reminder)
-                    db.commit()
-                else:
-                    raise add_error
-            
-            # 转换为字典用于后续处理
-            reminder_dict = reminder.to_dict()
+            insert_reminder_rows(db, [row])
         except Exception as e:
             db.rollback()
             logger.error(f'保存提醒到数据库失败: {str(e)}')
@@ -1014,47 +2964,21 @@ def create_reminder():
                 'errcode': 500,
                 'errmsg': f'保存提醒失败: {str(e)}'
             }), 500
-        finally:
-            db.close()
-        
-        reminder = reminder_dict
         
-        # 如果开启了订阅，安排定时任务
-        if reminder['enableSubscribe'] and reminder['reminderTime']:
-            logger.info(f'提醒开启了订阅，开始安排定时任务: ID={reminder["id"]}')
-            schedule_reminder(reminder)
-            # 开启订阅时，status 保持 pending，等待定时任务执行后更新
+        # 如果开启了订阅，安排定时任务（status 保持 pending，等待定时任务执行后更新）
+        if status == 'pending':
+            logger.info(f'提醒开启了订阅，开始安排定时任务: ID={reminder_id}')
+            schedule_reminder({'id': reminder_id, 'reminderTime': data['reminderTime']})
         else:
-            # 未开启订阅时，根据提醒时间判断状态
-            db = SessionLocal()
-            try:
-                reminder_obj = db.query(Reminder).filter(Reminder.id == reminder['id']).first()
-                if reminder_obj:
-                    reminder_time = datetime.fromtimestamp(reminder['reminderTime'] / 1000)
-                    now = datetime.now()
-                    if reminder_time <= now:
-                        # 时间已过，设置为 expired
-                        reminder_obj.status = 'expired'
-                    else:
-                        # 时间未到，设置为 no_subscribe（未开启订阅但时间未到）
-                        reminder_obj.status = 'no_subscribe'
-                    db.commit()
-                    reminder_dict['status'] = reminder_obj.status
-            except Exception as e:
-                db.rollback()
-                logger.error(f'更新提醒状态失败: {str(e)}')
-            finally:
-                db.close()
-            
-            logger.info(f'提醒未开启订阅或没有提醒时间: enableSubscribe={reminder.get("enableSubscribe")}, reminderTime={reminder.get("reminderTime")}, status={reminder_dict.get("status")}')
+            logger.info(f'提醒未开启订阅或没有提醒时间: enableSubscribe={enable_subscribe}, reminderTime={data["reminderTime"]}, status={status}')
         
-        logger.info(f'✅ 创建提醒成功: ID={reminder["id"]}, 标题={reminder["title"]}, 提醒时间={reminder.get("time")}')
+        logger.info(f'✅ 创建提醒成功: ID={reminder_id}, 标题={row["thing1"]}, 提醒时间={row["time"]}')
         
         return jsonify({
             'errcode': 0,
             'errmsg': 'success',
             'data': {
-                'id': reminder['id']
+                'id': reminder_id
             }
         })
         
@@ -1066,6 +2990,92 @@ def create_reminder():
         }), 500
 
 
+@app.route('/api/reminders/batch', methods=['POST'])
+def create_reminders_batch():
+    """
+    批量创建提醒接口（导入用药计划、课程表等）
+    每条提醒的字段与 POST /api/reminder 相同；校验通过的提醒在同一个事务里一次插入，
+    未通过的逐条返回错误，不影响其余提醒
+    
+    请求体:
+    {
+        "openid": "用户openid",
+        "reminders": [
+            {"thing1": "...", "thing4": "...", "time": "...", "reminderTime": 时间戳(毫秒), "enableSubscribe": true/false},
+            ...
+        ]
+    }
+    
+    返回:
+    {
+        "created": 成功数量,
+        "results": [{"index": 0, "errcode": 0, "id": "..."}, {"index": 1, "errcode": 400, "errmsg": "..."}, ...]
+    }
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        openid = data.get('openid')
+        items = data.get('reminders')
+        if not openid:
+            return jsonify({'errcode': 400, 'errmsg': '缺少必要字段: openid'}), 400
+        if not isinstance(items, list) or not items:
+            return jsonify({'errcode': 400, 'errmsg': 'reminders 必须是非空数组'}), 400
+        if len(items) > REMINDER_BATCH_MAX:
+            return jsonify({
+                'errcode': 400,
+                'errmsg': f'单次最多创建 {REMINDER_BATCH_MAX} 条提醒'
+            }), 400
+        
+        logger.info(f'收到批量创建提醒请求: openid={openid}, 数量={len(items)}')
+        
+        # 同一批共用创建时间戳和随机批次号，用序号区分：{openid}_{创建时间戳}-{批次号}-{序号}
+        # 同一毫秒内的两次批量创建批次号不同，不会主键冲突；仍然可以按最后一个下划线取出 openid
+        create_timestamp = int(datetime.now().timestamp() * 1000)
+        batch_token = uuid.uuid4().hex[:8]
+        rows = []
+        results = []
+        for index, item in enumerate(items):
+            if not isinstance(item, dict):
+                results.append({'index': index, 'errcode': 400, 'errmsg': '提醒必须是对象'})
+                continue
+            row, error = build_reminder_row(item, openid, f"{openid}_{create_timestamp}-{batch_token}-{index}")
+            if error:
+                results.append({'index': index, 'errcode': 400, 'errmsg': error})
+                continue
+            rows.append(row)
+            results.append({'index': index, 'errcode': 0, 'id': row['id']})
+        
+        if rows:
+            db = get_db()
+            try:
+                insert_reminder_rows(db, rows)
+            except Exception as e:
+                db.rollback()
+                logger.error(f'批量保存提醒失败: {str(e)}')
+                return jsonify({
+                    'errcode': 500,
+                    'errmsg': f'保存提醒失败: {str(e)}'
+                }), 500
+            schedule_reminders([(row['id'], row['reminder_time']) for row in rows if row['status'] == 'pending'])
+        
+        logger.info(f'✅ 批量创建提醒完成: openid={openid}, 成功={len(rows)}, 失败={len(items) - len(rows)}')
+        return jsonify({
+            'errcode': 0,
+            'errmsg': 'success',
+            'data': {
+                'created': len(rows),
+                'results': results
+            }
+        })
+    
+    except Exception as e:
+        logger.error(f'批量创建提醒异常: {str(e)}', exc_info=True)
+        return jsonify({
+            'errcode': 500,
+            'errmsg': str(e)
+        }), 500
+
+
 @app.route('/api/reminder/<string:reminder_id>', methods=['GET', 'DELETE', 'PUT'])
 def reminder_detail(reminder_id):
     """
@@ -1074,23 +3084,23 @@ def reminder_detail(reminder_id):
     if request.method == 'GET':
         """获取提醒详情"""
         try:
-            db = SessionLocal()
-            try:
-                # 查找提醒
-                reminder = db.query(Reminder).filter(Reminder.id == reminder_id).first()
-                if not reminder:
-                    return jsonify({
-                        'errcode': 404,
-                        'errmsg': '提醒不存在'
-                    }), 404
-                
+            openid = reminder_id.rsplit('_', 1)[0]
+            db = get_read_db(openid)
+            # 查找提醒（刚写入过数据的用户跳过缓存，保证读己之写）
+            reminder = get_cached_reminder(
+                db, reminder_id, use_cache=not (wrote_recently(openid) or _client_wrote_recently())
+            )
+            if not reminder:
                 return jsonify({
-                    'errcode': 0,
-                    'errmsg': 'success',
-                    'data': reminder.to_dict()
-                })
-            finally:
-                db.close()
+                    'errcode': 404,
+                    'errmsg': '提醒不存在'
+                }), 404
+            
+            return jsonify({
+                'errcode': 0,
+                'errmsg': 'success',
+                'data': reminder
+            })
         except Exception as e:
             logger.error(f'获取提醒详情异常: {str(e)}')
             return jsonify({
@@ -1104,10 +3114,10 @@ def reminder_detail(reminder_id):
             data = request.json
             logger.info(f'收到更新提醒请求: ID={reminder_id}, data={data}')
             
-            db = SessionLocal()
+            db = get_db()
             try:
-                # 查找提醒
-                reminder = db.query(Reminder).filter(Reminder.id == reminder_id).first()
+                # 查找提醒（加锁：同一提醒的并发修改依次执行）
+                reminder = db.query(Reminder).filter(Reminder.id == reminder_id).with_for_update().first()
                 if not reminder:
                     return jsonify({
                         'errcode': 404,
@@ -1168,28 +3178,12 @@ def reminder_detail(reminder_id):
                     else:
                         reminder.status = 'no_subscribe'
                 
-                # 同步更新所有被分享的提醒副本
-                # 由于ID现在是基于openid_创建时间戳，不会因为reminderTime改变而改变
-                # 所以可以直接通过owner_openid和reminder_time查找所有被分享的提醒
-                # 如果reminderTime改变了，我们需要先通过原reminder_time查找，然后更新
-                
-                # 查找所有被分享的提醒（owner_openid相同，但openid不同）
-                # 如果reminderTime改变了，先通过原reminder_time查找
-                if 'reminderTime' in data and data['reminderTime'] != original_reminder_time:
-                    # reminderTime改变了，先通过原reminder_time查找所有被分享的提醒
-                    shared_reminders = db.query(Reminder).filter(
-                        Reminder.owner_openid == original_owner_openid,
-                        Reminder.openid != original_owner_openid,
-                        Reminder.reminder_time == original_reminder_time
-                    ).all()
-                else:
-                    # reminderTime未改变，直接通过当前reminder_time查找
-                    current_reminder_time = reminder.reminder_time
-                    shared_reminders = db.query(Reminder).filter(
-                        Reminder.owner_openid == original_owner_openid,
-                        Reminder.openid != original_owner_openid,
-                        Reminder.reminder_time == current_reminder_time
-                    ).all()
+                # 同步更新所有被分享的提醒副本（副本的 source_reminder_id 为原提醒ID，与 reminderTime 是否改变无关）
+                # 加锁读取：MySQL 可重复读下普通 SELECT 看不到刚提交的副本
+                shared_reminders = db.query(Reminder).filter(
+                    Reminder.owner_openid == original_owner_openid,
+                    Reminder.source_reminder_id == reminder_id
+                ).with_for_update().all()
                 
                 logger.info(f'找到 {len(shared_reminders)} 个被分享的提醒副本，开始同步更新')
                 
@@ -1233,7 +3227,13 @@ def reminder_detail(reminder_id):
                     
                     logger.info(f'已同步更新被分享的提醒: ID={shared_reminder.id}, openid={shared_reminder.openid}')
                 
+                if 'reminderTime' in data and data['reminderTime'] != original_reminder_time:
+                    # 提醒时间改变，下一条提醒需要重新计算
+                    reset_reminder_summaries(
+                        db, [reminder.openid, *(shared_reminder.openid for shared_reminder in shared_reminders)], counts=False
+                    )
                 db.commit()
+                invalidate_cached_reminders(reminder_id, *(shared_reminder.id for shared_reminder in shared_reminders))
                 
                 logger.info(f'更新提醒成功: ID={reminder_id}, 同步更新了 {len(shared_reminders)} 个被分享的提醒')
                 
@@ -1245,8 +3245,6 @@ def reminder_detail(reminder_id):
             except Exception as e:
                 db.rollback()
                 raise e
-            finally:
-                db.close()
         except Exception as e:
             logger.error(f'更新提醒异常: {str(e)}')
             return jsonify({
@@ -1264,7 +3262,7 @@ def delete_reminder(reminder_id):
     删除提醒接口
     """
     try:
-        db = SessionLocal()
+        db = get_db()
         try:
             # 查找提醒
             reminder = db.query(Reminder).filter(Reminder.id == reminder_id).first()
@@ -1283,14 +3281,12 @@ def delete_reminder(reminder_id):
             
             # 保存信息用于删除被分享的提醒
             owner_openid = reminder.owner_openid
-            reminder_time = reminder.reminder_time
             
-            # 查找所有被分享的提醒（通过owner_openid和reminder_time）
+            # 查找所有被分享的提醒（副本的 source_reminder_id 为原提醒ID）
             shared_reminders = db.query(Reminder).filter(
                 Reminder.owner_openid == owner_openid,
-                Reminder.openid != owner_openid,
-                Reminder.reminder_time == reminder_time
-            ).all()
+                Reminder.source_reminder_id == reminder_id
+            ).with_for_update().all()
             
             logger.info(f'找到 {len(shared_reminders)} 个被分享的提醒，将一并删除')
             
@@ -1326,103 +3322,383 @@ def delete_reminder(reminder_id):
                     pass
             
             # 删除原提醒
+            adjust_reminder_summaries(db, removed=[reminder, *shared_reminders])
             db.delete(reminder)
             db.commit()
+            invalidate_cached_reminders(reminder_id, *(shared_reminder.id for shared_reminder in shared_reminders))
             
             logger.info(f'删除提醒成功: {reminder_id}, 同时删除了 {len(shared_reminders)} 个被分享的提醒和 {len(assignments)} 个分配记录')
             
             return jsonify({
-                'errcode': 0,
-                'errmsg': 'success'
-            })
-        except Exception as e:
-            db.rollback()
-            raise e
-        finally:
-            db.close()
+                'errcode': 0,
+                'errmsg': 'success'
+            })
+        except Exception as e:
+            db.rollback()
+            raise e
+        
+    except Exception as e:
+        logger.error(f'删除提醒异常: {str(e)}')
+        return jsonify({
+            'errcode': 500,
+            'errmsg': str(e)
+        }), 500
+
+
+@app.route('/api/reminders', methods=['GET', 'OPTIONS'])
+def get_reminders():
+    """
+    获取用户的提醒列表（包括自己创建的和被分配的）
+    """
+    # 处理 OPTIONS 预检请求
+    if request.method == 'OPTIONS':
+        response = jsonify({'errcode': 0})
+        response.headers.add('Access-Control-Allow-Origin', '*')
+        response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization')
+        response.headers.add('Access-Control-Allow-Methods', 'GET,POST,PUT,DELETE,OPTIONS')
+        return response
+    
+    try:
+        logger.info(f'收到获取提醒列表请求: {request.args}')
+        openid = request.args.get('openid')
+        if not openid:
+            logger.warning('缺少 openid 参数')
+            return jsonify({
+                'errcode': 400,
+                'errmsg': '缺少 openid 参数'
+            }), 400
+        
+        db = get_read_db(openid)
+        # 查询用户拥有的提醒列表（openid匹配，包括自己创建的和被分配的）
+        # fromOwner：owner_openid != openid 说明是被分享的提醒
+        statement = select(*REMINDER_LIST_COLUMNS).where(
+            Reminder.openid == openid
+        ).order_by(Reminder.create_time.desc())
+        try:
+            user_reminders = fetch_reminder_rows(db, statement)
+        except Exception as query_error:
+            # 如果表不存在，尝试创建后重试
+            if handle_table_error(query_error, "获取提醒列表"):
+                user_reminders = fetch_reminder_rows(db, statement)
+            else:
+                raise query_error
+        
+        return json_response({
+            'errcode': 0,
+            'errmsg': 'success',
+            'data': user_reminders
+        })
+        
+    except Exception as e:
+        logger.error(f'获取提醒列表异常: {str(e)}')
+        return jsonify({
+            'errcode': 500,
+            'errmsg': str(e)
+        }), 500
+
+
+@app.route('/api/reminders/summary', methods=['GET'])
+def get_reminder_summary():
+    """
+    获取用户的提醒汇总（首页统计），不需要下载整个列表
+    
+    查询参数:
+    openid: 用户openid
+    
+    返回:
+    {
+        "total": 提醒总数, "completed": 已完成, "pending": 未完成, "shared": 来自好友分享的数量,
+        "nextReminderId": 下一条未完成提醒的ID, "nextReminderTime": 下一条提醒时间（毫秒时间戳，没有时为 null）
+    }
+    """
+    try:
+        openid = request.args.get('openid')
+        if not openid:
+            return jsonify({
+                'errcode': 400,
+                'errmsg': '缺少 openid 参数'
+            }), 400
+        # 汇总在主库上增量维护，从主库读取（主键读取，代价与提醒数量无关）
+        db = get_db()
+        return jsonify({
+            'errcode': 0,
+            'errmsg': 'success',
+            'data': load_reminder_summary(db, openid)
+        })
+    except Exception as e:
+        logger.error(f'获取提醒汇总异常: {str(e)}', exc_info=True)
+        return jsonify({
+            'errcode': 500,
+            'errmsg': str(e)
+        }), 500
+
+
+# 日历范围查询：时间窗口最多的天数、一次最多返回的提醒数量
+RANGE_MAX_DAYS = int(os.getenv('RANGE_MAX_DAYS', '400'))
+RANGE_LIMIT_MAX = int(os.getenv('RANGE_LIMIT_MAX', '1000'))
+DAY_MS = 86400 * 1000
+
+
+@app.route('/api/reminders/range', methods=['GET'])
+def get_reminders_in_range():
+    """
+    按提醒时间范围查询用户的提醒（日历视图），走 (openid, reminder_time) 索引，只读取窗口内的行
+    
+    查询参数:
+    openid: 用户openid
+    from, to: 提醒时间窗口 [from, to)，毫秒时间戳
+    days: 为 1 时返回窗口内每天的提醒数量（月视图）
+    tzOffset: 按天统计使用的时区，UTC 偏移分钟数（默认服务器时区，东八区为 480）
+    limit: 最多返回的提醒数量（默认且最多 RANGE_LIMIT_MAX，为 0 时只返回每天的数量）
+    
+    返回:
+    {
+        "reminders": [...按提醒时间排序，字段与提醒列表相同],
+        "truncated": 是否因 limit 截断,
+        "days": [{"date": "2024-01-05", "count": 3}, ...]（days=1 时）
+    }
+    """
+    try:
+        openid = request.args.get('openid')
+        if not openid:
+            return jsonify({
+                'errcode': 400,
+                'errmsg': '缺少 openid 参数'
+            }), 400
+        start_ms = int_arg('from')
+        end_ms = int_arg('to')
+        if start_ms is None or end_ms is None:
+            raise ValueError('缺少必要参数: from, to（毫秒时间戳）')
+        if end_ms <= start_ms:
+            raise ValueError('to 必须大于 from')
+        if end_ms - start_ms > RANGE_MAX_DAYS * DAY_MS:
+            raise ValueError(f'时间窗口最多 {RANGE_MAX_DAYS} 天')
+        limit = int_arg('limit', RANGE_LIMIT_MAX)
+        if limit < 0:
+            raise ValueError('参数 limit 不能小于 0')
+        limit = min(limit, RANGE_LIMIT_MAX)
+        
+        db = get_read_db(openid)
+        in_range = (
+            Reminder.openid == openid,
+            Reminder.reminder_time >= start_ms,
+            Reminder.reminder_time < end_ms,
+        )
+        data = {}
+        if limit:
+            reminders_list = fetch_reminder_rows(db, select(*REMINDER_LIST_COLUMNS).where(*in_range).order_by(
+                Reminder.reminder_time, Reminder.id
+            ).limit(limit + 1))
+            data['truncated'] = len(reminders_list) > limit
+            data['reminders'] = reminders_list[:limit]
+        
+        if request.args.get('days') == '1':
+            tz_offset_minutes = int_arg('tzOffset')
+            if tz_offset_minutes is None:
+                tz_offset_minutes = int(datetime.now().astimezone().utcoffset().total_seconds() // 60)
+            # 按本地日期分组：(提醒时间 + 时区偏移) 整除一天的毫秒数 = 1970-01-01 以来的天数
+            # 只用到 openid 和 reminder_time，MySQL 可以只扫描索引
+            day_number = ((Reminder.reminder_time + tz_offset_minutes * 60 * 1000) // DAY_MS).label('day')
+            rows = db.execute(
+                select(day_number, func.count()).where(*in_range).group_by(day_number).order_by(day_number)
+            ).all()
+            epoch = date(1970, 1, 1)
+            data['days'] = [
+                {'date': (epoch + timedelta(days=int(day))).isoformat(), 'count': count}
+                for day, count in rows
+            ]
         
+        return json_response({
+            'errcode': 0,
+            'errmsg': 'success',
+            'data': data
+        })
+    except ValueError as e:
+        return jsonify({
+            'errcode': 400,
+            'errmsg': str(e)
+        }), 400
     except Exception as e:
-        logger.error(f'删除提醒异常: {str(e)}')
+        logger.error(f'按时间范围获取提醒异常: {str(e)}', exc_info=True)
         return jsonify({
             'errcode': 500,
             'errmsg': str(e)
         }), 500
 
 
-@app.route('/api/reminders', methods=['GET', 'OPTIONS'])
-def get_reminders():
+# 搜索：每页默认/最多返回的提醒数量，关键词长度和个数限制
+SEARCH_PAGE_SIZE = int(os.getenv('SEARCH_PAGE_SIZE', '20'))
+SEARCH_PAGE_MAX = int(os.getenv('SEARCH_PAGE_MAX', '100'))
+SEARCH_QUERY_MAX_CHARS = 50
+SEARCH_MAX_TERMS = 5
+# 能走全文索引的最短关键词：MySQL 为 ngram_token_size（默认 2），SQLite trigram 为 3；更短的关键词按 LIKE 扫描该用户的提醒
+SEARCH_NGRAM_TOKEN_SIZE = int(os.getenv('SEARCH_NGRAM_TOKEN_SIZE', '2'))
+SQLITE_TRIGRAM_SIZE = 3
+
+
+def search_index_ready(db):
+    """检查当前会话连接的数据库是否已创建全文检索索引"""
+    bind = db.get_bind()
+    ready = _search_index_ready.get(bind)
+    if ready is None:
+        if bind.dialect.name == 'mysql':
+            ready = SEARCH_INDEX_NAME in {index['name'] for index in inspect(bind).get_indexes('reminders')}
+        elif bind.dialect.name == 'sqlite':
+            ready = db.execute(
+                text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"), {'name': SEARCH_FTS_TABLE}
+            ).first() is not None
+        else:
+            ready = False
+        _search_index_ready[bind] = ready
+    return ready
+
+
+def reminder_search_condition(db, terms):
     """
-    获取用户的提醒列表（包括自己创建的和被分配的）
+    关键词匹配条件：每个关键词都要出现在 thing1 或 thing4 中（子串匹配，不区分大小写）
+    有全文索引且关键词足够长时走索引，否则退化为 LIKE（调用方同时按 openid 过滤，只扫描该用户的提醒）
+    """
+    if search_index_ready(db):
+        dialect = db.get_bind().dialect.name
+        if dialect == 'mysql':
+            # 布尔模式下每个关键词作为必须出现的短语（ngram 相邻），等价于子串匹配
+            phrases = [term.replace('"', '') for term in terms]
+            if min(len(phrase) for phrase in phrases) >= SEARCH_NGRAM_TOKEN_SIZE:
+                against = ' '.join(f'+"{phrase}"' for phrase in phrases)
+                return mysql.match(Reminder.thing1, Reminder.thing4, against=against).in_boolean_mode()
+        elif dialect == 'sqlite' and min(len(term) for term in terms) >= SQLITE_TRIGRAM_SIZE:
+            query = ' '.join('"{}"'.format(term.replace('"', '""')) for term in terms)
+            return text(
+                f"reminders.rowid IN (SELECT rowid FROM {SEARCH_FTS_TABLE} WHERE {SEARCH_FTS_TABLE} MATCH :search_query)"
+            ).bindparams(search_query=query)
+    return and_(*(
+        or_(Reminder.thing1.contains(term, autoescape=True), Reminder.thing4.contains(term, autoescape=True))
+        for term in terms
+    ))
+
+
+@app.route('/api/reminders/search', methods=['GET'])
+def search_reminders():
+    """
+    按关键词搜索用户的提醒（事项主题 thing1、事项描述 thing4），不需要下载整个列表
+
+    查询参数:
+    openid: 用户openid
+    q: 关键词，多个关键词用空格分隔（需要同时出现）
+    limit: 每页数量（默认 SEARCH_PAGE_SIZE，最多 SEARCH_PAGE_MAX）
+    cursor: 上一页返回的 nextCursor
+
+    返回:
+    {
+        "reminders": [...按提醒时间倒序，字段与提醒列表相同],
+        "nextCursor": 下一页游标（没有更多时为 null）
+    }
     """
-    # 处理 OPTIONS 预检请求
-    if request.method == 'OPTIONS':
-        response = jsonify({'errcode': 0})
-        response.headers.add('Access-Control-Allow-Origin', '*')
-        response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization')
-        response.headers.add('Access-Control-Allow-Methods', 'GET,POST,PUT,DELETE,OPTIONS')
-        return response
-    
     try:
-        logger.info(f'收到获取提醒列表请求: {request.args}')
         openid = request.args.get('openid')
         if not openid:
-            logger.warning('缺少 openid 参数')
             return jsonify({
                 'errcode': 400,
                 'errmsg': '缺少 openid 参数'
             }), 400
-        
-        db = SessionLocal()
-        try:
-            # 查询用户拥有的提醒列表（openid匹配，包括自己创建的和被分配的）
+        query = (request.args.get('q') or '').strip()
+        if not query:
+            raise ValueError('缺少搜索关键词 q')
+        if len(query) > SEARCH_QUERY_MAX_CHARS:
+            raise ValueError(f'搜索关键词最多 {SEARCH_QUERY_MAX_CHARS} 个字符')
+        terms = query.split()
+        if len(terms) > SEARCH_MAX_TERMS:
+            raise ValueError(f'最多 {SEARCH_MAX_TERMS} 个关键词')
+        limit = int_arg('limit', SEARCH_PAGE_SIZE)
+        if limit <= 0:
+            raise ValueError('参数 limit 必须大于 0')
+        limit = min(limit, SEARCH_PAGE_MAX)
+
+        db = get_read_db(openid)
+        conditions = [Reminder.openid == openid, reminder_search_condition(db, terms)]
+        cursor = request.args.get('cursor')
+        if cursor:
+            # 游标为上一页最后一条的 "{reminderTime}:{id}"
+            cursor_time, _, cursor_id = cursor.partition(':')
             try:
-                reminders = db.query(Reminder).filter(
-                    Reminder.openid == openid
-                ).order_by(Reminder.create_time.desc()).all()
-            except Exception as query_error:
-                # 如果表不存在，尝试创建后重试
-                if handle_table_error(query_error, "获取提醒列表"):
-                    reminders = db.query(Reminder).filter(
-                        Reminder.openid == openid
-                    ).order_by(Reminder.create_time.desc()).all()
-                else:
-                    raise query_error
-            
-            # 转换为字典列表
-            user_reminders = []
-            for r in reminders:
-                reminder_dict = r.to_dict()
-                # 标记来自分享的提醒
-                # 判断逻辑：
-                # 1. 如果 owner_openid == openid，说明是自己创建的提醒，fromOwner = False
-                # 2. 如果 owner_openid != openid，说明是被分享的提醒，fromOwner = True
-                # 这是最核心的判断逻辑，简单且可靠
-                if r.owner_openid == r.openid:
-                    # 自己创建的提醒，明确设置 fromOwner = False
-                    reminder_dict['fromOwner'] = False
-                    logger.debug(f'自己创建的提醒: id={r.id}, owner={r.owner_openid}, openid={r.openid}')
-                else:
-                    # 被分享的提醒，设置 fromOwner = True
-                    reminder_dict['fromOwner'] = True
-                    logger.debug(f'来自分享的提醒: id={r.id}, owner={r.owner_openid}, openid={r.openid}')
-                user_reminders.append(reminder_dict)
-            
-            return jsonify({
-                'errcode': 0,
-                'errmsg': 'success',
-                'data': user_reminders
-            })
-        finally:
-            db.close()
-        
+                cursor_time = int(cursor_time)
+            except ValueError:
+                raise ValueError(f'cursor 格式错误: {cursor}')
+            conditions.append(or_(
+                Reminder.reminder_time < cursor_time,
+                and_(Reminder.reminder_time == cursor_time, Reminder.id < cursor_id),
+            ))
+        reminders_list = fetch_reminder_rows(db, select(*REMINDER_LIST_COLUMNS).where(*conditions).order_by(
+            Reminder.reminder_time.desc(), Reminder.id.desc()
+        ).limit(limit + 1))
+
+        next_cursor = None
+        if len(reminders_list) > limit:
+            reminders_list = reminders_list[:limit]
+            last = reminders_list[-1]
+            next_cursor = f"{last['reminderTime']}:{last['id']}"
+
+        return json_response({
+            'errcode': 0,
+            'errmsg': 'success',
+            'data': {
+                'reminders': reminders_list,
+                'nextCursor': next_cursor
+            }
+        })
+    except ValueError as e:
+        return jsonify({
+            'errcode': 400,
+            'errmsg': str(e)
+        }), 400
     except Exception as e:
-        logger.error(f'获取提醒列表异常: {str(e)}')
+        logger.error(f'搜索提醒异常: {str(e)}', exc_info=True)
         return jsonify({
             'errcode': 500,
             'errmsg': str(e)
         }), 500
 
 
+@app.route('/api/reminders/export', methods=['GET'])
+def export_reminders():
+    """
+    流式导出用户的提醒（大量历史数据，内存占用与行数无关）
+    
+    查询参数:
+    openid: 用户openid
+    format: ndjson（默认，每行一个 JSON 对象）或 csv
+    """
+    openid = request.args.get('openid')
+    fmt = request.args.get('format', 'ndjson')
+    if not openid:
+        return jsonify({
+            'errcode': 400,
+            'errmsg': '缺少必要参数: openid'
+        }), 400
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({
+            'errcode': 400,
+            'errmsg': f'不支持的导出格式: {fmt}，可选 {", ".join(EXPORT_FORMATS)}'
+        }), 400
+    
+    # 响应体在请求处理函数返回后才开始生成，使用独立会话，导出结束时关闭
+    db = read_session(openid)
+    
+    def generate():
+        try:
+            yield from iter_reminder_export(db, openid, fmt)
+        except Exception as e:
+            logger.error(f'导出提醒异常: openid={openid}, {str(e)}', exc_info=True)
+            raise
+        finally:
+            db.close()
+    
+    logger.info(f'开始导出提醒: openid={openid}, format={fmt}')
+    response = app.response_class(generate(), mimetype=EXPORT_FORMATS[fmt])
+    response.headers['Content-Disposition'] = f'attachment; filename=reminders.{fmt}'
+    return response
+
+
 @app.route('/api/reminder/<string:reminder_id>/complete', methods=['PUT'])
 def update_reminder_complete(reminder_id):
     """
@@ -1437,7 +3713,7 @@ def update_reminder_complete(reminder_id):
         data = request.json
         completed = data.get('completed', False)
         
-        db = SessionLocal()
+        db = get_db()
         try:
             # 查找提醒
             reminder = db.query(Reminder).filter(Reminder.id == reminder_id).first()
@@ -1448,8 +3724,13 @@ def update_reminder_complete(reminder_id):
                 }), 404
             
             # 更新完成状态
+            if bool(reminder.completed) != bool(completed):
+                before = {'id': reminder.id, 'openid': reminder.openid, 'owner_openid': reminder.owner_openid,
+                          'completed': reminder.completed, 'reminder_time': reminder.reminder_time}
+                adjust_reminder_summaries(db, added=[dict(before, completed=completed)], removed=[before])
             reminder.completed = completed
             db.commit()
+            invalidate_cached_reminders(reminder_id)
             
             logger.info(f'更新提醒完成状态成功: ID={reminder_id}, completed={completed}')
             
@@ -1461,8 +3742,6 @@ def update_reminder_complete(reminder_id):
         except Exception as e:
             db.rollback()
             raise e
-        finally:
-            db.close()
         
     except Exception as e:
         logger.error(f'更新提醒完成状态异常: {str(e)}')
@@ -1472,6 +3751,175 @@ def update_reminder_complete(reminder_id):
         }), 500
 
 
+# 批量更新接口可以修改的字段（请求字段 -> 数据库列），修改提醒时间或订阅状态需要重新安排任务，仍走单条更新接口
+BATCH_UPDATE_FIELDS = {
+    'completed': ('completed',),
+    'thing1': ('thing1', 'title'),  # 同时更新兼容字段
+    'thing4': ('thing4',),
+    'time': ('time',),
+}
+
+
+@app.route('/api/reminders/batch', methods=['PUT'])
+def update_reminders_batch():
+    """
+    批量更新提醒接口（一次勾选/修改多条提醒）
+    
+    相同修改内容的提醒合并成一条 UPDATE ... WHERE id IN (...)，权限条件写在 WHERE 中：
+    - 只能修改 openid 为当前用户的提醒
+    - 修改 thing1/thing4/time 时还要求是创建者（与单条更新一致，不能修改他人分享的提醒），
+      并同步到被分享的副本
+    
+    请求体:
+    {
+        "openid": "用户openid",
+        "updates": [
+            {"id": "提醒ID", "completed": true},
+            {"id": "提醒ID", "thing1": "新主题", "time": "明天 10:00"}
+        ]
+    }
+    
+    返回:
+    {
+        "updated": 成功数量,
+        "results": [{"id": "...", "errcode": 0}, {"id": "...", "errcode": 403, "errmsg": "..."}, ...]
+    }
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        openid = data.get('openid')
+        updates = data.get('updates')
+        if not openid:
+            return jsonify({'errcode': 400, 'errmsg': '缺少必要字段: openid'}), 400
+        if not isinstance(updates, list) or not updates:
+            return jsonify({'errcode': 400, 'errmsg': 'updates 必须是非空数组'}), 400
+        if len(updates) > REMINDER_BATCH_MAX:
+            return jsonify({
+                'errcode': 400,
+                'errmsg': f'单次最多更新 {REMINDER_BATCH_MAX} 条提醒'
+            }), 400
+        
+        logger.info(f'收到批量更新提醒请求: openid={openid}, 数量={len(updates)}')
+        
+        # 按修改内容分组，同一组只需要一条 UPDATE
+        results = []
+        pending = {}
+        groups = {}
+        for item in updates:
+            reminder_id = item.get('id') if isinstance(item, dict) else None
+            if not isinstance(reminder_id, str) or not reminder_id:
+                results.append({'id': reminder_id, 'errcode': 400, 'errmsg': '缺少提醒ID'})
+                continue
+            if reminder_id in pending:
+                results.append({'id': reminder_id, 'errcode': 400, 'errmsg': '重复的提醒ID'})
+                continue
+            unsupported = sorted(key for key in item if key != 'id' and key not in BATCH_UPDATE_FIELDS)
+            if unsupported:
+                results.append({
+                    'id': reminder_id,
+                    'errcode': 400,
+                    'errmsg': f'批量接口不支持修改 {", ".join(unsupported)}，请使用单条更新接口'
+                })
+                continue
+            if any(not isinstance(item[key], str) for key in item if key not in ('id', 'completed')):
+                results.append({'id': reminder_id, 'errcode': 400, 'errmsg': 'thing1、thing4、time 必须是字符串'})
+                continue
+            changes = tuple(sorted(
+                (key, bool(value) if key == 'completed' else value)
+                for key, value in item.items() if key != 'id'
+            ))
+            if not changes:
+                results.append({'id': reminder_id, 'errcode': 400, 'errmsg': '没有需要修改的字段'})
+                continue
+            outcome = {'id': reminder_id, 'errcode': 0}
+            results.append(outcome)
+            pending[reminder_id] = outcome
+            groups.setdefault(changes, []).append(reminder_id)
+        
+        db = get_db()
+        try:
+            shortfall = []
+            copy_ids = []
+            for changes, ids in groups.items():
+                values = {}
+                for key, value in changes:
+                    for column in BATCH_UPDATE_FIELDS[key]:
+                        values[column] = value
+                edits_content = any(key != 'completed' for key, _ in changes)
+                conditions = [Reminder.id.in_(ids), Reminder.openid == openid]
+                if edits_content:
+                    conditions.append(Reminder.owner_openid == openid)
+                
+                matched = db.execute(Reminder.__table__.update().where(*conditions).values(**values)).rowcount
+                if matched < len(ids):
+                    shortfall.extend(ids)
+                
+                if edits_content:
+                    # 被分享的副本通过 source_reminder_id 关联原提醒（与单条更新一致），只同步内容字段，完成状态各自独立
+                    # owner_openid == openid 保证只同步该用户自己创建的提醒的副本；加锁读取，能看到刚提交的副本
+                    copy_conditions = (
+                        Reminder.owner_openid == openid,
+                        Reminder.openid != openid,
+                        Reminder.source_reminder_id.in_(ids)
+                    )
+                    group_copy_ids = [row[0] for row in db.query(Reminder.id).filter(*copy_conditions).with_for_update()]
+                    if group_copy_ids:
+                        copy_values = {column: value for column, value in values.items() if column != 'completed'}
+                        db.execute(Reminder.__table__.update().where(*copy_conditions).values(**copy_values))
+                        copy_ids.extend(group_copy_ids)
+            
+            # 有提醒没有被更新时，查一次区分「不存在」和「无权限」（权限已由 WHERE 条件保证，这里只用于返回结果）
+            found = {}
+            if shortfall:
+                found = {
+                    row.id: row for row in db.query(
+                        Reminder.id, Reminder.openid, Reminder.owner_openid
+                    ).filter(Reminder.id.in_(shortfall))
+                }
+            if any(key == 'completed' for changes in groups for key, _ in changes):
+                # 批量修改完成状态不逐条计算增量，汇总在下次读取时重建
+                reset_reminder_summaries(db, [openid])
+            db.commit()
+            invalidate_cached_reminders(*pending, *copy_ids)
+        except Exception as e:
+            db.rollback()
+            logger.error(f'批量更新提醒失败: {str(e)}')
+            return jsonify({
+                'errcode': 500,
+                'errmsg': f'批量更新提醒失败: {str(e)}'
+            }), 500
+        
+        content_ids = {reminder_id for changes, ids in groups.items()
+                       if any(key != 'completed' for key, _ in changes) for reminder_id in ids}
+        for reminder_id in shortfall:
+            row = found.get(reminder_id)
+            outcome = pending[reminder_id]
+            if row is None:
+                outcome.update(errcode=404, errmsg='提醒不存在')
+            elif row.openid != openid:
+                outcome.update(errcode=403, errmsg='无权修改该提醒')
+            elif reminder_id in content_ids and row.owner_openid != openid:
+                outcome.update(errcode=403, errmsg='不能修改他人分享的提醒')
+        updated = sum(1 for outcome in pending.values() if outcome['errcode'] == 0)
+        
+        logger.info(f'✅ 批量更新提醒完成: openid={openid}, 成功={updated}, 失败={len(results) - updated}')
+        return jsonify({
+            'errcode': 0,
+            'errmsg': 'success',
+            'data': {
+                'updated': updated,
+                'results': results
+            }
+        })
+    
+    except Exception as e:
+        logger.error(f'批量更新提醒异常: {str(e)}', exc_info=True)
+        return jsonify({
+            'errcode': 500,
+            'errmsg': str(e)
+        }), 500
+
+
 @app.route('/api/auth/login', methods=['POST', 'OPTIONS'])
 def login():
     """
@@ -1525,7 +3973,7 @@ def login():
             }), 500
         
         # 调用微信接口换取 openid
-        url = 'https://api.weixin.qq.com/sns/jscode2session'
+        url = f'{WX_API_BASE}/sns/jscode2session'
         params = {
             'appid': APPID,
             'secret': APPSECRET,
@@ -1536,9 +3984,13 @@ def login():
         logger.info(f'调用微信接口换取 openid: appid={APPID}, code={code[:10]}...')
         
         try:
-            response = requests.get(url, params=params, timeout=10)
-            response.raise_for_status()  # 检查 HTTP 状态码
-            result = response.json()
+            result = wx_request('login', 'GET', url, params=params)
+        except WxCircuitOpenError:
+            logger.warning('微信登录接口熔断中，直接返回')
+            return jsonify({
+                'errcode': 503,
+                'errmsg': '微信服务暂时不可用，请稍后重试'
+            }), 503
         except requests.exceptions.Timeout:
             logger.error('调用微信接口超时')
             return jsonify({
@@ -1591,31 +4043,156 @@ def health_check():
     })
 
 
+# 调试列表接口：默认每页条数和上限，避免一次请求读出整张表或全部定时任务
+DEBUG_PAGE_SIZE = int(os.getenv('DEBUG_PAGE_SIZE', '50'))
+DEBUG_PAGE_MAX = int(os.getenv('DEBUG_PAGE_MAX', '500'))
+# 调试列表接口流式输出（format=ndjson）最多返回的行数
+DEBUG_STREAM_MAX_ROWS = int(os.getenv('DEBUG_STREAM_MAX_ROWS', '100000'))
+# 暂停的任务没有下次执行时间，排序时排在最后
+PAUSED_JOB_DUE_MS = 2 ** 63 - 1
+
+
+def debug_list_args():
+    """
+    解析调试列表接口的通用查询参数
+    
+    limit: 每页条数（默认 DEBUG_PAGE_SIZE，最多 DEBUG_PAGE_MAX）
+    cursor: 上一页响应中的 nextCursor
+    openid: 只看该用户的提醒/任务
+    dueFrom, dueTo: 提醒时间窗口 [dueFrom, dueTo)，毫秒时间戳
+    format: json（分页，默认）或 ndjson（流式输出全部匹配项，最多 DEBUG_STREAM_MAX_ROWS 行）
+    """
+    limit = int_arg('limit', DEBUG_PAGE_SIZE)
+    if limit <= 0:
+        raise ValueError('参数 limit 必须大于 0')
+    fmt = request.args.get('format', 'json')
+    if fmt not in ('json', 'ndjson'):
+        raise ValueError(f'不支持的格式: {fmt}，可选 json, ndjson')
+    return {
+        'limit': min(limit, DEBUG_PAGE_MAX),
+        'cursor': request.args.get('cursor') or None,
+        'openid': request.args.get('openid') or None,
+        'due_from': int_arg('dueFrom'),
+        'due_to': int_arg('dueTo'),
+        'format': fmt,
+    }
+
+
+def ndjson_response(lines):
+    """流式返回 NDJSON（lines 为逐行生成的字节）"""
+    return app.response_class(lines, mimetype=EXPORT_FORMATS['ndjson'])
+
+
+def job_sort_key(job):
+    """定时任务的分页键 (下次执行时间毫秒, 任务ID)"""
+    if job.next_run_time is None:
+        return (PAUSED_JOB_DUE_MS, job.id)
+    return (int(job.next_run_time.timestamp() * 1000), job.id)
+
+
+def job_to_dict(job):
+    return {
+        'id': job.id,
+        'name': job.name,
+        'next_run_time': str(job.next_run_time) if job.next_run_time else None,
+        'trigger': str(job.trigger)
+    }
+
+
 @app.route('/api/debug/jobs', methods=['GET'])
 def get_scheduled_jobs():
     """
-    查看所有定时任务（调试用）
+    分页查看定时任务（调试用），按下次执行时间排序
+    
+    查询参数见 debug_list_args，openid 过滤该用户的提醒任务，dueFrom/dueTo 过滤下次执行时间
+    第一页之后用响应中的 nextCursor 翻页；summary 为所有匹配任务的汇总
     """
     try:
-        jobs = scheduler.get_jobs()
-        job_list = []
-        for job in jobs:
-            job_list.append({
-                'id': job.id,
-                'name': job.name,
-                'next_run_time': str(job.next_run_time) if job.next_run_time else None,
-                'trigger': str(job.trigger)
+        args = debug_list_args()
+        if scheduler is None:
+            return jsonify({
+                'errcode': 0,
+                'errmsg': 'success',
+                'data': {
+                    'total': 0,
+                    'jobs': [],
+                    'nextCursor': None,
+                    'scheduler_running': False,
+                    'dispatch_mode': DISPATCH_MODE
+                }
             })
         
+        after = None
+        if args['cursor']:
+            due_ms, _, job_id = args['cursor'].partition(':')
+            try:
+                after = (int(due_ms), job_id)
+            except ValueError:
+                raise ValueError(f'无效的 cursor: {args["cursor"]}')
+        prefix = f"reminder_{args['openid']}_" if args['openid'] else None
+        due_from = args['due_from']
+        due_to = args['due_to']
+        now_ms = int(time.time() * 1000)
+        summary = {'reminderJobs': 0, 'otherJobs': 0, 'overdue': 0, 'paused': 0}
+        
+        def matching_jobs():
+            # get_jobs() 只返回已在内存中的任务引用，这里只序列化当前页，不为全部任务生成字典
+            for job in scheduler.get_jobs():
+                if prefix and not job.id.startswith(prefix):
+                    continue
+                key = job_sort_key(job)
+                if due_from is not None and key[0] < due_from:
+                    continue
+                if due_to is not None and key[0] >= due_to:
+                    continue
+                yield key, job
+        
+        if args['format'] == 'ndjson':
+            def generate():
+                for count, (_, job) in enumerate(matching_jobs()):
+                    if count >= DEBUG_STREAM_MAX_ROWS:
+                        break
+                    yield app.json.dumps_bytes(job_to_dict(job)) + b'\n'
+            return ndjson_response(generate())
+        
+        def count_and_page():
+            # 一次遍历同时统计汇总和挑出下一页（只保留 limit + 1 个候选）
+            for key, job in matching_jobs():
+                if job.id.startswith('reminder_'):
+                    summary['reminderJobs'] += 1
+                else:
+                    summary['otherJobs'] += 1
+                if key[0] == PAUSED_JOB_DUE_MS:
+                    summary['paused'] += 1
+                elif key[0] <= now_ms:
+                    summary['overdue'] += 1
+                if after is None or key > after:
+                    yield key, job
+        
+        page = heapq.nsmallest(args['limit'] + 1, count_and_page(), key=lambda item: item[0])
+        next_cursor = None
+        if len(page) > args['limit']:
+            page = page[:args['limit']]
+            last_due_ms, last_id = page[-1][0]
+            next_cursor = f'{last_due_ms}:{last_id}'
+        
         return jsonify({
             'errcode': 0,
             'errmsg': 'success',
             'data': {
-                'total': len(job_list),
-                'jobs': job_list,
-                'scheduler_running': scheduler.running
+                'total': summary['reminderJobs'] + summary['otherJobs'],
+                'jobs': [job_to_dict(job) for _, job in page],
+                'nextCursor': next_cursor,
+                'summary': summary,
+                'scheduler_running': scheduler.running,
+                'dispatch_mode': DISPATCH_MODE
             }
         })
+    except ValueError as e:
+        return jsonify({
+            'errcode': 400,
+            'errmsg': str(e)
+        }), 400
     except Exception as e:
         logger.error(f'获取定时任务列表异常: {str(e)}', exc_info=True)
         return jsonify({
@@ -1624,13 +4201,59 @@ def get_scheduled_jobs():
         }), 500
 
 
+def outbox_stats():
+    """发件箱中各状态的消息数量"""
+    db = get_read_db()
+    rows = db.query(OutboxMessage.status, func.count()).group_by(OutboxMessage.status).all()
+    return {status: count for status, count in rows}
+
+
+@app.route('/api/debug/wx', methods=['GET'])
+def get_wx_client_status():
+    """
+    查看微信接口熔断器状态和重发队列（调试用）
+    """
+    return jsonify({
+        'errcode': 0,
+        'errmsg': 'success',
+        'data': {
+            'breakers': {name: breaker.snapshot() for name, breaker in wx_breakers.items()},
+            'outbox': outbox_stats(),
+            'avoided_no_credit': subscribe_credit_stats['avoided']
+        }
+    })
+
+
+@app.route('/api/debug/db', methods=['GET'])
+def get_db_query_stats():
+    """
+    查看各接口的 SQL 语句数量和耗时统计（调试用，进程启动以来）
+    """
+    with _db_query_stats_lock:
+        endpoints = {
+            endpoint: dict(stats,
+                           avg_queries=round(stats['queries'] / stats['requests'], 2),
+                           time_ms=round(stats['time_ms'], 1))
+            for endpoint, stats in db_query_stats.items()
+        }
+    return jsonify({
+        'errcode': 0,
+        'errmsg': 'success',
+        'data': {
+            'budget': DB_QUERY_BUDGET,
+            'endpoints': endpoints,
+            'reminder_cache': dict(reminder_cache_stats, size=len(_reminder_cache), ttl_seconds=REMINDER_CACHE_TTL_SECONDS)
+        }
+    })
+
+
 @app.route('/api/debug/reminder/<string:reminder_id>/send', methods=['POST'])
 def manual_send_reminder(reminder_id):
     """
     手动发送提醒（用于测试和调试）
     """
     try:
-        db = SessionLocal()
+        db = get_db()
         try:
             # 查找提醒
             reminder_obj = db.query(Reminder).filter(Reminder.id == reminder_id).first()
@@ -1647,28 +4270,19 @@ def manual_send_reminder(reminder_id):
                     'errmsg': '该提醒未开启订阅'
                 }), 400
             
-            reminder = reminder_obj.to_dict()
             logger.info(f'手动发送提醒: ID={reminder_id}')
             
-            # 构建模板数据
-            # 模板字段：事项主题(thing1)、事项时间(time2)、事项描述(thing4)
-            reminder_time = reminder.get('time', '')
-            thing1 = reminder.get('thing1', reminder.get('title', ''))[:20]  # 事项主题，优先使用 thing1，否则使用 title
-            thing4 = reminder.get('thing4', reminder.get('title', ''))[:20]  # 事项描述，优先使用 thing4，否则使用 title
-            template_data = {
-                'thing1': {'value': thing1},  # 事项主题
-                'time2': {'value': reminder_time},  # 事项时间
-                'thing4': {'value': thing4}  # 事项描述
-            }
-            
+            template_data = build_reminder_template_data(reminder_obj)
             logger.info(f'模板数据: {template_data}')
             
-            # 发送订阅消息
+            # 发送订阅消息（手动发送需要立即知道结果，熔断时不排队）
             result = send_subscribe_message(
-                openid=reminder['openid'],
+                openid=reminder_obj.openid,
                 template_id=TEMPLATE_ID,
                 page='pages/index/index',
-                data=template_data
+                data=template_data,
+                queue_if_open=False,
+                check_credit=False
             )
             
             if result.get('errcode') == 0:
@@ -1696,34 +4310,219 @@ def manual_send_reminder(reminder_id):
         except Exception as e:
             db.rollback()
             raise e
-        finally:
-            db.close()
             
     except Exception as e:
-        logger.error(f'手动发送提醒异常: {str(e)}', exc_info=True)
+        logger.error(f'手动发送提醒异常: {str(e)}', exc_info=True)
+        return jsonify({
+            'errcode': 500,
+            'errmsg': str(e)
+        }), 500
+
+
+@app.route('/api/debug/reschedule', methods=['POST'])
+def manual_reschedule():
+    """
+    按数据库重新登记所有未来的 pending 提醒任务（调试/运维用）
+    批量导入提醒（import_reminders.py --reschedule）后调用；external 模式下发送进程直接扫描数据库，无需调用
+    """
+    try:
+        if DISPATCH_MODE == 'external':
+            return jsonify({
+                'errcode': 0,
+                'errmsg': 'success',
+                'data': {'restored': 0, 'dispatch_mode': DISPATCH_MODE}
+            })
+        started = time.perf_counter()
+        restored = restore_scheduled_reminders(batch_size=EXPORT_BATCH_SIZE)
+        return jsonify({
+            'errcode': 0,
+            'errmsg': 'success',
+            'data': {
+                'restored': restored,
+                'elapsed_ms': round((time.perf_counter() - started) * 1000, 1),
+                'dispatch_mode': DISPATCH_MODE
+            }
+        })
+    except Exception as e:
+        logger.error(f'重新登记定时任务异常: {str(e)}', exc_info=True)
+        return jsonify({
+            'errcode': 500,
+            'errmsg': str(e)
+        }), 500
+
+
+@app.route('/api/debug/catchup', methods=['POST'])
+def manual_catch_up():
+    """
+    手动补发错过的提醒（调试/运维用）
+    
+    补发按 CATCHUP_RATE_PER_SECOND 限速，积压较多时耗时远超请求超时，因此只有 dryRun 在请求内执行；
+    实际补发在 inline 模式下交给调度器后台执行（返回 202），external 模式下由发送进程的定期补发任务处理
+    
+    请求体（均可选）:
+    {
+        "graceSeconds": 扫描窗口（秒）,
+        "policy": "1800:send,*:expire",
+        "ratePerSecond": 每秒最多补发数量,
+        "dryRun": true/false
+    }
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        options = {
+            'grace_seconds': data.get('graceSeconds'),
+            'policy': data.get('policy'),
+            'rate_per_second': data.get('ratePerSecond'),
+        }
+        # 先校验策略，格式错误时直接返回 400
+        parse_catchup_policy(options['policy'] or CATCHUP_POLICY)
+        
+        if data.get('dryRun', False):
+            stats = catch_up_reminders(dry_run=True, **options)
+            return jsonify({
+                'errcode': 0,
+                'errmsg': 'success',
+                'data': stats
+            })
+        
+        if DISPATCH_MODE == 'external':
+            return jsonify({
+                'errcode': 0,
+                'errmsg': '发送模式为 external，补发由发送进程定期执行',
+                'data': {'scheduled': False, 'dispatch_mode': DISPATCH_MODE}
+            }), 202
+        if scheduler is None:
+            return jsonify({
+                'errcode': 503,
+                'errmsg': '调度器未启动'
+            }), 503
+        
+        # 同一时间只运行一个补发任务（max_instances=1），重复请求不会并发补发
+        scheduler.add_job(
+            catch_up_reminders,
+            kwargs=options,
+            id='manual_catch_up',
+            max_instances=1,
+            replace_existing=True
+        )
+        logger.info(f'已安排后台补发任务: {options}')
+        return jsonify({
+            'errcode': 0,
+            'errmsg': '补发任务已在后台开始，进度见服务端日志',
+            'data': {'scheduled': True, 'jobId': 'manual_catch_up', 'dispatch_mode': DISPATCH_MODE}
+        }), 202
+    except ValueError as e:
+        return jsonify({
+            'errcode': 400,
+            'errmsg': str(e)
+        }), 400
+    except Exception as e:
+        logger.error(f'手动补发提醒异常: {str(e)}', exc_info=True)
         return jsonify({
             'errcode': 500,
             'errmsg': str(e)
         }), 500
 
 
+def reminder_debug_filters(args):
+    """调试提醒列表的过滤条件: openid, status（可用逗号分隔多个）, 提醒时间窗口"""
+    filters = []
+    if args['openid']:
+        filters.append(Reminder.openid == args['openid'])
+    status = request.args.get('status')
+    if status:
+        filters.append(Reminder.status.in_(status.split(',')))
+    if args['due_from'] is not None:
+        filters.append(Reminder.reminder_time >= args['due_from'])
+    if args['due_to'] is not None:
+        filters.append(Reminder.reminder_time < args['due_to'])
+    return filters
+
+
+# 调试提醒分页游标 "{创建时间}:{提醒ID}" 中创建时间的格式（精确到微秒，不含冒号）
+DEBUG_CURSOR_TIME_FORMAT = '%Y%m%d%H%M%S%f'
+
+
+def debug_reminder_cursor_condition(cursor):
+    """
+    游标之后（按 (create_time, id) 倒序）的提醒
+    create_time 为空的旧数据排在最后（MySQL 和 SQLite 中 NULL 都小于任何值），游标中创建时间为空
+    """
+    cursor_time, _, cursor_id = cursor.partition(':')
+    if not cursor_time:
+        return and_(Reminder.create_time.is_(None), Reminder.id < cursor_id)
+    try:
+        cursor_time = datetime.strptime(cursor_time, DEBUG_CURSOR_TIME_FORMAT)
+    except ValueError:
+        raise ValueError(f'cursor 格式错误: {cursor}')
+    return or_(
+        Reminder.create_time < cursor_time,
+        and_(Reminder.create_time == cursor_time, Reminder.id < cursor_id),
+        Reminder.create_time.is_(None),
+    )
+
+
 @app.route('/api/debug/reminders', methods=['GET'])
 def get_all_reminders():
     """
-    获取所有提醒（调试用）
+    分页查看提醒（调试用），按 (创建时间, 提醒ID) 倒序
+    
+    查询参数见 debug_list_args，另支持 status 过滤；summary=0 时第一页不统计汇总
+    使用 (create_time, id) keyset 分页，翻到任意深度每页的代价都相同
+    （提醒ID带批次号、随机后缀等，按ID排序不等于按创建时间排序）
     """
     try:
-        db = SessionLocal()
-        try:
-            reminders = db.query(Reminder).order_by(Reminder.create_time.desc()).all()
-            reminders_list = [r.to_dict() for r in reminders]
-            return jsonify({
-                'errcode': 0,
-                'errmsg': 'success',
-                'data': reminders_list
-            })
-        finally:
-            db.close()
+        args = debug_list_args()
+        filters = reminder_debug_filters(args)
+        
+        if args['format'] == 'ndjson':
+            # 响应体在请求处理函数返回后才开始生成，使用独立会话
+            db = read_session(args['openid'])
+            
+            def generate():
+                try:
+                    yield from iter_reminder_export(db, filters=filters, limit=DEBUG_STREAM_MAX_ROWS)
+                finally:
+                    db.close()
+            return ndjson_response(generate())
+        
+        db = get_read_db(args['openid'])
+        statement = select(*REMINDER_LIST_COLUMNS).where(*filters)
+        if args['cursor']:
+            statement = statement.where(debug_reminder_cursor_condition(args['cursor']))
+        reminders_list = fetch_reminder_rows(
+            db, statement.order_by(Reminder.create_time.desc(), Reminder.id.desc()).limit(args['limit'] + 1)
+        )
+        next_cursor = None
+        if len(reminders_list) > args['limit']:
+            reminders_list = reminders_list[:args['limit']]
+            last = reminders_list[-1]
+            create_time = last['createTime'].strftime(DEBUG_CURSOR_TIME_FORMAT) if last['createTime'] else ''
+            next_cursor = f"{create_time}:{last['id']}"
+        
+        data = {
+            'reminders': reminders_list,
+            'nextCursor': next_cursor
+        }
+        # 汇总只在第一页统计一次（一条 GROUP BY），翻页时不重复计算
+        if not args['cursor'] and request.args.get('summary', '1') != '0':
+            by_status = dict(db.execute(
+                select(Reminder.status, func.count()).where(*filters).group_by(Reminder.status)
+            ).all())
+            data['summary'] = {
+                'total': sum(by_status.values()),
+                'byStatus': by_status
+            }
+        return json_response({
+            'errcode': 0,
+            'errmsg': 'success',
+            'data': data
+        })
+    except ValueError as e:
+        return jsonify({
+            'errcode': 400,
+            'errmsg': str(e)
+        }), 400
     except Exception as e:
         logger.error(f'获取提醒列表异常: {str(e)}', exc_info=True)
         return jsonify({
@@ -1732,6 +4531,184 @@ def get_all_reminders():
         }), 500
 
 
+WX_EVENT_BATCH_SIZE = int(os.getenv('WX_EVENT_BATCH_SIZE', '500'))  # 每批处理的推送消息数量
+WX_EVENT_POLL_SECONDS = float(os.getenv('WX_EVENT_POLL_SECONDS', '1'))  # 轮询间隔（秒）
+WX_EVENT_LEASE_SECONDS = 60  # 认领后多久未完成可被重新认领
+WX_EVENT_RETENTION_SECONDS = int(os.getenv('WX_EVENT_RETENTION_SECONDS', '86400'))  # 已处理消息保留时长（用于去重）
+_wx_event_last_purge = 0.0
+
+
+def ingest_wx_event(content_type, body):
+    """
+    写入一条原始推送消息（单条 INSERT，不解析）
+    
+    Returns:
+        bool: 是否为新消息（重复推送返回 False）
+    """
+    try:
+        with engine.begin() as conn:
+            conn.execute(WxEvent.__table__.insert().values(
+                content_type=content_type,
+                body=body,
+                body_hash=hashlib.sha1(body.encode('utf-8')).hexdigest(),
+                status='pending',
+                available_at=0,
+                create_time=datetime.now()
+            ))
+        return True
+    except IntegrityError:
+        logger.info('收到重复的微信推送消息，忽略')
+        return False
+
+
+def purge_wx_events():
+    """删除超过保留时长的已处理推送消息（每分钟最多执行一次）"""
+    global _wx_event_last_purge
+    if time.monotonic() - _wx_event_last_purge < 60:
+        return 0
+    _wx_event_last_purge = time.monotonic()
+    cutoff = datetime.now() - timedelta(seconds=WX_EVENT_RETENTION_SECONDS)
+    with engine.begin() as conn:
+        result = conn.execute(WxEvent.__table__.delete().where(
+            WxEvent.status == 'done',
+            WxEvent.create_time < cutoff
+        ))
+    return result.rowcount
+
+
+def _xml_to_dict(element):
+    """XML 转字典：叶子节点取文本，List 节点（可重复）合并为列表"""
+    result = {}
+    for child in element:
+        value = _xml_to_dict(child) if len(child) else (child.text or '')
+        if child.tag == 'List':
+            result.setdefault('List', []).append(value)
+        else:
+            result[child.tag] = value
+    return result
+
+
+def parse_wx_event(content_type, body):
+    """
+    解析推送消息，订阅消息事件的明细统一放在 List（列表）中
+    XML: <SubscribeMsgPopupEvent><List>...</List></SubscribeMsgPopupEvent>
+    JSON: "List": {...} 或 "List": [{...}]
+    """
+    if content_type == 'json':
+        data = json.loads(body)
+    else:
+        data = _xml_to_dict(ET.fromstring(body))
+        for key in ('SubscribeMsgPopupEvent', 'SubscribeMsgChangeEvent', 'SubscribeMsgSentEvent'):
+            if isinstance(data.get(key), dict):
+                data['List'] = data.pop(key).get('List', [])
+    items = data.get('List', [])
+    data['List'] = [items] if isinstance(items, dict) else items
+    return data
+
+
+def _handle_subscribe_popup_event(db, data):
+    """用户在小程序内授权订阅消息：作为授权来源时记录额度"""
+    if SUBSCRIBE_CREDIT_SOURCE != 'push':
+        return
+    results = {item.get('TemplateId'): item.get('SubscribeStatusString') for item in data['List']}
+    grant_subscribe_credits(db, data.get('FromUserName'), results)
+
+
+def _handle_subscribe_change_event(db, data):
+    """用户在设置中关闭订阅消息：额度清零（与授权来源无关）"""
+    results = {item.get('TemplateId'): 'ban' for item in data['List']
+               if item.get('SubscribeStatusString') == 'reject'}
+    grant_subscribe_credits(db, data.get('FromUserName'), results)
+
+
+def _handle_subscribe_sent_event(db, data):
+    """订阅消息送达结果（微信重试推送时忽略重复的 msgid）"""
+    for item in data['List']:
+        msg_id = str(item.get('MsgID', ''))
+        if not msg_id or db.get(WxMessageDelivery, msg_id) is not None:
+            continue
+        db.add(WxMessageDelivery(
+            msg_id=msg_id,
+            openid=data.get('FromUserName'),
+            template_id=item.get('TemplateId'),
+            error_code=int(item.get('ErrorCode') or 0),
+            error_status=item.get('ErrorStatus'),
+            event_time=int(data.get('CreateTime') or 0)
+        ))
+        db.flush()
+        if str(item.get('ErrorCode')) == '20004':
+            # 用户拒收，之后的消息也会失败
+            grant_subscribe_credits(db, data.get('FromUserName'), {item.get('TemplateId'): 'ban'})
+
+
+# 推送事件类型 -> 处理函数（在同一个 db 会话中执行，由调用方提交）
+WX_EVENT_HANDLERS = {
+    'subscribe_msg_popup_event': _handle_subscribe_popup_event,
+    'subscribe_msg_change_event': _handle_subscribe_change_event,
+    'subscribe_msg_sent_event': _handle_subscribe_sent_event,
+}
+
+
+def _apply_wx_event(db, row):
+    data = parse_wx_event(row.content_type, row.body)
+    msg_type = data.get('MsgType', '')
+    if msg_type == 'text':
+        logger.info(f'收到文本消息: 用户={data.get("FromUserName", "")}, 内容={data.get("Content", "")}')
+    elif msg_type == 'event':
+        handler = WX_EVENT_HANDLERS.get(data.get('Event', ''))
+        if handler is not None:
+            handler(db, data)
+
+
+def process_wx_events(batch_size=None):
+    """
+    批量处理推送消息：一批消息在同一个事务中处理并标记为 done（保留一段时间用于去重）；
+    单条消息处理失败时回滚到该消息之前，标记为 failed，不影响同批其他消息
+    
+    Returns:
+        int: 本批消息数量
+    """
+    db = SessionLocal()
+    try:
+        claim_token, rows = claim_batch(db, WxEvent, batch_size or WX_EVENT_BATCH_SIZE, WX_EVENT_LEASE_SECONDS)
+        if not rows:
+            purge_wx_events()
+            return 0
+        
+        done_ids = []
+        for row in rows:
+            try:
+                with db.begin_nested():
+                    _apply_wx_event(db, row)
+                done_ids.append(row.id)
+            except Exception as e:
+                logger.error(f'处理微信推送消息失败: id={row.id}, 错误: {str(e)}')
+                row.status = 'failed'
+                row.last_error = str(e)[:500]
+        
+        if done_ids:
+            db.query(WxEvent).filter(
+                WxEvent.id.in_(done_ids),
+                WxEvent.claim_token == claim_token
+            ).update({'status': 'done'}, synchronize_session=False)
+        db.commit()
+        return len(rows)
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+def run_wx_event_worker():
+    """处理所有待处理的推送消息（定时任务执行函数，积压时连续处理直到清空）"""
+    try:
+        while process_wx_events() >= WX_EVENT_BATCH_SIZE:
+            pass
+    except Exception as e:
+        logger.error(f'处理微信推送消息异常: {str(e)}', exc_info=True)
+
+
 def verify_signature(signature, timestamp, nonce, token):
     """
     验证微信消息签名
@@ -1793,46 +4770,70 @@ def wx_message():
             logger.warning('❌ 消息签名验证失败')
             return '签名验证失败', 403
         
-        # 获取消息内容
+        # 只写入原始消息就返回，解析和处理由后台任务批量完成（微信要求 5 秒内响应，超时会重试推送）
         try:
-            # 微信可能发送 XML 或 JSON 格式的消息
-            if request.is_json:
-                data = request.json
-                logger.info(f'收到微信消息（JSON）: {data}')
-            else:
-                # XML 格式（需要解析）
-                xml_data = request.data.decode('utf-8')
-                logger.info(f'收到微信消息（XML）: {xml_data}')
-                # 这里可以添加 XML 解析逻辑
-                data = {'raw': xml_data}
-            
-            # 处理消息
-            # 根据消息类型进行不同处理
-            msg_type = data.get('MsgType', '')
-            
-            if msg_type == 'text':
-                # 文本消息
-                content = data.get('Content', '')
-                from_user = data.get('FromUserName', '')
-                logger.info(f'收到文本消息: 用户={from_user}, 内容={content}')
-                # 这里可以添加自动回复逻辑
-                
-            elif msg_type == 'event':
-                # 事件消息
-                event = data.get('Event', '')
-                logger.info(f'收到事件消息: 事件类型={event}')
-                # 这里可以处理各种事件，如关注、取消关注等
-            
-            # 返回 success 表示接收成功
+            content_type = 'json' if request.is_json else 'xml'
+            ingest_wx_event(content_type, request.get_data(as_text=True))
             return 'success', 200
-            
         except Exception as e:
-            logger.error(f'处理微信消息异常: {str(e)}', exc_info=True)
+            logger.error(f'保存微信消息异常: {str(e)}', exc_info=True)
             return '处理失败', 500
     
     return 'Method not allowed', 405
 
 
+@app.route('/api/subscribe/grant', methods=['POST'])
+def report_subscribe_grant():
+    """
+    上报订阅消息授权结果（小程序调用 wx.requestSubscribeMessage 后调用）
+    SUBSCRIBE_CREDIT_SOURCE=push 时以微信推送为准，这里只返回当前额度
+    
+    请求体:
+    {
+        "openid": "用户openid",
+        "results": {"模板ID": "accept" | "reject" | "ban"}
+    }
+    """
+    try:
+        data = request.json or {}
+        openid = data.get('openid')
+        results = data.get('results')
+        if not openid or not isinstance(results, dict):
+            return jsonify({
+                'errcode': 400,
+                'errmsg': '缺少必要参数: openid, results'
+            }), 400
+        
+        db = get_db()
+        try:
+            if SUBSCRIBE_CREDIT_SOURCE == 'client':
+                grant_subscribe_credits(db, openid, results)
+                db.commit()
+            rows = db.query(SubscribeCredit).filter(
+                SubscribeCredit.openid == openid,
+                SubscribeCredit.template_id.in_(list(results.keys()))
+            ).all()
+            credits = {row.template_id: row.credits for row in rows}
+        except Exception as e:
+            db.rollback()
+            raise e
+        
+        logger.info(f'收到订阅授权结果: openid={openid}, results={results}, 剩余额度={credits}')
+        return jsonify({
+            'errcode': 0,
+            'errmsg': 'success',
+            'data': {
+                'credits': credits
+            }
+        })
+    except Exception as e:
+        logger.error(f'记录订阅授权结果异常: {str(e)}', exc_info=True)
+        return jsonify({
+            'errcode': 500,
+            'errmsg': f'服务器内部错误: {str(e)}'
+        }), 500
+
+
 @app.route('/api/reminder/<string:reminder_id>/share', methods=['POST'])
 def share_reminder(reminder_id):
     """
@@ -1853,7 +4854,7 @@ def share_reminder(reminder_id):
                 'errmsg': '缺少必要字段: owner_openid'
             }), 400
         
-        db = SessionLocal()
+        db = get_db()
         try:
             # 查找提醒
             reminder = db.query(Reminder).filter(Reminder.id == reminder_id).first()
@@ -1882,6 +4883,7 @@ def share_reminder(reminder_id):
             # 标记为已分享（允许多次分享，此字段仅用于统计）
             reminder.shared = True
             db.commit()
+            invalidate_cached_reminders(reminder_id)
             
             # 生成分享链接（每次分享都生成新的链接，支持多次分享）
             share_url = f"pages/index/index?reminder_id={reminder_id}&action=accept"
@@ -1903,8 +4905,6 @@ def share_reminder(reminder_id):
                 'errcode': 500,
                 'errmsg': str(e)
             }), 500
-        finally:
-            db.close()
     except Exception as e:
         logger.error(f'分享提醒异常: {str(e)}')
         return jsonify({
@@ -1913,11 +4913,40 @@ def share_reminder(reminder_id):
         }), 500
 
 
+def upsert_statement(db, table, values, conflict_columns, update_values=None):
+    """
+    生成 INSERT ... ON DUPLICATE KEY UPDATE（MySQL）/ ON CONFLICT（SQLite）语句
+    
+    Args:
+        values: 插入的值；为 None 时不绑定，执行时传入多行参数（executemany 批量写入）
+        conflict_columns: 冲突判断的唯一键列（SQLite 需要；MySQL 按表上任一唯一键判断）
+        update_values: 冲突时更新的列；为空时保留已有行不变
+    """
+    dialect = db.get_bind(clause=table.insert()).dialect.name
+    if dialect == 'mysql':
+        statement = mysql.insert(table)
+        if values is not None:
+            statement = statement.values(**values)
+        # 没有要更新的列时把唯一键赋值给自己，相当于 INSERT IGNORE 但不会吞掉其他错误
+        return statement.on_duplicate_key_update(
+            **(update_values or {conflict_columns[0]: statement.inserted[conflict_columns[0]]})
+        )
+    statement = sqlite.insert(table)
+    if values is not None:
+        statement = statement.values(**values)
+    if update_values:
+        return statement.on_conflict_do_update(index_elements=conflict_columns, set_=update_values)
+    return statement.on_conflict_do_nothing(index_elements=conflict_columns)
+
+
 @app.route('/api/reminder/<string:reminder_id>/accept', methods=['POST'])
 def accept_reminder(reminder_id):
     """
     接受分享的提醒接口
     
+    分配记录和副本都用 upsert 写入，并发接受同一个分享时只会有一份副本：
+    分配记录以 {reminder_id}_{assigned_openid} 为主键，副本以 (owner_openid, openid, source_reminder_id) 为唯一键
+    
     请求体:
     {
         "assigned_openid": "被分配的好友openid"
@@ -1933,153 +4962,74 @@ def accept_reminder(reminder_id):
                 'errmsg': '缺少必要字段: assigned_openid'
             }), 400
         
-        db = SessionLocal()
+        db = get_db()
         try:
-            # 查找原提醒
-            original_reminder = db.query(Reminder).filter(Reminder.id == reminder_id).first()
+            # 查找原提醒（热门分享会被大量好友同时接受，走缓存；接受只写分配记录和副本，不读取也不锁定主库上的原提醒）
+            # 缓存可能落后于其他进程处理的修改（最多 TTL 秒）：副本通过 source_reminder_id 关联原提醒，
+            # 之后创建者的修改会同步到副本，按稍旧的快照创建的副本会被更正
+            original_reminder = get_cached_reminder(db, reminder_id)
             if not original_reminder:
                 return jsonify({
                     'errcode': 404,
                     'errmsg': '提醒不存在'
                 }), 404
             
-            # 防重复1：不能接受自己创建的提醒
-            if original_reminder.owner_openid == assigned_openid:
-                logger.warning(f'不能接受自己的提醒: reminder_id={reminder_id}, owner={original_reminder.owner_openid}, assigned={assigned_openid}')
+            # 不能接受自己创建的提醒
+            if original_reminder['ownerOpenid'] == assigned_openid:
+                logger.warning(f'不能接受自己的提醒: reminder_id={reminder_id}, owner={original_reminder["ownerOpenid"]}, assigned={assigned_openid}')
                 return jsonify({
                     'errcode': 400,
                     'errmsg': '不能接受自己创建的提醒'
                 }), 400
             
-            # 防重复2：检查是否已经接受过此提醒（通过assignment表检查）
-            # 检查是否已经存在该提醒的分配记录
-            assignment_id = f"{reminder_id}_{assigned_openid}"
-            existing_assignment = db.query(ReminderAssignment).filter(
-                ReminderAssignment.id == assignment_id
-            ).first()
-            
-            # 如果已经接受过，查找对应的提醒
-            if existing_assignment and existing_assignment.status == 'accepted':
-                # 通过owner_openid和reminder_time查找已存在的提醒
-                existing_reminder = db.query(Reminder).filter(
-                    Reminder.owner_openid == original_reminder.owner_openid,
-                    Reminder.openid == assigned_openid,
-                    Reminder.reminder_time == original_reminder.reminder_time
-                ).first()
-            else:
-                existing_reminder = None
-            
-            if existing_reminder:
-                logger.info(f'提醒已存在: reminder_id={reminder_id}, assigned={assigned_openid}, existing_id={new_reminder_id}')
-                return jsonify({
-                    'errcode': 400,
-                    'errmsg': '您已经接受过此提醒',
-                    'data': {
-                        'reminder': existing_reminder.to_dict(),
-                        'alreadyAccepted': True
-                    }
-                }), 400
-            
-            # 防重复3：检查分配记录
+            # 创建或更新分配记录（之前拒绝过的也改为已接受）
+            now = datetime.now()
             assignment_id = f"{reminder_id}_{assigned_openid}"
-            existing_assignment = db.query(ReminderAssignment).filter(
-                ReminderAssignment.id == assignment_id
-            ).first()
-            
-            if existing_assignment:
-                if existing_assignment.status == 'accepted':
-                    # 已经接受过，返回已存在的提醒
-                    logger.info(f'分配记录已存在且已接受: assignment_id={assignment_id}')
-                    if existing_reminder:
-                        return jsonify({
-                            'errcode': 400,
-                            'errmsg': '您已经接受过此提醒',
-                            'data': {
-                                'reminder': existing_reminder.to_dict(),
-                                'alreadyAccepted': True
-                            }
-                        }), 400
-                    else:
-                        # 记录存在但提醒不存在，可能是数据不一致，允许重新创建
-                        logger.warning(f'分配记录存在但提醒不存在，允许重新创建: assignment_id={assignment_id}')
-                elif existing_assignment.status == 'rejected':
-                    # 之前拒绝过，允许重新接受
-                    logger.info(f'之前拒绝过，允许重新接受: assignment_id={assignment_id}')
-                # pending状态继续处理
-            
-            # 创建或更新分配记录
-            if existing_assignment:
-                assignment = existing_assignment
-                assignment.status = 'accepted'
-                assignment.accept_time = datetime.now()
-            else:
-                assignment = ReminderAssignment(
-                    id=assignment_id,
-                    reminder_id=reminder_id,
-                    owner_openid=original_reminder.owner_openid,
-                    assigned_openid=assigned_openid,
-                    status='accepted',
-                    accept_time=datetime.now()
-                )
-                db.add(assignment)
-            
-            # 再次检查提醒是否已存在（防止并发）
-            # 通过owner_openid和reminder_time查找
-            final_check = db.query(Reminder).filter(
-                Reminder.owner_openid == original_reminder.owner_openid,
-                Reminder.openid == assigned_openid,
-                Reminder.reminder_time == original_reminder.reminder_time
-            ).first()
-            
-            if final_check:
-                db.commit()
-                logger.info(f'并发检查：提醒已存在，返回现有提醒: reminder_id={final_check.id}')
-                return jsonify({
-                    'errcode': 0,
-                    'errmsg': 'success',
-                    'data': {
-                        'reminder': final_check.to_dict(),
-                        'message': '提醒已存在'
-                    }
-                })
+            db.execute(upsert_statement(db, ReminderAssignment.__table__, {
+                'id': assignment_id,
+                'reminder_id': reminder_id,
+                'owner_openid': original_reminder['ownerOpenid'],
+                'assigned_openid': assigned_openid,
+                'status': 'accepted',
+                'accept_time': now
+            }, ['id'], {'status': 'accepted', 'accept_time': now}))
             
-            # 创建新提醒
-            # 使用 openid + 创建时间戳作为ID（确保ID唯一且不会因为reminderTime改变而改变）
+            # 创建副本，已存在时保持不变
+            # ID 为 {openid}_{创建时间戳}-{随机后缀}：不会因为 reminderTime 改变而改变；
+            # 同一用户在同一毫秒接受多个分享时也不会主键冲突（主键冲突不在 upsert 的冲突目标内）
             create_timestamp = int(datetime.now().timestamp() * 1000)
-            new_reminder_id = f"{assigned_openid}_{create_timestamp}"
-            
-            new_reminder = Reminder(
-                id=new_reminder_id,
-                openid=assigned_openid,  # 当前拥有者（被分配的好友）
-                owner_openid=original_reminder.owner_openid,  # 原创建者
-                title=original_reminder.title,
-                thing1=original_reminder.thing1,
-                thing4=original_reminder.thing4,
-                time=original_reminder.time,
-                reminder_time=original_reminder.reminder_time,
-                enable_subscribe=original_reminder.enable_subscribe,
-                status='pending',
-                completed=False,
-                shared=False
-            )
-            db.add(new_reminder)
+            new_reminder_id = f"{assigned_openid}_{create_timestamp}-{uuid.uuid4().hex[:8]}"
+            db.execute(upsert_statement(db, Reminder.__table__, {
+                'id': new_reminder_id,
+                'openid': assigned_openid,  # 当前拥有者（被分配的好友）
+                'owner_openid': original_reminder['ownerOpenid'],  # 原创建者
+                'source_reminder_id': reminder_id,
+                'title': original_reminder['title'],
+                'thing1': original_reminder['thing1'],
+                'thing4': original_reminder['thing4'],
+                'time': original_reminder['time'],
+                'reminder_time': original_reminder['reminderTime'],
+                'enable_subscribe': original_reminder['enableSubscribe'],
+                'status': 'pending',
+                'completed': False,
+                'shared': False
+            }, ['owner_openid', 'openid', 'source_reminder_id']))
             
             # 注意：不需要为新提醒创建定时任务
             # 因为原提醒（创建者的提醒）已经安排了定时任务
             # 定时任务会查找所有相关的提醒（包括创建者和所有被分配者）并发送通知
             # 如果为新提醒也创建定时任务，会导致重复发送通知
             
+            # 加锁读取：MySQL 可重复读下普通 SELECT 看不到并发事务刚提交的副本
+            reminder = db.query(Reminder).filter(
+                Reminder.owner_openid == original_reminder['ownerOpenid'],
+                Reminder.openid == assigned_openid,
+                Reminder.source_reminder_id == reminder_id
+            ).with_for_update().one()
+            reminder_data = reminder.to_dict()
+            if reminder.id == new_reminder_id:
+                adjust_reminder_summaries(db, added=[reminder])
             db.commit()
-            
-            logger.info(f'接受提醒成功: 原提醒ID={reminder_id}, 新提醒ID={new_reminder_id}, 接受者={assigned_openid}')
-            
-            return jsonify({
-                'errcode': 0,
-                'errmsg': 'success',
-                'data': {
-                    'reminder': new_reminder.to_dict()
-                }
-            })
         except Exception as e:
             db.rollback()
             logger.error(f'接受提醒失败: {str(e)}', exc_info=True)
@@ -2087,8 +5037,27 @@ def accept_reminder(reminder_id):
                 'errcode': 500,
                 'errmsg': str(e)
             }), 500
-        finally:
-            db.close()
+        
+        if reminder.id != new_reminder_id:
+            logger.info(f'提醒已存在: reminder_id={reminder_id}, assigned={assigned_openid}, existing_id={reminder.id}')
+            return jsonify({
+                'errcode': 400,
+                'errmsg': '您已经接受过此提醒',
+                'data': {
+                    'reminder': reminder_data,
+                    'alreadyAccepted': True
+                }
+            }), 400
+        
+        logger.info(f'接受提醒成功: 原提醒ID={reminder_id}, 新提醒ID={new_reminder_id}, 接受者={assigned_openid}')
+        
+        return jsonify({
+            'errcode': 0,
+            'errmsg': 'success',
+            'data': {
+                'reminder': reminder_data
+            }
+        })
     except Exception as e:
         logger.error(f'接受提醒异常: {str(e)}')
         return jsonify({
@@ -2117,7 +5086,7 @@ def reject_reminder(reminder_id):
                 'errmsg': '缺少必要字段: assigned_openid'
             }), 400
         
-        db = SessionLocal()
+        db = get_db()
         try:
             # 查找原提醒
             original_reminder = db.query(Reminder).filter(Reminder.id == reminder_id).first()
@@ -2161,35 +5130,23 @@ def reject_reminder(reminder_id):
                 )
                 db.add(assignment)
             
-            db.commit()
-            
-            # 通知创建者（A）提醒被拒绝了
+            # 通知创建者（A）提醒被拒绝了：写入发件箱，与拒绝记录在同一事务中提交，由后台任务投递
             owner_openid = original_reminder.owner_openid
-            try:
-                # 构建通知消息
-                reminder_title = original_reminder.thing1[:20] if original_reminder.thing1 else '提醒'
-                template_data = {
-                    'thing1': {'value': '提醒被拒绝'},
-                    'time2': {'value': datetime.now().strftime('%Y-%m-%d %H:%M:%S')},
-                    'thing4': {'value': f'您分享的提醒"{reminder_title}"被拒绝了'}
-                }
-                
-                # 发送订阅消息给创建者
-                result = send_subscribe_message(
-                    openid=owner_openid,
-                    template_id=TEMPLATE_ID,
-                    page='pages/index/index',
-                    data=template_data
-                )
-                
-                if result.get('errcode') == 0:
-                    logger.info(f'✅ 拒绝通知发送成功: owner={owner_openid}, reminder_id={reminder_id}')
-                else:
-                    # 发送失败不影响拒绝操作
-                    logger.warning(f'⚠️ 拒绝通知发送失败: owner={owner_openid}, errcode={result.get("errcode")}')
-            except Exception as e:
-                # 通知失败不影响拒绝操作
-                logger.error(f'发送拒绝通知异常: {str(e)}')
+            reminder_title = original_reminder.thing1[:20] if original_reminder.thing1 else '提醒'
+            template_data = {
+                'thing1': {'value': '提醒被拒绝'},
+                'time2': {'value': datetime.now().strftime('%Y-%m-%d %H:%M:%S')},
+                'thing4': {'value': f'您分享的提醒"{reminder_title}"被拒绝了'}
+            }
+            enqueue_subscribe_message(
+                db,
+                openid=owner_openid,
+                template_id=TEMPLATE_ID,
+                page='pages/index/index',
+                data=template_data
+            )
+            
+            db.commit()
             
             logger.info(f'拒绝提醒成功: reminder_id={reminder_id}, assigned={assigned_openid}')
             
@@ -2197,7 +5154,7 @@ def reject_reminder(reminder_id):
                 'errcode': 0,
                 'errmsg': 'success',
                 'data': {
-                    'message': '已拒绝提醒，创建者已收到通知'
+                    'message': '已拒绝提醒，将通知创建者'
                 }
             })
         except Exception as e:
@@ -2207,8 +5164,6 @@ def reject_reminder(reminder_id):
                 'errcode': 500,
                 'errmsg': str(e)
             }), 500
-        finally:
-            db.close()
     except Exception as e:
         logger.error(f'拒绝提醒异常: {str(e)}')
         return jsonify({
@@ -2233,38 +5188,26 @@ def get_assigned_reminders():
                 'errmsg': '缺少必要参数: openid'
             }), 400
         
-        db = SessionLocal()
-        try:
-            # 查找分配给该用户的提醒
-            assignments = db.query(ReminderAssignment).filter(
-                ReminderAssignment.assigned_openid == openid,
-                ReminderAssignment.status == 'accepted'
-            ).all()
-            
-            # 获取对应的提醒列表
-            reminders = []
-            for assignment in assignments:
-                # 查找被分配者拥有的提醒（通过owner_openid和reminder_time匹配）
-                reminder = db.query(Reminder).filter(
-                    Reminder.owner_openid == assignment.owner_openid,
-                    Reminder.openid == openid,
-                    Reminder.reminder_time == db.query(Reminder).filter(
-                        Reminder.id == assignment.reminder_id
-                    ).first().reminder_time
-                ).first()
-                
-                if reminder:
-                    reminder_dict = reminder.to_dict()
-                    reminder_dict['fromOwner'] = True  # 标记为来自分享
-                    reminders.append(reminder_dict)
-            
-            return jsonify({
-                'errcode': 0,
-                'errmsg': 'success',
-                'data': reminders
-            })
-        finally:
-            db.close()
+        db = get_read_db(openid)
+        # 查找分配给该用户的提醒：已接受的分配记录 -> 被分配者拥有的副本
+        # （副本的 source_reminder_id 为分配记录的原提醒ID，走 uq_reminder_copy 索引），一条 JOIN 查询完成
+        statement = select(*REMINDER_LIST_COLUMNS).select_from(ReminderAssignment).join(
+            Reminder, and_(
+                Reminder.owner_openid == ReminderAssignment.owner_openid,
+                Reminder.openid == openid,
+                Reminder.source_reminder_id == ReminderAssignment.reminder_id
+            )
+        ).where(
+            ReminderAssignment.assigned_openid == openid,
+            ReminderAssignment.status == 'accepted'
+        )
+        reminders = fetch_reminder_rows(db, statement)
+        
+        return json_response({
+            'errcode': 0,
+            'errmsg': 'success',
+            'data': reminders
+        })
     except Exception as e:
         logger.error(f'获取分配的提醒列表异常: {str(e)}')
         return jsonify({
@@ -2289,6 +5232,10 @@ def when_ready(server):
 def post_fork(server, worker):
     """Worker 进程 fork 后的回调（在每个 worker 中执行）"""
     logger.info(f'Worker {worker.pid} 启动中...')
+    if DISPATCH_MODE != 'external' and server.cfg.workers > 1:
+        # 每个 worker 都会启动调度器、恢复全部定时任务，内存随进程数成倍增长
+        logger.warning(f'inline 发送模式只支持单个 worker（当前 {server.cfg.workers} 个），'
+                       f'请使用 -w 1 --threads N，或设置 DISPATCH_MODE=external 并运行 dispatcher.py')
     try:
         init_app()
         logger.info(f'✅ Worker {worker.pid} 初始化完成')
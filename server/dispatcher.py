@@ -0,0 +1,368 @@
+"""
+提醒发送进程 - 独立于 Web 进程运行
+
+Web 进程设置 DISPATCH_MODE=external 后只负责写数据库，
+本进程使用独立的数据库引擎和连接池，负责所有提醒的调度和发送：
+1. 轮询到期的 pending 提醒并并发发送
+2. 后台定期补发停机期间错过的提醒
+3. 后台投递发件箱（outbox）中的通知
+4. 后台批量处理微信推送消息（wx_events）
+
+多个发送进程可以水平扩展：提醒按创建者 openid 的哈希分桶（dispatch_bucket），
+分片 = dispatch_bucket % 分片数。每个进程通过 MySQL 中的租约表（dispatcher_shards）
+持有一部分分片，并定期续约；进程退出或宕机后租约过期，其他进程自动接管。
+
+用法:
+    python dispatcher.py [--poll-interval 1] [--batch-size 200] [--concurrency 8]
+    python dispatcher.py --shards 16 --node-id node-1
+"""
+import argparse
+import math
+import os
+import signal
+import socket
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from sqlalchemy.exc import IntegrityError
+
+from app import (
+    OUTBOX_BATCH_SIZE,
+    WX_EVENT_BATCH_SIZE,
+    DispatcherNode,
+    DispatcherShard,
+    Reminder,
+    SessionLocal,
+    bind_engine,
+    catch_up_reminders,
+    create_db_engine,
+    ensure_tables_exist,
+    logger,
+    process_wx_events,
+    relay_outbox,
+    send_reminder,
+    sendable_condition,
+    wx_breakers,
+)
+
+
+def _now_ms():
+    return int(datetime.now().timestamp() * 1000)
+
+
+class ShardLeaseManager:
+    """
+    发送分片租约管理器
+    每个发送进程定期心跳并续约，按存活进程数均分分片：
+    持有过多的进程释放多余分片，持有不足的进程抢占空闲或租约已过期的分片
+    """
+    def __init__(self, node_id, shard_count, lease_ttl):
+        self.node_id = node_id
+        self.shard_count = shard_count
+        self.lease_ttl_ms = int(lease_ttl * 1000)
+        self._owned = frozenset()
+        self._lock = threading.Lock()
+
+    @property
+    def owned(self):
+        """当前持有的分片"""
+        with self._lock:
+            return self._owned
+
+    def shard_filter(self):
+        """只查询本进程持有的分片中的提醒"""
+        return (Reminder.dispatch_bucket % self.shard_count).in_(sorted(self.owned))
+
+    def ensure_shards(self):
+        """确保分片记录存在（多个进程同时启动时忽略冲突）"""
+        db = SessionLocal()
+        try:
+            existing = {row.shard_id for row in db.query(DispatcherShard.shard_id).all()}
+            for shard_id in range(self.shard_count):
+                if shard_id in existing:
+                    continue
+                try:
+                    db.add(DispatcherShard(shard_id=shard_id, node_id=None, lease_expires_at=0))
+                    db.commit()
+                except IntegrityError:
+                    db.rollback()
+        finally:
+            db.close()
+
+    def _heartbeat(self, db, now_ms):
+        updated = db.query(DispatcherNode).filter(
+            DispatcherNode.node_id == self.node_id
+        ).update({'heartbeat_at': now_ms}, synchronize_session=False)
+        if not updated:
+            db.add(DispatcherNode(node_id=self.node_id, heartbeat_at=now_ms))
+        db.commit()
+
+    def rebalance(self):
+        """
+        心跳、续约并重新均衡分片
+
+        Returns:
+            frozenset: 当前持有的分片
+        """
+        now_ms = _now_ms()
+        db = SessionLocal()
+        try:
+            self._heartbeat(db, now_ms)
+
+            live_nodes = db.query(DispatcherNode).filter(
+                DispatcherNode.heartbeat_at >= now_ms - self.lease_ttl_ms
+            ).count()
+            target = math.ceil(self.shard_count / max(live_nodes, 1))
+
+            # 续约当前持有的分片
+            db.query(DispatcherShard).filter(
+                DispatcherShard.node_id == self.node_id,
+                DispatcherShard.shard_id < self.shard_count
+            ).update({'lease_expires_at': now_ms + self.lease_ttl_ms}, synchronize_session=False)
+            db.commit()
+            owned = sorted(row.shard_id for row in db.query(DispatcherShard.shard_id).filter(
+                DispatcherShard.node_id == self.node_id,
+                DispatcherShard.shard_id < self.shard_count
+            ).all())
+
+            # 持有过多：释放多余的分片，让新加入的进程接管
+            while len(owned) > target:
+                shard_id = owned.pop()
+                db.query(DispatcherShard).filter(
+                    DispatcherShard.shard_id == shard_id,
+                    DispatcherShard.node_id == self.node_id
+                ).update({'node_id': None, 'lease_expires_at': 0}, synchronize_session=False)
+                db.commit()
+                logger.info(f'释放分片: shard={shard_id}, node={self.node_id}')
+
+            # 持有不足：抢占空闲或租约已过期的分片（条件更新保证同一分片只有一个进程抢到）
+            if len(owned) < target:
+                candidates = db.query(DispatcherShard.shard_id).filter(
+                    DispatcherShard.shard_id < self.shard_count,
+                    (DispatcherShard.node_id.is_(None)) | (DispatcherShard.lease_expires_at < now_ms)
+                ).order_by(DispatcherShard.shard_id).limit(target - len(owned)).all()
+                for row in candidates:
+                    acquired = db.query(DispatcherShard).filter(
+                        DispatcherShard.shard_id == row.shard_id,
+                        (DispatcherShard.node_id.is_(None)) | (DispatcherShard.lease_expires_at < now_ms)
+                    ).update({
+                        'node_id': self.node_id,
+                        'lease_expires_at': now_ms + self.lease_ttl_ms
+                    }, synchronize_session=False)
+                    db.commit()
+                    if acquired:
+                        owned.append(row.shard_id)
+                        logger.info(f'获得分片: shard={row.shard_id}, node={self.node_id}')
+
+            with self._lock:
+                self._owned = frozenset(owned)
+            return self._owned
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def release_all(self):
+        """进程退出时释放全部分片并删除心跳记录，其他进程可立即接管"""
+        db = SessionLocal()
+        try:
+            db.query(DispatcherShard).filter(
+                DispatcherShard.node_id == self.node_id
+            ).update({'node_id': None, 'lease_expires_at': 0}, synchronize_session=False)
+            db.query(DispatcherNode).filter(DispatcherNode.node_id == self.node_id).delete(synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+        with self._lock:
+            self._owned = frozenset()
+
+
+def lease_loop(lease_manager, interval_seconds, stop_event):
+    """后台定期心跳、续约和重新均衡分片"""
+    while not stop_event.is_set():
+        try:
+            lease_manager.rebalance()
+        except Exception as e:
+            logger.error(f'分片租约续约异常: {str(e)}', exc_info=True)
+        stop_event.wait(interval_seconds)
+
+
+def fetch_due_reminders(batch_size, lookback_seconds, shard_filter=None):
+    """
+    查询已到期、可认领的创建者提醒（pending，或认领已过期的 sending；被分配者的副本随创建者一起发送）
+    只扫描最近 lookback_seconds 秒内到期的提醒，更早的由补发任务按策略处理
+
+    Returns:
+        list: [(id, reminder_time), ...]
+    """
+    now_ms = _now_ms()
+    db = SessionLocal()
+    try:
+        query = db.query(Reminder.id, Reminder.reminder_time).filter(
+            sendable_condition(now_ms),
+            Reminder.enable_subscribe == True,
+            Reminder.openid == Reminder.owner_openid,
+            Reminder.reminder_time <= now_ms,
+            Reminder.reminder_time >= now_ms - lookback_seconds * 1000
+        )
+        if shard_filter is not None:
+            query = query.filter(shard_filter())
+        return query.order_by(Reminder.reminder_time).limit(batch_size).all()
+    finally:
+        db.close()
+
+
+def dispatch_due_reminders(executor, batch_size, lookback_seconds, shard_filter=None):
+    """
+    发送一批到期提醒，send_reminder 内部会先认领提醒，多个进程同时运行也不会重复发送
+    发送异常且没有消息发出的提醒保持认领 SEND_RETRY_SECONDS 秒，期间的轮询不会重复取到它
+
+    Returns:
+        int: 本批提醒数量
+    """
+    # 微信接口熔断中：提醒保持 pending，等熔断恢复后再扫描
+    if wx_breakers['send'].is_open() or wx_breakers['token'].is_open():
+        return 0
+    rows = fetch_due_reminders(batch_size, lookback_seconds, shard_filter)
+    futures = [executor.submit(send_reminder, row.id, row.reminder_time) for row in rows]
+    for future in futures:
+        future.result()
+    return len(rows)
+
+
+def catch_up_loop(interval_seconds, stop_event, shard_filter=None):
+    """后台定期补发错过的提醒（补发任务自带限速，不阻塞到期提醒的轮询）"""
+    while not stop_event.is_set():
+        try:
+            catch_up_reminders(shard_filter=shard_filter)
+        except Exception as e:
+            logger.error(f'补发任务异常: {str(e)}', exc_info=True)
+        stop_event.wait(interval_seconds)
+
+
+def outbox_loop(poll_interval, concurrency, stop_event):
+    """后台投递发件箱中的通知（有积压时连续投递，否则按轮询间隔等待）"""
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='outbox') as executor:
+        while not stop_event.is_set():
+            try:
+                relayed = relay_outbox(executor=executor)
+            except Exception as e:
+                logger.error(f'投递发件箱消息异常: {str(e)}', exc_info=True)
+                relayed = 0
+            if relayed < OUTBOX_BATCH_SIZE:
+                stop_event.wait(poll_interval)
+
+
+def wx_event_loop(poll_interval, stop_event):
+    """后台批量处理微信推送消息（有积压时连续处理，否则按轮询间隔等待）"""
+    while not stop_event.is_set():
+        try:
+            processed = process_wx_events()
+        except Exception as e:
+            logger.error(f'处理微信推送消息异常: {str(e)}', exc_info=True)
+            processed = 0
+        if processed < WX_EVENT_BATCH_SIZE:
+            stop_event.wait(poll_interval)
+
+
+def run(args):
+    """运行发送进程主循环"""
+    bind_engine(create_db_engine(pool_size=args.pool_size, max_overflow=args.max_overflow))
+    ensure_tables_exist()
+
+    logger.info('=' * 60)
+    logger.info(f'提醒发送进程启动: 轮询间隔={args.poll_interval}秒, 批大小={args.batch_size}, '
+                f'并发={args.concurrency}, 连接池={args.pool_size}+{args.max_overflow}')
+    logger.info('=' * 60)
+
+    stop_event = threading.Event()
+
+    def handle_signal(signum, frame):
+        logger.info(f'收到信号 {signum}，发送进程退出')
+        stop_event.set()
+
+    signal.signal(signal.SIGTERM, handle_signal)
+    signal.signal(signal.SIGINT, handle_signal)
+
+    lease_manager = None
+    shard_filter = None
+    if args.shards > 1:
+        lease_manager = ShardLeaseManager(args.node_id, args.shards, args.lease_ttl)
+        lease_manager.ensure_shards()
+        lease_manager.rebalance()
+        shard_filter = lease_manager.shard_filter
+        logger.info(f'分片模式: node={args.node_id}, 分片数={args.shards}, 持有={sorted(lease_manager.owned)}')
+        threading.Thread(
+            target=lease_loop,
+            args=(lease_manager, args.lease_ttl / 3, stop_event),
+            name='shard-lease',
+            daemon=True
+        ).start()
+
+    threading.Thread(
+        target=catch_up_loop,
+        args=(args.catch_up_interval, stop_event, shard_filter),
+        name='catch-up',
+        daemon=True
+    ).start()
+
+    threading.Thread(
+        target=outbox_loop,
+        args=(args.poll_interval, args.outbox_concurrency, stop_event),
+        name='outbox',
+        daemon=True
+    ).start()
+
+    threading.Thread(
+        target=wx_event_loop,
+        args=(args.poll_interval, stop_event),
+        name='wx-events',
+        daemon=True
+    ).start()
+
+    with ThreadPoolExecutor(max_workers=args.concurrency, thread_name_prefix='dispatch') as executor:
+        try:
+            while not stop_event.is_set():
+                try:
+                    dispatched = dispatch_due_reminders(executor, args.batch_size, args.lookback, shard_filter)
+                except Exception as e:
+                    logger.error(f'发送到期提醒异常: {str(e)}', exc_info=True)
+                    dispatched = 0
+
+                if args.once and dispatched == 0:
+                    break
+                # 一批已满说明还有积压，立即继续；否则等待下一次轮询
+                if dispatched < args.batch_size:
+                    stop_event.wait(args.poll_interval)
+        finally:
+            stop_event.set()
+            if lease_manager is not None:
+                lease_manager.release_all()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='提醒发送进程')
+    parser.add_argument('--poll-interval', type=float, default=1.0, help='轮询到期提醒的间隔（秒）')
+    parser.add_argument('--batch-size', type=int, default=200, help='每次轮询最多发送的提醒数量')
+    parser.add_argument('--concurrency', type=int, default=8, help='并发发送线程数')
+    parser.add_argument('--lookback', type=int, default=300, help='轮询扫描最近多少秒内到期的提醒，更早的交给补发任务')
+    parser.add_argument('--outbox-concurrency', type=int, default=int(os.getenv('OUTBOX_CONCURRENCY', '4')),
+                        help='发件箱并发投递线程数')
+    parser.add_argument('--catch-up-interval', type=int, default=600, help='补发任务执行间隔（秒）')
+    parser.add_argument('--pool-size', type=int, default=10, help='数据库连接池大小（应不小于并发数）')
+    parser.add_argument('--max-overflow', type=int, default=5, help='数据库连接池溢出连接数')
+    parser.add_argument('--shards', type=int, default=int(os.getenv('DISPATCH_SHARDS', '1')),
+                        help='分片数量，大于 1 时多个发送进程通过租约分配分片')
+    parser.add_argument('--node-id', default=os.getenv('DISPATCH_NODE_ID', f'{socket.gethostname()}-{os.getpid()}'),
+                        help='发送进程ID（分片模式下必须唯一）')
+    parser.add_argument('--lease-ttl', type=float, default=30, help='分片租约有效期（秒），进程宕机后最多这么久被接管')
+    parser.add_argument('--once', action='store_true', help='发送完当前到期提醒后退出')
+    args = parser.parse_args()
+
+    run(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+"""
+提醒导出工具 - 直接从数据库流式导出提醒（NDJSON 或 CSV）
+
+与 GET /api/reminders/export 使用同一套导出逻辑：服务端游标逐批读取，
+内存占用与导出行数无关，可以导出整张表的历史数据。
+
+用法:
+    python export_reminders.py --openid 用户openid > reminders.ndjson
+    python export_reminders.py --format csv --output reminders.csv
+    python export_reminders.py --replica --output all.ndjson   # 配置了从库时从从库导出
+"""
+import argparse
+import logging
+import sys
+import time
+
+from app import EXPORT_BATCH_SIZE, EXPORT_FORMATS, iter_reminder_export, new_session, read_session
+
+
+def main():
+    parser = argparse.ArgumentParser(description='流式导出提醒')
+    parser.add_argument('--openid', help='只导出该用户拥有的提醒（默认导出全部）')
+    parser.add_argument('--format', choices=sorted(EXPORT_FORMATS), default='ndjson', help='导出格式')
+    parser.add_argument('--output', help='输出文件（默认标准输出）')
+    parser.add_argument('--batch-size', type=int, default=EXPORT_BATCH_SIZE, help='每批从数据库读取的行数')
+    parser.add_argument('--replica', action='store_true', help='配置了 DATABASE_REPLICA_URLS 时从从库读取')
+    args = parser.parse_args()
+
+    # 日志输出到标准错误，不混入导出内容
+    logging.getLogger('app').setLevel(logging.WARNING)
+
+    db = read_session() if args.replica else new_session()
+    output = open(args.output, 'wb') if args.output else sys.stdout.buffer
+    started = time.perf_counter()
+    written = 0
+    try:
+        for chunk in iter_reminder_export(db, args.openid, args.format, args.batch_size):
+            output.write(chunk)
+            written += len(chunk)
+    finally:
+        db.close()
+        if args.output:
+            output.close()
+        else:
+            output.flush()
+    elapsed = time.perf_counter() - started
+    print(f'导出完成: {written / 1024 / 1024:.1f} MiB, 耗时 {elapsed:.1f} 秒', file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,14 +1,22 @@
 # Gunicorn 配置文件
 import multiprocessing
+import os
 
 # 服务器socket
 bind = "127.0.0.1:5000"
 
 # 工作进程数
-workers = multiprocessing.cpu_count() * 2 + 1
-
-# 工作模式
-worker_class = "sync"
+# inline 模式下调度器在 Web 进程内，每个进程都会恢复全部定时任务、各自补发，只能使用一个进程（用线程处理并发请求）；
+# 需要多个进程时使用 DISPATCH_MODE=external，由 dispatcher.py 发送提醒
+if os.getenv('DISPATCH_MODE', 'inline') == 'external':
+    workers = multiprocessing.cpu_count() * 2 + 1
+    threads = 1
+else:
+    workers = 1
+    threads = 8
+
+# 工作模式（threads 大于 1 时使用 gthread）
+worker_class = "sync" if threads == 1 else "gthread"
 
 # 超时时间
 timeout = 120
@@ -0,0 +1,262 @@
+"""
+提醒导入工具 - 从 CSV / NDJSON 批量导入提醒（迁移其他提醒应用的数据、事故后恢复）
+
+每条记录按与 POST /api/reminder 相同的规则校验（build_reminder_row），
+校验通过的记录按批写入：每批一条多行 INSERT、一个事务，已存在的提醒ID直接跳过
+（没有 id 的记录按内容生成确定的ID），因此中断后可以对同一个文件重新执行。
+
+输入字段与创建提醒接口相同（openid, thing1, thing4, time, reminderTime, enableSubscribe），
+也可以直接导入 export_reminders.py 的导出文件：带 id 时保留原提醒ID，
+已发送/失败/过期的提醒保留原状态，不会重新发送；被分享的副本（openid 与 ownerOpenid 不同）不导入。
+已错过的待发送提醒按补发策略处理：超出补发窗口（CATCHUP_GRACE_SECONDS）或策略为 expire 的直接标记为 expired，
+其余保持 pending，由补发任务按策略发送。
+
+导入后需要重建发送状态：
+- DISPATCH_MODE=external：发送进程直接扫描数据库，无需处理
+- inline 模式：加 --reschedule http://127.0.0.1:5000，导入完成后让 Web 进程一次性重新登记定时任务
+
+用法:
+    python import_reminders.py reminders.ndjson
+    python import_reminders.py reminders.csv --openid 用户openid --batch-size 5000
+    python import_reminders.py backup.ndjson --reschedule http://127.0.0.1:5000
+    cat reminders.ndjson | python import_reminders.py - --format ndjson
+"""
+import argparse
+import csv
+import hashlib
+import io
+import json
+import logging
+import sys
+import time
+from datetime import datetime
+
+import requests
+from sqlalchemy import select
+
+try:
+    import orjson
+except ImportError:  # 未安装时使用标准库解析
+    orjson = None
+
+from app import (
+    CATCHUP_GRACE_SECONDS,
+    CATCHUP_POLICY,
+    Reminder,
+    build_reminder_row,
+    catchup_action_for,
+    dispatch_bucket_for,
+    ensure_tables_exist,
+    new_session,
+    parse_catchup_policy,
+    reset_reminder_summaries,
+    upsert_statement,
+)
+
+# 导入时保留的原状态（已经处理过的提醒不能重新发送）；其余状态按创建规则重新计算
+KEPT_STATUSES = ('sent', 'failed', 'expired')
+CSV_BOOLEAN_FIELDS = ('enableSubscribe', 'completed', 'shared', 'fromOwner')
+
+
+def read_records(stream, fmt):
+    """逐条读取记录，生成 (行号, 记录字典或 None, 错误信息)"""
+    if fmt == 'csv':
+        # utf-8-sig 去掉导出文件开头的 BOM
+        reader = csv.DictReader(io.TextIOWrapper(stream, encoding='utf-8-sig', newline=''))
+        for line_no, record in enumerate(reader, start=2):
+            for field in CSV_BOOLEAN_FIELDS:
+                if field in record:
+                    record[field] = record[field].strip().lower() in ('1', 'true', 'yes')
+            reminder_time = record.get('reminderTime')
+            if reminder_time:
+                try:
+                    record['reminderTime'] = int(reminder_time)
+                except ValueError:
+                    pass  # 交给 build_reminder_row 报错
+            yield line_no, record, None
+        return
+
+    loads = orjson.loads if orjson else json.loads
+    for line_no, line in enumerate(stream, start=1):
+        if not line.strip():
+            continue
+        try:
+            record = loads(line)
+        except ValueError as e:
+            yield line_no, None, f'JSON 格式错误: {e}'
+            continue
+        if not isinstance(record, dict):
+            yield line_no, None, '每行必须是一个 JSON 对象'
+            continue
+        yield line_no, record, None
+
+
+def import_reminder_id(openid, record):
+    """
+    没有 id 的记录按内容生成提醒ID：{openid}_{提醒时间戳}-{内容摘要}
+    同一份文件重复导入得到相同的ID（会被跳过），仍然可以按最后一个下划线取出 openid
+    """
+    digest = hashlib.sha1('\x1f'.join(
+        str(record.get(field, '')) for field in ('thing1', 'title', 'thing4', 'time')
+    ).encode('utf-8')).hexdigest()[:12]
+    return f"{openid}_{record.get('reminderTime')}-{digest}"
+
+
+def build_import_row(record, default_openid):
+    """
+    生成一条待插入的行，返回 (行字典, 错误信息)；被分享的副本返回 (None, None)
+    """
+    openid = record.get('openid') or default_openid
+    if not openid:
+        return None, '缺少必要字段: openid'
+    owner_openid = record.get('ownerOpenid') or openid
+    if owner_openid != openid or record.get('sourceReminderId'):
+        return None, None
+
+    row, error = build_reminder_row(record, openid, record.get('id') or import_reminder_id(openid, record))
+    if error:
+        return None, error
+    if record.get('status') in KEPT_STATUSES:
+        row['status'] = record['status']
+    row['completed'] = bool(record.get('completed', False))
+    row['dispatch_bucket'] = dispatch_bucket_for(openid)
+    create_time = record.get('createTime')
+    try:
+        row['create_time'] = datetime.fromisoformat(create_time) if create_time else datetime.now()
+    except (TypeError, ValueError):
+        return None, f'createTime 格式错误: {create_time}'
+    return row, None
+
+
+def expire_missed_reminder(row, now_ms, rules):
+    """
+    已错过的待发送提醒按补发策略处理：补发任务只扫描 CATCHUP_GRACE_SECONDS 内到期的提醒，
+    更早的永远不会被处理，与策略为 expire 的一样直接标记为 expired
+
+    Returns:
+        bool: 是否标记为 expired
+    """
+    if row['status'] != 'pending' or row['reminder_time'] > now_ms:
+        return False
+    age_seconds = (now_ms - row['reminder_time']) / 1000
+    if age_seconds > CATCHUP_GRACE_SECONDS or catchup_action_for(age_seconds, rules) == 'expire':
+        row['status'] = 'expired'
+        return True
+    return False
+
+
+def import_reminders(stream, fmt, default_openid=None, batch_size=5000, errors=sys.stderr, progress=None):
+    """
+    导入提醒，返回统计信息
+
+    Args:
+        stream: 二进制输入流
+        fmt: csv 或 ndjson
+        default_openid: 记录中没有 openid 时使用
+        batch_size: 每条 INSERT（每个事务）写入的行数
+        progress: 每提交一批后调用 progress(stats)
+    """
+    stats = {'read': 0, 'loaded': 0, 'existing': 0, 'invalid': 0, 'copies_skipped': 0, 'pending': 0, 'missed': 0}
+    rules = parse_catchup_policy(CATCHUP_POLICY)
+    now_ms = int(datetime.now().timestamp() * 1000)
+    db = new_session()
+    statement = upsert_statement(db, Reminder.__table__, None, ['id'])
+    rows = []
+    missed_ids = set()  # 本批中因已错过而标记为 expired 的提醒ID
+
+    def flush():
+        # 先按主键查出本批中已存在的提醒ID（一条 IN 查询），只写入新提醒，统计实际写入的行数
+        # （MySQL 的 ON DUPLICATE KEY UPDATE 影响行数会把已存在的行也算进去，不能用 rowcount）
+        existing = set(db.execute(
+            select(Reminder.id).where(Reminder.id.in_([row['id'] for row in rows]))
+        ).scalars())
+        new_rows = {}
+        for row in rows:
+            if row['id'] not in existing:
+                new_rows.setdefault(row['id'], row)  # 同一批内重复的ID只写第一条
+        new_rows = list(new_rows.values())
+        if new_rows:
+            # 并发写入同一ID时仍由 upsert 跳过，不会报错
+            db.execute(statement, new_rows)
+            # 不逐条计算增量，汇总在下次读取时重建
+            reset_reminder_summaries(db, [row['openid'] for row in new_rows])
+        db.commit()
+        stats['loaded'] += len(new_rows)
+        stats['existing'] += len(rows) - len(new_rows)
+        stats['pending'] += sum(1 for row in new_rows if row['status'] == 'pending')
+        stats['missed'] += sum(1 for row in new_rows if row['id'] in missed_ids)
+        rows.clear()
+        missed_ids.clear()
+        if progress:
+            progress(stats)
+
+    try:
+        for line_no, record, error in read_records(stream, fmt):
+            stats['read'] += 1
+            row = None
+            if record is not None:
+                row, error = build_import_row(record, default_openid)
+            if error:
+                stats['invalid'] += 1
+                print(f'第 {line_no} 行: {error}', file=errors)
+                continue
+            if row is None:
+                stats['copies_skipped'] += 1
+                continue
+            if expire_missed_reminder(row, now_ms, rules):
+                missed_ids.add(row['id'])
+            rows.append(row)
+            if len(rows) >= batch_size:
+                flush()
+        if rows:
+            flush()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description='批量导入提醒')
+    parser.add_argument('input', help='输入文件（- 表示标准输入）')
+    parser.add_argument('--format', choices=['ndjson', 'csv'], help='输入格式（默认按文件扩展名判断）')
+    parser.add_argument('--openid', help='记录中没有 openid 时使用的用户 openid')
+    parser.add_argument('--batch-size', type=int, default=5000, help='每条 INSERT（每个事务）写入的行数')
+    parser.add_argument('--reschedule', metavar='BASE_URL',
+                        help='导入完成后请求 Web 进程重新登记定时任务（inline 模式），如 http://127.0.0.1:5000')
+    args = parser.parse_args()
+
+    fmt = args.format or ('csv' if args.input.lower().endswith('.csv') else 'ndjson')
+    # 日志只保留警告，进度和结果输出到标准错误
+    logging.getLogger('app').setLevel(logging.WARNING)
+    ensure_tables_exist()
+
+    started = time.perf_counter()
+
+    def progress(stats):
+        elapsed = time.perf_counter() - started
+        print(f"已写入 {stats['loaded']} 条, 已存在跳过 {stats['existing']} 条 "
+              f"({stats['loaded'] / elapsed:,.0f} 条/秒)", file=sys.stderr)
+
+    stream = sys.stdin.buffer if args.input == '-' else open(args.input, 'rb')
+    try:
+        stats = import_reminders(stream, fmt, args.openid, args.batch_size, progress=progress)
+    finally:
+        if stream is not sys.stdin.buffer:
+            stream.close()
+    elapsed = time.perf_counter() - started
+    print(f"导入完成: 读取 {stats['read']} 条, 写入 {stats['loaded']} 条, 已存在跳过 {stats['existing']} 条, "
+          f"校验失败 {stats['invalid']} 条, 跳过副本 {stats['copies_skipped']} 条, 待发送 {stats['pending']} 条, "
+          f"已错过标记过期 {stats['missed']} 条, "
+          f"耗时 {elapsed:.1f} 秒 ({stats['loaded'] / max(elapsed, 1e-9):,.0f} 条/秒)", file=sys.stderr)
+
+    if args.reschedule:
+        response = requests.post(f"{args.reschedule.rstrip('/')}/api/debug/reschedule", timeout=600)
+        print(f'重新登记定时任务: {response.json()}', file=sys.stderr)
+    return 1 if stats['invalid'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
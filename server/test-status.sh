@@ -10,13 +10,13 @@ curl -s http://127.0.0.1:5000/api/health | python3 -m json.tool 2>/dev/null || c
 echo ""
 echo ""
 
-echo "2. 提醒记录列表..."
-REMINDERS=$(curl -s http://127.0.0.1:5000/api/debug/reminders)
+echo "2. 最近的提醒记录..."
+REMINDERS=$(curl -s "http://127.0.0.1:5000/api/debug/reminders?limit=20")
 echo "$REMINDERS" | python3 -m json.tool 2>/dev/null || echo "$REMINDERS"
 echo ""
 
 # 提取提醒ID（如果有）
-REMINDER_IDS=$(echo "$REMINDERS" | python3 -c "import sys, json; data=json.load(sys.stdin); [print(r['id']) for r in data.get('data', [])]" 2>/dev/null)
+REMINDER_IDS=$(echo "$REMINDERS" | python3 -c "import sys, json; data=json.load(sys.stdin); [print(r['id']) for r in data.get('data', {}).get('reminders', [])]" 2>/dev/null)
 
 echo "3. 定时任务列表..."
 JOBS=$(curl -s http://127.0.0.1:5000/api/debug/jobs)
@@ -0,0 +1,78 @@
+"""
+微信接口模拟服务（用于本地压测）
+模拟 stable_token、token、subscribe/send、jscode2session 接口，可配置响应延迟和失败率
+
+用法:
+    python wx_stub.py [--port 5002] [--latency-ms 50] [--error-rate 0]
+    WX_API_BASE=http://127.0.0.1:5002 python app.py
+"""
+import argparse
+import random
+import threading
+import time
+
+from flask import Flask, jsonify, request
+
+app = Flask(__name__)
+
+config = {
+    'latency_ms': 50,
+    'error_rate': 0.0,
+}
+
+# 统计收到的请求数量
+stats = {'token': 0, 'send': 0, 'login': 0}
+stats_lock = threading.Lock()
+
+
+def _simulate(kind):
+    """模拟网络延迟并计数"""
+    with stats_lock:
+        stats[kind] += 1
+    if config['latency_ms'] > 0:
+        time.sleep(config['latency_ms'] / 1000)
+    return random.random() < config['error_rate']
+
+
+@app.route('/cgi-bin/stable_token', methods=['POST'])
+@app.route('/cgi-bin/token', methods=['GET'])
+def token():
+    _simulate('token')
+    return jsonify({'access_token': 'stub_access_token', 'expires_in': 7200})
+
+
+@app.route('/cgi-bin/message/subscribe/send', methods=['POST'])
+def subscribe_send():
+    if _simulate('send'):
+        return jsonify({'errcode': -1, 'errmsg': 'system error'})
+    return jsonify({'errcode': 0, 'errmsg': 'ok', 'msgid': random.randint(1, 2 ** 40)})
+
+
+@app.route('/sns/jscode2session', methods=['GET'])
+def jscode2session():
+    if _simulate('login'):
+        return jsonify({'errcode': -1, 'errmsg': 'system error'})
+    code = request.args.get('js_code', '')
+    return jsonify({'openid': f'stub_{code}', 'session_key': 'stub_session_key'})
+
+
+@app.route('/stub/stats', methods=['GET'])
+def get_stats():
+    with stats_lock:
+        return jsonify(dict(stats))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='微信接口模拟服务')
+    parser.add_argument('--port', type=int, default=5002)
+    parser.add_argument('--latency-ms', type=int, default=50, help='每个请求的模拟延迟（毫秒）')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='模拟失败的比例（0-1）')
+    args = parser.parse_args()
+
+    config['latency_ms'] = args.latency_ms
+    config['error_rate'] = args.error_rate
+    app.run(host='127.0.0.1', port=args.port, threaded=True)
+
+
+if __name__ == '__main__':
+    main()